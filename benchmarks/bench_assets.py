@@ -0,0 +1,243 @@
+"""Installing and updating asset packs from a local HTTP server.
+
+Serves generated fixture packs (tar.gz of many small files) with Range
+and ETag support, and can drop connections partway. Compares
+AssetPackInstaller with downloading the archive to memory and
+extracting it all, then checks an update where few files changed, an
+interrupted download, an up to date pack and a corrupt archive. Run from
+the repository root:
+    python benchmarks/bench_assets.py [files per pack]
+"""
+import hashlib
+import io
+import os
+import random
+import shutil
+import sys
+import tarfile
+import tempfile
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import orjson
+import requests
+from loguru import logger
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from src.Helpers.TSHAssetPackHelper import AssetPackInstaller  # noqa: E402
+
+
+class Server(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self):
+        super().__init__(("127.0.0.1", 0), Handler)
+        self.files = {}
+        # path -> bytes after which the next response is cut
+        self.dropAt = {}
+        self.requests = []
+
+    def Url(self, path=""):
+        return f"http://127.0.0.1:{self.server_address[1]}/{path}"
+
+
+class Handler(BaseHTTPRequestHandler):
+    def log_message(self, *args):
+        pass
+
+    def do_GET(self):
+        path = self.path.lstrip("/")
+        data = self.server.files.get(path)
+        self.server.requests.append((path, self.headers.get("Range")))
+        if data is None:
+            self.send_error(404)
+            return
+        etag = '"' + hashlib.sha256(data).hexdigest()[:16] + '"'
+        start = 0
+        status = 200
+        rangeHeader = self.headers.get("Range")
+        if rangeHeader and self.headers.get("If-Range", etag) == etag:
+            start = int(rangeHeader.removeprefix("bytes=").split("-")[0])
+            if start >= len(data):
+                self.send_error(416)
+                return
+            status = 206
+
+        self.send_response(status)
+        self.send_header("ETag", etag)
+        self.send_header("Content-Length", str(len(data) - start))
+        if status == 206:
+            self.send_header("Content-Range", f"bytes {start}-{len(data) - 1}/{len(data)}")
+        self.end_headers()
+
+        end = len(data)
+        dropAt = self.server.dropAt.pop(path, None)
+        if dropAt is not None:
+            end = min(end, start + dropAt)
+        try:
+            self.wfile.write(data[start:end])
+        except ConnectionError:
+            pass
+        if end < len(data):
+            self.close_connection = True
+
+
+def Pack(files):
+    buffer = io.BytesIO()
+    with tarfile.open(fileobj=buffer, mode="w:gz", compresslevel=1) as archive:
+        for path, content in files.items():
+            info = tarfile.TarInfo(path)
+            info.size = len(content)
+            archive.addfile(info, io.BytesIO(content))
+    return buffer.getvalue()
+
+
+def Publish(server, name, files, version):
+    data = Pack(files)
+    server.files[f"packs/{name}-{version}.tar.gz"] = data
+    return {"url": f"packs/{name}-{version}.tar.gz", "version": version,
+            "sha256": hashlib.sha256(data).hexdigest(), "size": len(data),
+            "files": {p: hashlib.sha256(c).hexdigest() for p, c in files.items()}}
+
+
+def Files(count, seed):
+    rng = random.Random(seed)
+    return {f"images/{i // 100}/{i}.png": rng.randbytes(rng.randint(2000, 16000))
+            for i in range(count)}
+
+
+def Naive(url, target):
+    # Whole archive in memory, then everything extracted
+    data = requests.get(url).content
+    with tarfile.open(fileobj=io.BytesIO(data), mode="r:gz") as archive:
+        archive.extractall(target)
+
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 3000
+    logger.remove()
+    server = Server()
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+
+    packs = {name: Files(count, seed) for seed, name in enumerate(("characters", "stages", "icons"))}
+    index = {name: Publish(server, name, files, "1") for name, files in packs.items()}
+    server.files["index.json"] = orjson.dumps(index)
+    total = sum(entry["size"] for entry in index.values())
+    print(f"3 packs of {count} files, {total / 1048576:.1f} MB compressed")
+
+    with tempfile.TemporaryDirectory() as directory:
+        start = time.perf_counter()
+        for name, entry in index.items():
+            Naive(server.Url(entry["url"]), os.path.join(directory, "naive", name))
+        print(f"naive, in memory then extractall:  {time.perf_counter() - start:6.2f} s")
+
+        root = os.path.join(directory, "packs")
+        installer = AssetPackInstaller(server.Url("index.json"), root=root, retryDelay=0.05)
+        start = time.perf_counter()
+        results = installer.Install()
+        print(f"AssetPackInstaller, fresh install: {time.perf_counter() - start:6.2f} s  "
+              f"({sum(r['written'] for r in results.values())} files written)")
+        assert all(r["status"] == "updated" for r in results.values()), results
+
+        # A new version with 2% of the files changed, 1% removed and 1% added
+        files = dict(packs["characters"])
+        rng = random.Random(99)
+        for path in rng.sample(sorted(files), count // 50):
+            files[path] = rng.randbytes(4000)
+        for path in rng.sample(sorted(files), count // 100):
+            del files[path]
+        for i in range(count // 100):
+            files[f"images/new/{i}.png"] = rng.randbytes(4000)
+        index["characters"] = Publish(server, "characters", files, "2")
+        server.files["index.json"] = orjson.dumps(index)
+
+        updates = installer.Updates()
+        start = time.perf_counter()
+        result = installer.Install(["characters"])["characters"]
+        print(f"update, {updates['characters']['files']} of {len(files)} files changed:   "
+              f"{time.perf_counter() - start:6.2f} s  ({result['written']} written, "
+              f"{result['unchanged']} unchanged, {result['removed']} removed)")
+        installedFiles = installer.Installed("characters")["files"]
+        assert installedFiles == index["characters"]["files"]
+        for path, content in list(files.items())[:50]:
+            with open(os.path.join(root, "characters", path), 'rb') as file:
+                assert file.read() == content
+
+        # Connection dropped halfway through, twice
+        files = Files(count, 42)
+        index["stages"] = Publish(server, "stages", files, "2")
+        server.files["index.json"] = orjson.dumps(index)
+        url = index["stages"]["url"]
+        size = index["stages"]["size"]
+        server.requests.clear()
+        server.dropAt[url] = size // 2
+        start = time.perf_counter()
+        result = installer.Install(["stages"])["stages"]
+        ranges = [r for p, r in server.requests if p == url]
+        print(f"dropped at 50%, resumed:           {time.perf_counter() - start:6.2f} s  "
+              f"(requests {ranges}, {result['bytes'] / 1048576:.1f} MB read)")
+        assert result["status"] == "updated" and ranges[1] == f"bytes={size // 2}-", (result, ranges)
+
+        # Failed for good partway, then resumed from the part file later
+        files = Files(count, 43)
+        index["icons"] = Publish(server, "icons", files, "2")
+        server.files["index.json"] = orjson.dumps(index)
+        url = index["icons"]["url"]
+        size = index["icons"]["size"]
+        stubborn = AssetPackInstaller(server.Url("index.json"), root=root, retries=0)
+        server.dropAt[url] = size // 3
+        failed = stubborn.Install(["icons"])["icons"]
+        assert failed["status"] == "error"
+        assert installer.Installed("icons")["version"] == "1"
+        server.requests.clear()
+        result = installer.Install(["icons"])["icons"]
+        print(f"next run after a failure:          resumed from {result['resumedFrom']} of {size} bytes, "
+              f"requests {[r for p, r in server.requests if p == url]}")
+        assert result["status"] == "updated" and result["resumedFrom"] == size // 3
+
+        # Same, without a checksum in the index, and the archive replaced
+        # by another version before the next run: If-Range on the ETag kept
+        # with the part file gets the whole new archive
+        files = Files(count, 44)
+        entry = {k: v for k, v in Publish(server, "icons", files, "3").items() if k != "sha256"}
+        url = entry["url"] = "packs/icons-latest.tar.gz"
+        server.files[url] = server.files.pop("packs/icons-3.tar.gz")
+        server.dropAt[url] = len(server.files[url]) // 3
+        assert stubborn.Install(["icons"], index={"icons": entry})["icons"]["status"] == "error"
+        files = Files(count, 45)
+        replaced = Publish(server, "icons", files, "4")
+        server.files[url] = server.files.pop(replaced["url"])
+        entry.update(files=replaced["files"], version="4")
+        server.requests.clear()
+        result = installer.Install(["icons"], index={"icons": entry})["icons"]
+        print(f"changed before the next run:       {result['status']}, "
+              f"requests {[r for p, r in server.requests if p == url]}")
+        assert result["status"] == "updated", result
+        assert installer.Installed("icons")["files"] == replaced["files"]
+        with open(os.path.join(root, "icons", next(iter(files))), 'rb') as file:
+            assert file.read() == next(iter(files.values()))
+        index["icons"] = entry
+        server.files["index.json"] = orjson.dumps(index)
+
+        start = time.perf_counter()
+        result = installer.Install()
+        print(f"everything up to date:             {time.perf_counter() - start:6.3f} s  "
+              f"({', '.join(r['status'] for r in result.values())})")
+
+        # Archive corrupted on the server: nothing installed changes
+        good = dict(index["stages"])
+        server.files[good["url"]] = server.files[good["url"]][:-100] + bytes(100)
+        index["stages"] = dict(good, version="3", sha256=hashlib.sha256(
+            server.files[good["url"]]).hexdigest()[::-1])
+        result = installer.Install(["stages"], index=index)["stages"]
+        print(f"corrupt archive:                   {result['status']}: {result['error']}")
+        assert installer.Installed("stages")["version"] == "2"
+        assert not os.path.exists(os.path.join(root, ".staging", "stages"))
+
+    server.shutdown()
+
+
+if __name__ == '__main__':
+    main()
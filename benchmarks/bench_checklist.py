@@ -0,0 +1,97 @@
+"""Checklist and editor widgets with a 10k step recipe: model reset,
+toggling steps (Set -> save -> dataChanged -> repaint), scrolling, and how
+many widgets exist. Runs offscreen. From the repository root:
+    python benchmarks/bench_checklist.py [steps]
+"""
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.chdir(tempfile.mkdtemp())
+os.environ.setdefault("QT_QPA_PLATFORM", "offscreen")
+os.environ["QT_API"] = "pyside6"
+
+from loguru import logger  # noqa: E402
+from qtpy.QtCore import Qt, QCoreApplication  # noqa: E402
+from qtpy.QtWidgets import QApplication, QWidget  # noqa: E402
+from src.StateManager import StateManager  # noqa: E402
+from src.CheckboxWidget import RecipeChecklistWidget  # noqa: E402
+from src.DataAddWidget import RecipeEditorWidget  # noqa: E402
+
+logger.remove()
+
+
+def wait_for(condition, timeout=5):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        QCoreApplication.processEvents()
+        if time.monotonic() > deadline:
+            raise TimeoutError()
+
+
+def frames(view, count, step):
+    """Scrolls by `step` pixels and repaints, `count` times."""
+    bar = view.verticalScrollBar()
+    times = []
+    for i in range(count):
+        start = time.perf_counter()
+        bar.setValue((bar.value() + step) % max(bar.maximum(), 1))
+        view.viewport().repaint()
+        times.append(time.perf_counter() - start)
+    times.sort()
+    return times[len(times) // 2], times[int(len(times) * 0.99)]
+
+
+if __name__ == "__main__":
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 10000
+    app = QApplication(sys.argv)
+    StateManager.exportText = False
+
+    steps = {str(i): {"text": f"Step {i}: stir for {i % 7 + 1} minutes", "done": False}
+             for i in range(count)}
+    with StateManager.transaction():
+        StateManager.Set("recipes.big", {"name": "Big", "steps": steps})
+        StateManager.Set("current", {"recipe": "big", "step": 0})
+    StateManager.Flush()
+
+    widgets = len(QApplication.allWidgets())
+    start = time.perf_counter()
+    checklist = RecipeChecklistWidget()
+    checklist.resize(400, 600)
+    checklist.show()
+    editor = RecipeEditorWidget("big")
+    editor.resize(400, 600)
+    editor.show()
+    QCoreApplication.processEvents()
+    print(f"open both widgets:     {(time.perf_counter() - start) * 1e3:8.1f} ms")
+
+    model = checklist.model()
+    toggles = []
+    for i in range(200):
+        row = (i * 37) % count
+        index = model.index(row)
+        start = time.perf_counter()
+        model.setData(index, Qt.CheckState.Checked if i % 2 == 0 else Qt.CheckState.Unchecked,
+                      Qt.ItemDataRole.CheckStateRole)
+        expected = Qt.CheckState.Checked if i % 2 == 0 else Qt.CheckState.Unchecked
+        wait_for(lambda: model.data(index, Qt.ItemDataRole.CheckStateRole) == expected)
+        checklist.viewport().repaint()
+        toggles.append(time.perf_counter() - start)
+    toggles.sort()
+    print(f"toggle round trip:     p50 {toggles[100] * 1e3:6.2f} ms  p99 {toggles[198] * 1e3:6.2f} ms")
+
+    p50, p99 = frames(checklist, 300, 97)
+    print(f"scroll frame:          p50 {p50 * 1e3:6.2f} ms  p99 {p99 * 1e3:6.2f} ms")
+
+    start = time.perf_counter()
+    with StateManager.transaction():
+        for i in range(0, count, 2):
+            StateManager.Set(f"recipes.big.steps.{i}.done", True)
+    wait_for(lambda: model.data(model.index(count - 2), Qt.ItemDataRole.CheckStateRole) == Qt.CheckState.Checked)
+    checklist.viewport().repaint()
+    print(f"check {count // 2} steps at once: {(time.perf_counter() - start) * 1e3:6.1f} ms")
+
+    print(f"widgets created:       {len(QApplication.allWidgets()) - widgets}")
+    StateManager.Flush()
@@ -0,0 +1,83 @@
+"""Compiled key paths against the original string-splitting helpers.
+
+Run from the repository root:
+    python benchmarks/bench_dict_helper.py
+"""
+import os
+import sys
+import time
+from functools import reduce
+
+sys.path.insert(0, os.path.join(
+    os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "src", "Helpers"))
+
+from TSHDictHelper import compile_path, deep_get, deep_set, deep_set_many, deep_unset  # noqa: E402
+
+
+def old_deep_get(dictionary, keys, default=None):
+    return reduce(lambda d, key: d.get(key, default) if isinstance(d, dict) else default, keys.split("."), dictionary)
+
+
+def old_deep_set(dictionary, keys, value):
+    d = dictionary
+    for key in keys.split(".")[:-1]:
+        if key not in d:
+            d[key] = {}
+        d = d[key]
+    d[keys.split(".")[-1]] = value
+
+
+def old_deep_unset(dictionary, keys):
+    d = dictionary
+    for key in keys.split(".")[:-1]:
+        if key not in d:
+            d[key] = {}
+        d = d[key]
+    if keys.split(".")[-1] in d:
+        del d[keys.split(".")[-1]]
+
+
+def timed(fn, keys):
+    state = {}
+    start = time.perf_counter()
+    fn(state, keys)
+    return (time.perf_counter() - start) / len(keys) * 1e9
+
+
+def run_ops(get, set, unset):
+    def ops(state, keys):
+        for k in keys:
+            set(state, k, 1)
+        for k in keys:
+            get(state, k)
+        for k in keys:
+            unset(state, k)
+    return ops
+
+
+def run_batch(state, keys):
+    deep_set_many(state, ((k, 1) for k in keys))
+
+
+def run_loop_set(state, keys):
+    for k in keys:
+        deep_set(state, k, 1)
+
+
+if __name__ == "__main__":
+    hot = [f"recipes.{i % 20}.steps.{i % 10}.done" for i in range(200000)]
+    cold = [f"recipes.{i}.steps.{i % 10}.done" for i in range(200000)]
+
+    old = run_ops(old_deep_get, old_deep_set, old_deep_unset)
+    new = run_ops(deep_get, deep_set, deep_unset)
+
+    print(f"{'case':>24} {'ns/op':>8}")
+    for name, keys in (("hot", hot), ("cold", cold)):
+        compile_path.cache_clear()
+        print(f"{name + ' original':>24} {timed(old, keys) / 3:>8.0f}")
+        print(f"{name + ' compiled':>24} {timed(new, keys) / 3:>8.0f}")
+
+    batch = sorted(hot)
+    compile_path.cache_clear()
+    print(f"{'set loop (siblings)':>24} {timed(run_loop_set, batch):>8.0f}")
+    print(f"{'set batch (siblings)':>24} {timed(run_batch, batch):>8.0f}")
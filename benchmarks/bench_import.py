@@ -0,0 +1,91 @@
+"""Bulk import of 50k recipes from each supported file format.
+
+Every import runs in a fresh interpreter, so the peak RSS it reports is
+that import's alone. Run from the repository root:
+    python benchmarks/bench_import.py [recipes]
+"""
+import csv
+import os
+import subprocess
+import sys
+import tempfile
+import msgpack
+import orjson
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+IMPORT = """
+import resource
+import sys
+import time
+from loguru import logger
+from src.RecipeImporter import RecipeImporter
+from src.StateManager import StateManager
+
+logger.remove()
+StateManager.exportText = False
+start = time.perf_counter()
+imported, errors = RecipeImporter().Import(sys.argv[1])
+StateManager.Flush()
+elapsed = time.perf_counter() - start
+assert imported == int(sys.argv[2]) and len(errors) == 0, (imported, errors[:3])
+print(elapsed, resource.getrusage(resource.RUSAGE_SELF).ru_maxrss)
+"""
+
+
+def recipe(i):
+    return {
+        "id": f"r{i}",
+        "name": f"Recipe {i}",
+        "tags": ["dinner", f"tag{i % 40}"],
+        "ingredients": [f"ingredient {i % 300}", "salt", "pepper"],
+        "steps": [f"Step {s} of recipe {i}" for s in range(8)],
+    }
+
+
+def write_files(folder, count):
+    files = {}
+
+    files["jsonl"] = os.path.join(folder, "recipes.jsonl")
+    with open(files["jsonl"], 'wb') as file:
+        for i in range(count):
+            file.write(orjson.dumps(recipe(i)) + b"\n")
+
+    files["json"] = os.path.join(folder, "recipes.json")
+    with open(files["json"], 'wb') as file:
+        file.write(orjson.dumps([recipe(i) for i in range(count)]))
+
+    files["msgpack"] = os.path.join(folder, "recipes.msgpack")
+    with open(files["msgpack"], 'wb') as file:
+        for i in range(count):
+            file.write(msgpack.packb(recipe(i)))
+
+    files["csv"] = os.path.join(folder, "recipes.csv")
+    with open(files["csv"], 'w', newline="", encoding="utf-8") as file:
+        writer = csv.writer(file)
+        writer.writerow(["id", "name", "tags", "ingredients", "steps"])
+        for i in range(count):
+            r = recipe(i)
+            writer.writerow([r["id"], r["name"], "|".join(r["tags"]),
+                             "|".join(r["ingredients"]), "|".join(r["steps"])])
+
+    return files
+
+
+if __name__ == "__main__":
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 50000
+    folder = tempfile.mkdtemp()
+    files = write_files(folder, count)
+
+    print(f"{'format':>8} {'MB':>6} {'seconds':>8} {'recipes/s':>10} {'peak RSS (MB)':>14}")
+    for name, path in files.items():
+        result = subprocess.run(
+            [sys.executable, "-c", IMPORT, path, str(count)],
+            cwd=tempfile.mkdtemp(), env=dict(os.environ, PYTHONPATH=ROOT),
+            capture_output=True, text=True)
+        if result.returncode != 0:
+            print(f"{name:>8} failed: {result.stderr.strip().splitlines()[-1]}")
+            continue
+        elapsed, rss = result.stdout.split()
+        print(f"{name:>8} {os.path.getsize(path) / 1e6:6.1f} {float(elapsed):8.2f} "
+              f"{count / float(elapsed):10.0f} {int(rss) / 1024:14.1f}")
@@ -0,0 +1,110 @@
+"""Cost of logging for the caller.
+
+Times every logger.info call with the file sinks written on the calling
+thread (as bootstrap() used to set them up), with loguru's enqueue=True
+and through LogQueue (as it does now), and feeds LoggerWriter growing bursts
+to show it stays linear. Run from the repository root:
+    python benchmarks/bench_logging.py [calls]
+"""
+import copy
+import os
+import statistics
+import sys
+import tempfile
+import time
+from loguru import logger
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from src.Bootstrap import LoggerWriter, LogQueue, fileFmt  # noqa: E402
+
+
+class OldLoggerWriter(object):
+    def __init__(self, writer):
+        self._writer = writer
+        self._msg = ''
+
+    def write(self, message):
+        self._msg = self._msg + message
+        while '\n' in self._msg:
+            pos = self._msg.find('\n')
+            self._writer(self._msg[:pos])
+            self._msg = self._msg[pos+1:]
+
+    def flush(self):
+        if self._msg != '':
+            self._writer(self._msg)
+            self._msg = ''
+
+
+def Percentile(samples, q):
+    return sorted(samples)[min(len(samples) - 1, int(q * len(samples)))]
+
+
+def TimeCalls(directory, calls, mode):
+    logger.remove()
+    queue = LogQueue(copy.deepcopy(logger)) if mode == "LogQueue" else None
+    for name, level in (("tsh", "INFO"), ("tsh-error", "ERROR")):
+        path = os.path.join(directory, f"{name}.log")
+        # Small files so some get rotated and zipped
+        options = {"encoding": "utf-8", "rotation": "1 MB", "compression": "zip"}
+        if queue is not None:
+            queue.AddFile(path, level, **options)
+        else:
+            logger.add(path, format=fileFmt, level=level,
+                       enqueue=mode == "enqueue", **options)
+    if queue is not None:
+        logger.add(queue.Write, format=fileFmt, level="INFO")
+
+    samples = []
+    start = time.perf_counter()
+    for i in range(calls):
+        before = time.perf_counter()
+        logger.info(f"Recipe r{i} step {i % 40} done")
+        samples.append(time.perf_counter() - before)
+    calling = time.perf_counter() - start
+    if queue is not None:
+        queue.Close()
+    logger.complete()
+    logger.remove()
+    return samples, calling, time.perf_counter() - start
+
+
+def TimeWriter(writer, chunks):
+    lines = []
+    stream = writer(lines.append)
+    start = time.perf_counter()
+    for chunk in chunks:
+        stream.write(chunk)
+    stream.flush()
+    return time.perf_counter() - start, len(lines)
+
+
+def main():
+    calls = int(sys.argv[1]) if len(sys.argv) > 1 else 20000
+
+    with tempfile.TemporaryDirectory() as directory:
+        for mode in ("synchronous", "enqueue", "LogQueue"):
+            samples, calling, total = TimeCalls(
+                os.path.join(directory, mode), calls, mode)
+            print(f"{mode:12} per call: p50 {statistics.median(samples) * 1e6:6.1f} us  "
+                  f"p99 {Percentile(samples, 0.99) * 1e6:7.1f} us  "
+                  f"max {max(samples) * 1e3:6.2f} ms  "
+                  f"caller busy {calling * 1e3:6.0f} ms, all written {total * 1e3:6.0f} ms")
+
+    # A traceback-sized burst: many lines in one write, and a long line
+    # arriving in small pieces
+    for lines in (2000, 8000, 32000):
+        burst = "".join(f"  File \"module{i}.py\", line {i}, in function\n" for i in range(lines))
+        pieces = ["x" * 16] * lines + ["\n"]
+        for label, writer in (("old", OldLoggerWriter), ("new", LoggerWriter)):
+            one, count = TimeWriter(writer, [burst])
+            many, _ = TimeWriter(writer, pieces)
+            print(f"LoggerWriter {label} {lines:6} lines in one write {one * 1e3:8.2f} ms, "
+                  f"{lines:6} pieces of one line {many * 1e3:8.2f} ms")
+            assert count == lines
+
+
+if __name__ == '__main__':
+    main()
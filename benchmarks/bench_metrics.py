@@ -0,0 +1,44 @@
+"""Cost of the metrics instrumentation on StateManager.Set, disabled and
+enabled, and a sample of what /metrics returns. Run from the repository
+root:
+    python benchmarks/bench_metrics.py [sets]
+"""
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.chdir(tempfile.mkdtemp())
+
+from loguru import logger  # noqa: E402
+from src.Metrics import Metrics  # noqa: E402
+from src.StateManager import StateManager  # noqa: E402
+
+logger.remove()
+
+
+def run(count):
+    start = time.perf_counter()
+    for i in range(count):
+        StateManager.Set(f"recipes.bench.steps.{i % 50}.done", i // 50 % 2 == 0)
+    elapsed = time.perf_counter() - start
+    StateManager.Flush()
+    return elapsed / count
+
+
+if __name__ == "__main__":
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 200000
+    StateManager.exportText = False
+    run(1000)
+
+    disabled = min(run(count) for _ in range(3))
+    Metrics.Enable(summaryInterval=0)
+    enabled = min(run(count) for _ in range(3))
+
+    print(f"Set, metrics disabled: {disabled * 1e6:.2f} us")
+    print(f"Set, metrics enabled:  {enabled * 1e6:.2f} us")
+    print()
+    print(Metrics.Summary())
+    print()
+    print("\n".join(Metrics.Render().splitlines()[:8]))
@@ -0,0 +1,108 @@
+"""Migrating a folder of overlay layouts.
+
+Compares the old approach (six str.replace passes per file, one file at
+a time) with LayoutMigrator, on a first run and on a second run where
+every file was already migrated. Run from the repository root:
+    python benchmarks/bench_migrate.py [layouts] [kilobytes per layout]
+"""
+import os
+import shutil
+import sys
+import tempfile
+import time
+from loguru import logger
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from src.LayoutMigrator import LayoutMigrator  # noqa: E402
+
+SNIPPET = """
+function update(data, oldData) {
+    if (JSON.stringify(data.score.team) != JSON.stringify(oldData.score.team)) {
+        let stage = _.get(data, "score.stage_strike.selected");
+        let old = _.get(oldData, "score.stage_strike.selected");
+        $(".ruleset").html(data.score.ruleset.name);
+        for (let t = 0; t < 2; t++) {
+            SetInnerHtml($(`.p${t + 1} .name`), data.score.team[t + 1].name);
+        }
+    }
+}
+let source = { source: `score.team.${t + 1}` };
+const unrelated = players.map((p) => p.name.toUpperCase()).join(", ");
+"""
+
+
+def Sequential(path):
+    with open(path, 'r') as file:
+        data = file.read()
+        data = data.replace("data.score.", "data.score[1].")
+        data = data.replace("oldData.score.", "oldData.score[1].")
+        data = data.replace(
+            "_.get(data, \"score.stage_strike.", "_.get(data, \"score.1.stage_strike.")
+        data = data.replace(
+            "_.get(oldData, \"score.stage_strike.", "_.get(oldData, \"score.1.stage_strike.")
+        data = data.replace(
+            "source: `score.team.${t + 1}`", "source: `score.1.team.${t + 1}`")
+        data = data.replace(
+            "data.score[1].ruleset", "data.score.ruleset")
+    with open(path, 'w') as file:
+        file.write(data)
+
+
+def Populate(directory, layouts, size):
+    content = SNIPPET * max(1, size * 1024 // len(SNIPPET))
+    for i in range(layouts):
+        layout = os.path.join(directory, f"layout{i}")
+        os.makedirs(layout)
+        with open(os.path.join(layout, "index.js"), 'w') as file:
+            file.write(content)
+
+
+def main():
+    layouts = int(sys.argv[1]) if len(sys.argv) > 1 else 48
+    size = int(sys.argv[2]) if len(sys.argv) > 2 else 256
+    logger.remove()
+
+    with tempfile.TemporaryDirectory() as directory:
+        old = os.path.join(directory, "old")
+        new = os.path.join(directory, "new")
+        os.makedirs(old)
+        os.makedirs(new)
+        Populate(old, layouts, size)
+        Populate(new, layouts, size)
+
+        start = time.perf_counter()
+        for layout in sorted(os.listdir(old)):
+            Sequential(os.path.join(old, layout, "index.js"))
+        sequential = time.perf_counter() - start
+
+        start = time.perf_counter()
+        preview = LayoutMigrator().Migrate(new, dryRun=True)
+        dryRun = time.perf_counter() - start
+
+        start = time.perf_counter()
+        results = LayoutMigrator().Migrate(new)
+        first = time.perf_counter() - start
+        assert all(r["status"] == "migrated" for r in results), results[:1]
+        assert len(preview) == len(results)
+
+        start = time.perf_counter()
+        again = LayoutMigrator().Migrate(new)
+        second = time.perf_counter() - start
+        assert all(r["status"] == "skipped" for r in again), again[:1]
+
+        for layout in sorted(os.listdir(old)):
+            with open(os.path.join(old, layout, "index.js"), 'rb') as a, \
+                    open(os.path.join(new, layout, "index.js"), 'rb') as b:
+                assert a.read() == b.read(), layout
+
+    print(f"{layouts} layouts of {size} KB")
+    print(f"sequential str.replace:  {sequential * 1000:8.1f} ms")
+    print(f"LayoutMigrator dry run:  {dryRun * 1000:8.1f} ms (with diffs)")
+    print(f"LayoutMigrator:          {first * 1000:8.1f} ms (with backups)")
+    print(f"already migrated:        {second * 1000:8.1f} ms")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,81 @@
+"""Recipe picker search over a 100k recipe catalog: index build, typing
+latency per keystroke (prefix, word, substring and misspelled queries)
+and incremental updates, against the old linear case-insensitive
+substring scan. Run from the repository root:
+    python benchmarks/bench_search.py [recipes]
+"""
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from src.Helpers.TSHSearchHelper import SearchIndex  # noqa: E402
+
+STYLES = ["Classic", "Spicy", "Smoky", "Creamy", "Grandma's", "Crispy", "Vegan",
+          "Slow Cooked", "Quick", "Roasted", "Grilled", "Braised", "Crème", "Herbed"]
+INGREDIENTS = ["Chicken", "Beef", "Tofu", "Salmon", "Mushroom", "Lentil", "Pork",
+               "Shrimp", "Eggplant", "Chickpea", "Potato", "Spinach", "Pumpkin", "Lamb",
+               "Jalapeño", "Cauliflower", "Duck", "Halloumi", "Sweet Potato", "Cod"]
+DISHES = ["Soup", "Curry", "Stew", "Tacos", "Lasagna", "Risotto", "Salad", "Pie",
+          "Burger", "Stir Fry", "Casserole", "Ramen", "Chili", "Paella", "Dumplings",
+          "Gratin", "Skewers", "Pasta", "Sandwich", "Bowl"]
+# Every prefix of each is timed, as typed
+QUERIES = ["chicken curry", "crispy tofu tacos", "sweet pot", "lasgna", "chiken stew",
+           "jalapeno", "creme", "dumplings 42", "ramen", "stir fry", "xyzzy"]
+
+
+def catalog(count):
+    rng = random.Random(1)
+    return [(f"r{i}", f"{rng.choice(STYLES)} {rng.choice(INGREDIENTS)} {rng.choice(DISHES)} {i % 1000}")
+            for i in range(count)]
+
+
+def linear(items, query, limit=50):
+    query = query.casefold()
+    return [item for item in items if query in item[1].casefold()][:limit]
+
+
+def percentiles(times):
+    times.sort()
+    return times[len(times) // 2] * 1e3, times[int(len(times) * 0.99)] * 1e3, times[-1] * 1e3
+
+
+if __name__ == "__main__":
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 100000
+    items = catalog(count)
+
+    index = SearchIndex()
+    start = time.perf_counter()
+    index.Build(items)
+    print(f"build {count}:            {time.perf_counter() - start:8.2f} s")
+
+    keystrokes = [query[:i] for query in QUERIES for i in range(1, len(query) + 1)]
+    for name, search in (("indexed", lambda q: index.Search(q)),
+                         ("linear scan", lambda q: linear(items, q))):
+        times = []
+        for _ in range(3):
+            for query in keystrokes:
+                start = time.perf_counter()
+                search(query)
+                times.append(time.perf_counter() - start)
+        p50, p99, worst = percentiles(times)
+        print(f"{name:12} keystroke: p50 {p50:6.2f} ms  p99 {p99:6.2f} ms  max {worst:6.2f} ms")
+
+    for query in ("lasgna", "chiken stew", "creme"):
+        print(f"  {query!r}: {[text for _, text in index.Search(query, 3)]}")
+
+    times = []
+    for i in range(2000):
+        start = time.perf_counter()
+        if i % 2 == 0:
+            index.Add(f"new{i}", f"Test Recipe {i}")
+        else:
+            index.Remove(f"r{i}")
+        times.append(time.perf_counter() - start)
+    p50, p99, worst = percentiles(times)
+    print(f"add/remove:            p50 {p50 * 1e3:6.1f} us  p99 {p99 * 1e3:6.1f} us")
+    start = time.perf_counter()
+    index.Search("chicken")
+    print(f"first search after:    {(time.perf_counter() - start) * 1e3:6.2f} ms")
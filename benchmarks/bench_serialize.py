@@ -0,0 +1,45 @@
+"""Serialize time and bytes written for each state output mode.
+
+Run from the repository root:
+    python benchmarks/bench_serialize.py
+"""
+import time
+
+import orjson
+from msgpack import packb
+
+
+def build_state(leaves, steps_per_recipe=10):
+    state = {"recipes": {}}
+    for i in range(leaves):
+        recipe, step = divmod(i, steps_per_recipe)
+        entry = state["recipes"].setdefault(
+            str(recipe), {"name": f"Recipe {recipe}", "steps": {}})
+        entry["steps"][str(step)] = {
+            "text": f"Step {step} of recipe {recipe}", "done": i % 3 == 0}
+    return state
+
+
+MODES = {
+    "json indent": lambda s: orjson.dumps(
+        s, option=orjson.OPT_NON_STR_KEYS | orjson.OPT_INDENT_2),
+    "json compact": lambda s: orjson.dumps(s, option=orjson.OPT_NON_STR_KEYS),
+    "msgpack": lambda s: packb(s),
+}
+
+
+def bench(dump, state, iterations):
+    start = time.perf_counter()
+    for _ in range(iterations):
+        data = dump({"timestamp": time.time(), "state": state})
+    return (time.perf_counter() - start) / iterations, len(data)
+
+
+if __name__ == "__main__":
+    print(f"{'leaves':>8} {'mode':>14} {'time (ms)':>10} {'bytes':>12}")
+    for leaves in (1000, 10000, 100000):
+        state = build_state(leaves)
+        iterations = max(3, 200000 // leaves)
+        for name, dump in MODES.items():
+            elapsed, size = bench(dump, state, iterations)
+            print(f"{leaves:>8} {name:>14} {elapsed * 1e3:>10.2f} {size:>12}")
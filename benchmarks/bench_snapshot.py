@@ -0,0 +1,76 @@
+"""Cost of refreshing the "last saved" snapshot after a write.
+
+Compares the msgpack round-trip deep_clone with copy-on-write path
+copying on large recipe states, with the recipes level as a plain dict
+and as a PersistentMap (as StateManager keeps it).
+
+Run from the repository root:
+    python benchmarks/bench_snapshot.py
+"""
+import os
+import sys
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.join(
+    os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "src", "Helpers"))
+
+from TSHDictHelper import PersistentMap, deep_assoc, deep_clone, deep_set  # noqa: E402
+
+
+def build_state(leaves, steps_per_recipe=10):
+    state = {"recipes": {}}
+    for i in range(leaves):
+        recipe, step = divmod(i, steps_per_recipe)
+        entry = state["recipes"].setdefault(
+            str(recipe), {"name": f"Recipe {recipe}", "steps": {}})
+        entry["steps"][str(step)] = {
+            "text": f"Step {step} of recipe {recipe}", "done": False}
+    return state
+
+
+def clone_saves(state, iterations):
+    last = deep_clone(state)
+    for i in range(iterations):
+        deep_set(state, f"recipes.{i % 50}.steps.{i % 10}.done", True)
+        last = deep_clone(state)
+    return last
+
+
+def cow_saves(state, iterations):
+    last = state
+    owned = {}
+    for i in range(iterations):
+        state = deep_assoc(
+            state, f"recipes.{i % 50}.steps.{i % 10}.done", True, owned)
+        # Taking the snapshot is just keeping the reference
+        last = state
+        owned = {}
+    return last
+
+
+def hamt_state(state):
+    return dict(state, recipes=PersistentMap(state["recipes"]))
+
+
+def measure(fn, leaves, iterations, prepare=None):
+    state = build_state(leaves)
+    if prepare is not None:
+        state = prepare(state)
+    tracemalloc.start()
+    start = time.perf_counter()
+    fn(state, iterations)
+    elapsed = (time.perf_counter() - start) / iterations
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return elapsed, peak
+
+
+if __name__ == "__main__":
+    print(f"{'leaves':>8} {'mode':>6} {'per save (us)':>14} {'peak extra (KiB)':>17}")
+    for leaves in (1000, 10000, 100000):
+        for name, fn, prepare in (("clone", clone_saves, None), ("cow", cow_saves, None),
+                                  ("hamt", cow_saves, hamt_state)):
+            iterations = max(5, 100000 // leaves) if fn is clone_saves else 2000
+            elapsed, peak = measure(fn, leaves, iterations, prepare)
+            print(f"{leaves:>8} {name:>6} {elapsed * 1e6:>14.1f} {peak / 1024:>17.1f}")
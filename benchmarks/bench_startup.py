@@ -0,0 +1,99 @@
+"""Import times and time to first paint of the main window.
+
+Runs each measurement in a fresh interpreter on the offscreen Qt platform,
+so it also works in CI. The window still calls a few handlers of the
+TournamentStreamHelper window it came from that were never ported, they
+are no-ops here. Run from the repository root:
+    python benchmarks/bench_startup.py
+"""
+import os
+import subprocess
+import sys
+import tempfile
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+IMPORT_TIME = """
+import os
+import time
+start = time.perf_counter()
+import src
+from src.StateManager import StateManager
+imported = time.perf_counter()
+import src.RecipeTracker
+gui = time.perf_counter()
+assert not os.path.exists("out") and not os.path.exists("logs")
+print(imported - start, gui - start)
+"""
+
+FIRST_PAINT = """
+import os
+import time
+start = time.perf_counter()
+import asyncio
+import src
+src.create_app()
+from qasync import QEventLoop
+from qtpy.QtCore import QEvent, QObject
+from qtpy.QtGui import QFont
+
+imported = time.perf_counter()
+loop = QEventLoop()
+asyncio.set_event_loop(loop)
+painted = loop.create_future()
+
+
+class PaintWatcher(QObject):
+    def eventFilter(self, obj, event):
+        if event.type() == QEvent.Type.Paint and not painted.done():
+            painted.set_result(time.perf_counter())
+        return False
+
+
+class Window(src.Window):
+    font_small = QFont()
+
+
+for name in ("CheckForUpdates", "LoadTheme", "LoadUserSetClicked", "LoadUserSetOptionsClicked",
+             "OnAssetUpdates", "ReloadGames", "SetGame", "ToggleAlwaysOnTop", "ToggleLightMode",
+             "ToggleTopOption", "UpdateUserSetButton"):
+    if not hasattr(src.Window, name):
+        setattr(Window, name, lambda self, *args: None)
+
+watcher = PaintWatcher()
+src.App.installEventFilter(watcher)
+window = Window(loop)
+constructed = time.perf_counter()
+firstPaint = loop.run_until_complete(asyncio.wait_for(painted, 10))
+print(imported - start, constructed - start, firstPaint - start, flush=True)
+# Deferred startup is still running, tearing Qt down under it aborts
+os._exit(0)
+"""
+
+
+def run(code):
+    env = dict(os.environ, QT_QPA_PLATFORM="offscreen",
+               PYTHONPATH=ROOT, PYTHONDONTWRITEBYTECODE="1")
+    result = subprocess.run([sys.executable, "-c", code], cwd=tempfile.mkdtemp(),
+                            env=env, capture_output=True, text=True)
+    if result.returncode != 0:
+        raise RuntimeError(result.stderr.strip().splitlines()[-1])
+    # The app logs to stdout too, the timings are on the last line
+    return [float(v) for v in result.stdout.strip().splitlines()[-1].split()]
+
+
+if __name__ == "__main__":
+    runs = 5
+    imports = [run(IMPORT_TIME) for _ in range(runs)]
+    headless = sorted(i[0] for i in imports)
+    gui = sorted(i[1] for i in imports)
+    print(f"import headless   median {headless[runs // 2] * 1e3:8.1f} ms")
+    print(f"import gui        median {gui[runs // 2] * 1e3:8.1f} ms")
+
+    try:
+        paints = sorted(run(FIRST_PAINT) for _ in range(runs))
+        imported, constructed, painted = paints[runs // 2]
+        print(f"window built      median {constructed * 1e3:8.1f} ms")
+        print(f"first paint       median {painted * 1e3:8.1f} ms")
+    except RuntimeError as e:
+        print(f"first paint       failed: {e}")
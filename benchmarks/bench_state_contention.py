@@ -0,0 +1,98 @@
+"""Multi-threaded StateManager stress test: throughput and tail latency.
+
+Writer threads each update their own recipe, a hotkey thread moves
+current.step and reader threads call Get, all at once, with the (not
+started) web server receiving every delta as in the app. Run from the
+repository root:
+    python benchmarks/bench_state_contention.py [seconds]
+"""
+import os
+import sys
+import tempfile
+import threading
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.chdir(tempfile.mkdtemp())
+
+from loguru import logger  # noqa: E402
+from src.StateManager import StateManager  # noqa: E402
+from src.TSHWebServer import WebServer  # noqa: E402
+
+logger.remove()
+
+WRITERS = 4
+READERS = 2
+STEPS = 50
+
+
+def worker(name, op, stop, results):
+    latencies = []
+    i = 0
+    while not stop.is_set():
+        start = time.perf_counter()
+        op(i)
+        latencies.append(time.perf_counter() - start)
+        i += 1
+    results[name] = latencies
+
+
+def writer(recipe):
+    text = "Stir until combined. " * 10
+
+    def op(i):
+        StateManager.Set(f"recipes.{recipe}.steps.{i % STEPS}",
+                         {"text": text, "done": i % 2 == 0})
+    return op
+
+
+def hotkey(i):
+    StateManager.Set("current.step", i % STEPS)
+
+
+def reader(recipe):
+    def op(i):
+        StateManager.Get(f"recipes.{recipe}.steps.{i % STEPS}.done")
+    return op
+
+
+def percentile(values, p):
+    return values[min(len(values) - 1, int(len(values) * p))]
+
+
+if __name__ == "__main__":
+    duration = float(sys.argv[1]) if len(sys.argv) > 1 else 3.0
+
+    StateManager.exportText = False
+    StateManager.webServer = WebServer(parent=None)
+    for recipe in range(WRITERS):
+        StateManager.Set(f"recipes.{recipe}", {"name": str(recipe), "steps": {}})
+    StateManager.Flush()
+
+    ops = {f"writer{w}": writer(w) for w in range(WRITERS)}
+    ops["hotkey"] = hotkey
+    ops.update({f"reader{r}": reader(r) for r in range(READERS)})
+
+    stop = threading.Event()
+    results = {}
+    threads = [threading.Thread(target=worker, args=(name, op, stop, results))
+               for name, op in ops.items()]
+    for thread in threads:
+        thread.start()
+    time.sleep(duration)
+    stop.set()
+    for thread in threads:
+        thread.join()
+    StateManager.Flush()
+
+    groups = {"Set": [], "Get": []}
+    for name, latencies in results.items():
+        groups["Get" if name.startswith("reader") else "Set"].extend(latencies)
+
+    print(f"{'op':>4} {'ops/s':>10} {'p50 (us)':>10} {'p99 (us)':>10} {'max (us)':>10}")
+    for name, latencies in groups.items():
+        latencies.sort()
+        print(f"{name:>4} {len(latencies) / duration:10.0f} "
+              f"{percentile(latencies, 0.5) * 1e6:10.1f} "
+              f"{percentile(latencies, 0.99) * 1e6:10.1f} "
+              f"{latencies[-1] * 1e6:10.1f}")
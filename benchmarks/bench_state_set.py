@@ -0,0 +1,73 @@
+"""Per-Set latency of StateManager change tracking as the state grows.
+
+Every Set is followed by a save, so each one copies its path anew. The
+tracked latency must stay flat: the largest state may not cost more than
+twice the smallest.
+
+Run from the repository root:
+    python benchmarks/bench_state_set.py
+"""
+import os
+import sys
+import tempfile
+import time
+
+os.environ.setdefault("QT_QPA_PLATFORM", "offscreen")
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.chdir(tempfile.mkdtemp())
+
+from deepdiff import DeepDiff  # noqa: E402
+from src.StateManager import StateManager  # noqa: E402
+from src.Helpers.TSHDictHelper import deep_clone, deep_set  # noqa: E402
+
+
+def build_state(leaves, steps_per_recipe=10):
+    state = {"recipes": {}}
+    for i in range(leaves):
+        recipe, step = divmod(i, steps_per_recipe)
+        state["recipes"].setdefault(str(recipe), {"steps": {}})[
+            "steps"][str(step)] = {"done": False}
+    return state
+
+
+def bench_tracked(state, iterations):
+    StateManager.EnsureLoaded()
+    state = StateManager.Widen(state, "recipes")
+    StateManager.state = state
+    # Saved as is, as after LoadState. A separate copy would be freed by
+    # the first save, all at once, inside the timing.
+    StateManager.lastSavedState = StateManager.Freeze()
+    StateManager.dirtyKeys = set()
+    StateManager.saveBlocked += 1
+    start = time.perf_counter()
+    for i in range(iterations):
+        StateManager.Set(f"recipes.0.steps.{i % 10}.done", i % 2 == 0)
+        StateManager.CollectChanges()
+    elapsed = time.perf_counter() - start
+    StateManager.saveBlocked -= 1
+    return elapsed / iterations
+
+
+def bench_deepdiff(state, iterations):
+    last = deep_clone(state)
+    start = time.perf_counter()
+    for i in range(iterations):
+        deep_set(state, f"recipes.0.steps.{i % 10}.done", i % 2 == 0)
+        DeepDiff(last, state)
+        last = deep_clone(state)
+    return (time.perf_counter() - start) / iterations
+
+
+if __name__ == "__main__":
+    print(f"{'leaves':>8} {'tracked (us)':>14} {'deepdiff (us)':>14}")
+    results = {}
+    for leaves in (100, 1000, 10000, 100000, 1000000):
+        tracked = bench_tracked(build_state(leaves), 1000)
+        results[leaves] = tracked
+        if leaves <= 10000:
+            diffed = bench_deepdiff(build_state(leaves), 3)
+            diffed = f"{diffed * 1e6:.1f}"
+        else:
+            diffed = "-"
+        print(f"{leaves:>8} {tracked * 1e6:>14.1f} {diffed:>14}")
+    assert results[1000000] < 2 * results[100], "Set latency grows with the state"
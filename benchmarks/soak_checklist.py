@@ -0,0 +1,94 @@
+"""Toggles a checklist step many times through RecipeChecklistWidget
+(setData -> Set -> save -> StateSignals -> dataChanged), flushing every
+time, and checks the reference counts of True and None stay put: PySide6
+6.12 drops one on every Python side signal emit and every void call,
+which ends up killing the interpreter. Fails right away on such a
+binding. Also checks a widget only Qt holds on to keeps following the
+state. Runs offscreen. From the repository root:
+    python benchmarks/soak_checklist.py [toggles]
+"""
+import gc
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.chdir(tempfile.mkdtemp())
+os.environ.setdefault("QT_QPA_PLATFORM", "offscreen")
+os.environ["QT_API"] = "pyside6"
+
+from loguru import logger  # noqa: E402
+from qtpy.QtCore import Qt, QCoreApplication  # noqa: E402
+from qtpy.QtWidgets import QApplication, QDockWidget  # noqa: E402
+from src.StateManager import StateManager  # noqa: E402
+from src.CheckboxWidget import RecipeChecklistWidget, StateSignals  # noqa: E402
+
+logger.remove()
+
+
+def wait_for(condition, timeout=5):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        QCoreApplication.processEvents()
+        if time.monotonic() > deadline:
+            raise TimeoutError()
+
+
+if __name__ == "__main__":
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 10000
+    app = QApplication(sys.argv)
+    if StateSignals.BindingLeaks():
+        sys.exit("this PySide6 leaks a reference to None on every call")
+    StateManager.exportText = False
+
+    steps = {str(i): {"text": f"Step {i}", "done": False} for i in range(100)}
+    with StateManager.transaction():
+        StateManager.Set("recipes.soak", {"name": "Soak", "steps": steps})
+        StateManager.Set("current", {"recipe": "soak", "step": 0})
+    StateManager.Flush()
+
+    checklist = RecipeChecklistWidget()
+    checklist.resize(400, 600)
+    checklist.show()
+    # Only referenced by the dock
+    dock = QDockWidget()
+    dock.setWidget(RecipeChecklistWidget())
+    dock.show()
+    QCoreApplication.processEvents()
+
+    model = checklist.model()
+    docked = dock.widget().model()
+    index = model.index(3)
+
+    def toggle(i):
+        expected = Qt.CheckState.Checked if i % 2 == 0 else Qt.CheckState.Unchecked
+        model.setData(index, expected, Qt.ItemDataRole.CheckStateRole)
+        StateManager.Flush()
+        wait_for(lambda: model.data(index, Qt.ItemDataRole.CheckStateRole) == expected and
+                 docked.data(docked.index(3), Qt.ItemDataRole.CheckStateRole) == expected)
+        if i % 100 == 0:
+            checklist.viewport().repaint()
+
+    def settle():
+        # Journal records and cyclic garbage hold on to their own references
+        StateManager.Flush(compact=True)
+        gc.collect()
+
+    # Caches fill up during the first ones
+    for i in range(100):
+        toggle(i)
+    settle()
+    before = sys.getrefcount(True), sys.getrefcount(None)
+    start = time.perf_counter()
+    for i in range(count):
+        toggle(i)
+    elapsed = time.perf_counter() - start
+    settle()
+    lostTrue = before[0] - sys.getrefcount(True)
+    lostNone = before[1] - sys.getrefcount(None)
+
+    print(f"{count} toggles:          {elapsed:6.1f} s")
+    print(f"references lost:        True {lostTrue}, None {lostNone}")
+    assert abs(lostTrue) < 10 and abs(lostNone) < 10, "Qt calls leak references"
+    StateManager.Flush()
@@ -6,7 +6,6 @@ import multiprocessing
 import sys
 import os
 import asyncio
-from qasync import run, QEventLoop
 from functools import partial
 os.environ["QT_API"] = "pyside6"
 
@@ -28,11 +27,78 @@ async def main(event_loop):
     return 0
 
 
+async def headless():
+    # No Qt at all, the overlay is the only UI. Commands come from stdin
+    # (one per line) and from POST /command.
+    from src.StateManager import StateManager
+
+    src.bootstrap()
+    server = src.WebServer(parent=None)
+    server.AddRoute("/command", src.RecipeEngine.CommandRoute, private=True)
+    StateManager.webServer = server
+    server.start()
+
+    await src.RecipeEngine.ReadCommands(sys.stdin)
+    return 0
+
+
+def import_recipes(paths):
+    from loguru import logger
+    from src.RecipeImporter import RecipeImporter
+    from src.StateManager import StateManager
+
+    src.bootstrap()
+
+    def progress(imported, errors, bytesRead, totalBytes):
+        logger.info(
+            f"{imported} recipes imported, {errors} rejected ({bytesRead * 100 // max(totalBytes, 1)}%)")
+
+    failed = False
+    for path in paths:
+        try:
+            imported, errors = RecipeImporter(progress=progress).Import(path)
+        except Exception as e:
+            logger.error(f"Could not import {path}: {e}")
+            failed = True
+            continue
+        for error in errors[:10]:
+            logger.warning(error)
+        logger.info(f"{path}: {imported} recipes imported, {len(errors)} rejected")
+
+    StateManager.Flush(compact=True)
+    return 1 if failed else 0
+
+
 if __name__ == '__main__':
     # Pyinstaller fix
     multiprocessing.freeze_support()
 
+    if "--metrics" in sys.argv:
+        # Picked up by src.bootstrap()
+        os.environ.setdefault("TSH_METRICS", "1")
+
+    if "--log-json" in sys.argv:
+        # Logs to ./logs/*.jsonl, one JSON record per line
+        os.environ.setdefault("TSH_LOG_JSON", "1")
+
+    if "--lan" in sys.argv:
+        # Overlays (and, with TSH_COMMAND_TOKEN, commands) from other
+        # computers. Only this one can connect otherwise.
+        os.environ.setdefault("TSH_WEB_HOST", "0.0.0.0")
+
+    if "--import" in sys.argv:
+        sys.exit(import_recipes(sys.argv[sys.argv.index("--import") + 1:]))
+
+    if "--headless" in sys.argv:
+        try:
+            sys.exit(asyncio.run(headless()))
+        except KeyboardInterrupt:
+            sys.exit(0)
+
+    from qasync import run, QEventLoop
+
     try:
+        src.create_app()
         loop = QEventLoop()
         asyncio.set_event_loop(loop)
         sys.exit(run(main(loop)))
@@ -0,0 +1,222 @@
+/*
+ * Shared client for the recipe tracker overlays.
+ *
+ * Keeps a local copy of the tracker state in sync with the web server
+ * (one snapshot, then sequence-numbered deltas) and lets overlay code
+ * subscribe to dotted key paths, the same ones StateManager uses:
+ *
+ *   TrackerState.subscribe("recipes.3.steps", (steps) => { ... });
+ *
+ * Deltas are applied by copying only the objects along the changed path,
+ * so anything that did not change keeps its identity. Callbacks run at
+ * most once per animation frame for each subscribed path, however many
+ * changes arrived in between.
+ */
+(function (global) {
+  "use strict";
+
+  function splitPath(path) {
+    return path === "" ? [] : String(path).split(".");
+  }
+
+  function getPath(obj, path) {
+    let value = obj;
+    for (const key of splitPath(path)) {
+      if (value === null || typeof value !== "object") return undefined;
+      value = value[key];
+    }
+    return value;
+  }
+
+  // Returns a new root with `value` at `keys`, sharing every untouched branch
+  function assocPath(obj, keys, value, remove) {
+    if (keys.length === 0) return remove ? {} : value;
+    const base = obj !== null && typeof obj === "object" ? obj : {};
+    const copy = Array.isArray(base) ? base.slice() : Object.assign({}, base);
+    const key = keys[0];
+    if (keys.length === 1) {
+      if (remove) delete copy[key];
+      else copy[key] = value;
+    } else {
+      if (remove && !(key in base)) return base;
+      copy[key] = assocPath(base[key], keys.slice(1), value, remove);
+    }
+    return copy;
+  }
+
+  class SubscriptionNode {
+    constructor() {
+      this.children = new Map();
+      this.callbacks = new Set();
+      this.path = "";
+    }
+  }
+
+  class Store {
+    constructor() {
+      this.state = {};
+      this.seq = 0;
+      this.socket = null;
+      this.url = null;
+      this.retryDelay = 500;
+      this.resyncing = false;
+      this.subscriptions = new SubscriptionNode();
+      this.pending = new Set();
+      this.frameRequested = false;
+    }
+
+    get(path) {
+      return getPath(this.state, path);
+    }
+
+    subscribe(path, callback) {
+      let node = this.subscriptions;
+      for (const key of splitPath(path)) {
+        if (!node.children.has(key)) {
+          const child = new SubscriptionNode();
+          child.path = node.path === "" ? key : node.path + "." + key;
+          node.children.set(key, child);
+        }
+        node = node.children.get(key);
+      }
+      node.callbacks.add(callback);
+      callback(this.get(path), path);
+      return () => node.callbacks.delete(callback);
+    }
+
+    connect(url) {
+      if (url === undefined) {
+        url = global.location && global.location.protocol.startsWith("http")
+          ? `ws://${global.location.host}/ws`
+          : "ws://localhost:5000/ws";
+      }
+      this.url = url;
+      this.socket = new WebSocket(url);
+
+      this.socket.onopen = () => {
+        this.retryDelay = 500;
+      };
+      this.socket.onmessage = (event) => this.receive(JSON.parse(event.data));
+      this.socket.onclose = () => {
+        this.resyncing = false;
+        setTimeout(() => this.connect(this.url), this.retryDelay);
+        this.retryDelay = Math.min(this.retryDelay * 2, 10000);
+      };
+      return this;
+    }
+
+    receive(message) {
+      if (message.type === "snapshot") {
+        this.state = message.state;
+        this.seq = message.seq;
+        this.resyncing = false;
+        this.markDirty(this.subscriptions, true);
+      } else if (message.type === "delta") {
+        if (message.seq <= this.seq) return;
+        if (message.seq !== this.seq + 1) {
+          // Missed something, ask for it once and drop deltas until it comes
+          if (!this.resyncing && this.socket) {
+            this.resyncing = true;
+            this.socket.send(JSON.stringify({ type: "resync", since: this.seq }));
+          }
+          return;
+        }
+        this.applyChanges(message.changes);
+        this.seq = message.seq;
+        this.resyncing = false;
+      }
+      this.scheduleFlush();
+    }
+
+    applyChanges(changes) {
+      for (const change of changes) {
+        const keys = splitPath(change.path);
+        this.state = assocPath(
+          this.state, keys, change.value, change.op === "remove");
+
+        // Ancestors and the node itself see a new value...
+        let node = this.subscriptions;
+        this.markDirty(node, false);
+        for (const key of keys) {
+          node = node.children.get(key);
+          if (node === undefined) break;
+          this.markDirty(node, false);
+        }
+        // ...and so does everything below it
+        if (node !== undefined) this.markDirty(node, true);
+      }
+    }
+
+    markDirty(node, recursive) {
+      if (node.callbacks.size > 0) this.pending.add(node);
+      if (recursive) {
+        for (const child of node.children.values()) this.markDirty(child, true);
+      }
+    }
+
+    scheduleFlush() {
+      if (this.frameRequested || this.pending.size === 0) return;
+      this.frameRequested = true;
+      const raf = global.requestAnimationFrame || ((fn) => setTimeout(fn, 16));
+      raf(() => this.flush());
+    }
+
+    flush() {
+      this.frameRequested = false;
+      const pending = this.pending;
+      this.pending = new Set();
+      for (const node of pending) {
+        const value = this.get(node.path);
+        for (const callback of node.callbacks) {
+          try {
+            callback(value, node.path);
+          } catch (e) {
+            console.error(e);
+          }
+        }
+      }
+    }
+
+    /*
+     * Keeps one DOM node per entry of the object at `path`. Only entries
+     * whose value changed identity are passed to `render` again.
+     *
+     *   render(item, key, oldElement) -> element
+     */
+    renderList(container, path, render) {
+      const elements = new Map();
+      const values = new Map();
+
+      return this.subscribe(path, (items) => {
+        items = items || {};
+        const keys = Object.keys(items);
+
+        for (const [key, element] of elements) {
+          if (!(key in items)) {
+            element.remove();
+            elements.delete(key);
+            values.delete(key);
+          }
+        }
+
+        let previous = null;
+        for (const key of keys) {
+          let element = elements.get(key);
+          if (element === undefined || values.get(key) !== items[key]) {
+            const rendered = render(items[key], key, element);
+            if (element !== undefined && rendered !== element) element.replaceWith(rendered);
+            element = rendered;
+            elements.set(key, element);
+            values.set(key, items[key]);
+          }
+          const expected = previous ? previous.nextSibling : container.firstChild;
+          if (expected !== element) container.insertBefore(element, expected);
+          previous = element;
+        }
+      });
+    }
+  }
+
+  global.TrackerState = new Store();
+  global.TrackerState.getPath = getPath;
+})(window);
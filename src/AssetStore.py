@@ -0,0 +1,195 @@
+import atexit
+import errno
+import hashlib
+import os
+import shutil
+import threading
+import time
+import traceback
+import orjson
+from loguru import logger
+from .Helpers.TSHFileHelper import write_atomically
+
+FICLONE = 0x40049409
+# Stores before version 2 hardlinked blobs to their source file
+INDEX_VERSION = 2
+
+
+class AssetStore:
+    """Content-addressed store for the local files exported to ./out.
+
+    Each source file is stored once as a blob named by its sha256, a
+    copy (a reflink where the filesystem supports it) so that editing the
+    source does not change the blob, and placed at its output paths as a
+    hardlink of the blob (a copy when that is not possible). Sources are only hashed again when their mtime,
+    size or inode change, and an output already holding the right blob is
+    left alone. Blobs no output refers to are removed by a background
+    thread every `gcInterval` seconds.
+    """
+
+    def __init__(self, root="./out/.assets", gcInterval=60):
+        self.root = root
+        self.gcInterval = gcInterval
+        self.lock = threading.RLock()
+        self.gcThread = None
+        self.dirty = False
+        self.sources = None
+        self.targets = None
+
+    def Link(self, source, outputFile):
+        source = os.path.abspath(source)
+        stat = os.stat(source)
+        signature = [stat.st_mtime_ns, stat.st_size, stat.st_ino]
+
+        with self.lock:
+            self.Load()
+            known = self.sources.get(source)
+
+        if known is not None and known[:3] == signature:
+            digest = known[3]
+        else:
+            digest = AssetStore.Hash(source)
+
+        blob = self.BlobPath(digest)
+
+        with self.lock:
+            if self.sources.get(source) != signature + [digest]:
+                self.sources[source] = signature + [digest]
+                self.dirty = True
+
+            if self.targets.get(outputFile) == digest and os.path.exists(outputFile) and os.path.exists(blob):
+                return
+
+            if not os.path.exists(blob):
+                os.makedirs(os.path.dirname(blob), exist_ok=True)
+                AssetStore.Copy(source, blob + ".tmp")
+                os.replace(blob + ".tmp", blob)
+
+            if os.path.lexists(outputFile):
+                os.remove(outputFile)
+            AssetStore.HardLink(blob, outputFile)
+
+            self.targets[outputFile] = digest
+            self.dirty = True
+            self.StartCollector()
+
+    def Unlink(self, outputFile):
+        with self.lock:
+            self.Load()
+            if self.targets.pop(outputFile, None) is not None:
+                self.dirty = True
+            if os.path.lexists(outputFile):
+                os.remove(outputFile)
+
+    def BlobPath(self, digest):
+        return os.path.join(self.root, digest[:2], digest)
+
+    def Hash(path):
+        digest = hashlib.sha256()
+        with open(path, 'rb') as file:
+            for chunk in iter(lambda: file.read(1024*1024), b""):
+                digest.update(chunk)
+        return digest.hexdigest()
+
+    def HardLink(blob, destination):
+        try:
+            os.link(blob, destination)
+        except OSError as e:
+            if e.errno not in (errno.EXDEV, errno.EPERM, errno.EMLINK, errno.ENOTSUP):
+                raise
+            AssetStore.Copy(blob, destination)
+
+    def Copy(source, destination):
+        try:
+            import fcntl
+            with open(source, 'rb') as src, open(destination, 'wb') as dst:
+                fcntl.ioctl(dst.fileno(), FICLONE, src.fileno())
+            return
+        except (ImportError, OSError):
+            pass
+
+        shutil.copyfile(source, destination)
+
+    def Load(self):
+        if self.sources is not None:
+            return
+        try:
+            with open(os.path.join(self.root, "index.json"), 'rb') as file:
+                index = orjson.loads(file.read())
+            if index.get("version") != INDEX_VERSION:
+                # Its blobs may have been edited through their source
+                logger.info("Rebuilding the asset store")
+                self.sources = {}
+                self.targets = {}
+                self.dirty = True
+                for folder in os.listdir(self.root):
+                    if os.path.isdir(os.path.join(self.root, folder)):
+                        shutil.rmtree(os.path.join(self.root, folder), ignore_errors=True)
+                return
+            self.sources = index.get("sources", {})
+            self.targets = index.get("targets", {})
+        except FileNotFoundError:
+            self.sources = {}
+            self.targets = {}
+        except Exception as e:
+            logger.error(traceback.format_exc())
+            self.sources = {}
+            self.targets = {}
+
+    def Save(self):
+        with self.lock:
+            if not self.dirty:
+                return
+            data = orjson.dumps(
+                {"version": INDEX_VERSION, "sources": self.sources, "targets": self.targets})
+            self.dirty = False
+        os.makedirs(self.root, exist_ok=True)
+        # Rebuilt from the outputs if lost, see Load
+        write_atomically(os.path.join(self.root, "index.json"), data, sync=False)
+
+    def CollectGarbage(self):
+        removed = 0
+
+        with self.lock:
+            self.Load()
+            referenced = set(self.targets.values())
+
+            for source, known in list(self.sources.items()):
+                if known[3] not in referenced:
+                    del self.sources[source]
+                    self.dirty = True
+
+            if os.path.isdir(self.root):
+                for folder in os.listdir(self.root):
+                    folderPath = os.path.join(self.root, folder)
+                    if not os.path.isdir(folderPath):
+                        continue
+                    for digest in os.listdir(folderPath):
+                        if digest in referenced:
+                            continue
+                        try:
+                            os.remove(os.path.join(folderPath, digest))
+                            removed += 1
+                        except OSError:
+                            pass
+
+        if removed > 0:
+            logger.info(f"Removed {removed} unused assets")
+        self.Save()
+
+    def StartCollector(self):
+        if self.gcThread is not None:
+            return
+
+        def collect():
+            while True:
+                time.sleep(self.gcInterval)
+                try:
+                    self.CollectGarbage()
+                except Exception as e:
+                    logger.error(traceback.format_exc())
+
+        self.gcThread = threading.Thread(
+            target=collect, name="AssetStoreGC", daemon=True)
+        self.gcThread.start()
+        atexit.register(self.Save)
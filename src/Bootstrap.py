@@ -0,0 +1,218 @@
+import atexit
+import copy
+import os
+import sys
+import threading
+import traceback
+from collections import deque
+import orjson
+from loguru import logger
+from .Metrics import Metrics
+
+fmt = ("<green>{time:YYYY-MM-DD HH:mm:ss}</green> " +
+       "| <level>{level}</level> | " +
+       "<yellow>{file}</yellow>:<blue>{function}</blue>:<cyan>{line}</cyan> " +
+       "- <level>{message}</level>")
+
+fileFmt = "[{time:YYYY-MM-DD HH:mm:ss}] - {level} - {file}:{function}:{line} | {message}"
+
+bootstrapped = False
+
+
+class LoggerWriter(object):
+    """Stands in for stdout/stderr in frozen builds, passing every complete
+    line to `writer`. A partial line is kept as pieces until its newline
+    arrives, so a write costs as much as its own length however long the
+    burst is."""
+
+    def __init__(self, writer):
+        self._writer = writer
+        self._parts = []
+
+    def write(self, message):
+        if '\n' not in message:
+            if message != '':
+                self._parts.append(message)
+            return len(message)
+
+        lines = message.split('\n')
+        if len(self._parts) > 0:
+            self._parts.append(lines[0])
+            lines[0] = ''.join(self._parts)
+            self._parts = []
+        for line in lines[:-1]:
+            self._writer(line)
+        if lines[-1] != '':
+            self._parts.append(lines[-1])
+        return len(message)
+
+    def flush(self):
+        if len(self._parts) > 0:
+            message = ''.join(self._parts)
+            self._parts = []
+            self._writer(message)
+
+
+class LogQueue:
+    """Loguru sink that hands formatted records to a writer thread, which
+    appends them to the log files in batches. A log call costs loguru
+    formatting the record and an append, never a disk write, a rotation
+    or zipping a rotated file.
+
+    The files are sinks of `files`, a logger of its own (a copy of
+    loguru's taken before it had handlers), added with AddFile. With
+    `structured` every record is written as one JSON line instead of its
+    text. Whatever is still queued is written at exit.
+    """
+
+    batchSize = 1000
+    # Records are written this long after the first one queued, in one
+    # go. Errors are written right away.
+    interval = 0.05
+    urgentLevel = 40
+
+    def __init__(self, files, structured=False):
+        self.files = files
+        self.structured = structured
+        # (minimum level number, logger writing to that file)
+        self.writers = []
+        self.closed = False
+        self.Start()
+        atexit.register(self.Close)
+        if hasattr(os, "register_at_fork"):
+            # Forked workers (RecipeImporter's pool) get a writer of their own
+            os.register_at_fork(after_in_child=self.Start)
+
+    def Start(self):
+        self.records = deque()
+        self.wake = threading.Event()
+        self.urgent = threading.Event()
+        self.thread = threading.Thread(
+            target=self.Run, name="LogQueue", daemon=True)
+        self.thread.start()
+
+    def AddFile(self, path, level, **options):
+        """Writes records of `level` and above to `path`, the options are
+        logger.add's (rotation, compression...)."""
+        self.files.add(path, format="{message}", level=0,
+                       filter=lambda record: record["extra"].get("logFile") == path, **options)
+        self.writers.append((self.files.level(level).no,
+                             self.files.bind(logFile=path).opt(raw=True)))
+
+    def Write(self, message):
+        if self.closed:
+            self.WriteBatch([message])
+            return
+        self.records.append(message)
+        if message.record["level"].no >= LogQueue.urgentLevel:
+            self.urgent.set()
+        self.wake.set()
+
+    def Run(self):
+        while not self.closed:
+            self.wake.wait()
+            self.urgent.wait(LogQueue.interval)
+            self.wake.clear()
+            self.urgent.clear()
+            self.Drain()
+
+    def Drain(self):
+        while len(self.records) > 0:
+            batch = []
+            while len(self.records) > 0 and len(batch) < LogQueue.batchSize:
+                batch.append(self.records.popleft())
+            self.WriteBatch(batch)
+
+    def WriteBatch(self, batch):
+        try:
+            texts = [(m.record["level"].no, LogQueue.Serialize(m) if self.structured else str(m))
+                     for m in batch]
+            for minimum, writer in self.writers:
+                text = "".join(t for no, t in texts if no >= minimum)
+                if text != "":
+                    writer.info(text)
+        except Exception as e:
+            # Nowhere left to log it
+            if sys.__stderr__ is not None:
+                traceback.print_exc(file=sys.__stderr__)
+
+    def Serialize(message):
+        record = message.record
+        exception = record["exception"]
+        return orjson.dumps({
+            "time": record["time"].isoformat(),
+            "level": record["level"].name,
+            "message": record["message"],
+            "name": record["name"],
+            "file": record["file"].name,
+            "function": record["function"],
+            "line": record["line"],
+            "thread": record["thread"].name,
+            "process": record["process"].id,
+            "exception": "".join(traceback.format_exception(*exception)) if exception else None,
+            "extra": record["extra"],
+        }, default=str).decode("utf-8") + "\n"
+
+    def Close(self):
+        self.closed = True
+        self.urgent.set()
+        self.wake.set()
+        self.thread.join(timeout=5)
+        self.Drain()
+
+
+def bootstrap():
+    """Sets up the process wide side effects: loguru sinks, ./logs and the
+    stdout/stderr redirection for frozen builds, and metrics when
+    TSH_METRICS is set. Importing the package does none of this, entry
+    points call it once before doing anything else. Calling it again does
+    nothing."""
+    global bootstrapped
+    if bootstrapped:
+        return
+    bootstrapped = True
+
+    # The file sinks get a logger of their own, see LogQueue. Copying
+    # the logger only works while it has no handlers.
+    logger.remove()
+    files = copy.deepcopy(logger)
+
+    if sys.stdout != None:
+        config = {
+            "handlers": [
+                {"sink": sys.stdout, "format": fmt},
+            ],
+        }
+        logger.configure(**config)
+    else:
+        # Handle all uncaught exceptions and forward to loguru
+        def handle_exception(exc_type, exc_value, exc_traceback):
+            if issubclass(exc_type, KeyboardInterrupt):
+                sys.__excepthook__(exc_type, exc_value, exc_traceback)
+                return
+
+            logger.critical("Uncaught exception", exc_info=(
+                exc_type, exc_value, exc_traceback))
+
+        sys.excepthook = handle_exception
+
+        sys.stdout = LoggerWriter(logger.info)
+        sys.stderr = LoggerWriter(logger.error)
+
+    # Log calls only format the record and queue it, the files are
+    # written (rotated and zipped too) by LogQueue's thread
+    structured = os.environ.get("TSH_LOG_JSON", "") not in ("", "0", "false", "no")
+    queue = LogQueue(files, structured)
+    for name, level in (("tsh", "INFO"), ("tsh-error", "ERROR")):
+        queue.AddFile(
+            f"./logs/{name}.jsonl" if structured else f"./logs/{name}.log",
+            level,
+            encoding="utf-8",
+            rotation="20 MB",
+            compression="zip"
+        )
+    logger.add(queue.Write, format=fileFmt, level="INFO")
+
+    logger.critical("=== TSH IS STARTING ===")
+
+    Metrics.EnableFromEnvironment()
@@ -0,0 +1,297 @@
+import bisect
+import sys
+import traceback
+import weakref
+from collections import deque
+from qtpy.QtGui import *
+from qtpy.QtWidgets import *
+from qtpy.QtCore import *
+from loguru import logger
+from .StateManager import StateManager
+from .RecipeIndex import RecipeIndex
+from .Helpers.TSHDictHelper import deep_get
+
+
+class StateSignals(QObject):
+    """Forwards every saved batch of StateManager changes to the Qt thread,
+    calling `callback(changes, state)` for each callback given to
+    Connect(), where `state` is the frozen state they lead to. One
+    StateManager listener serves every model, and callbacks are dropped
+    when the QObject they are a method of is destroyed.
+
+    Batches cross threads in a deque, the Qt thread is woken up by a
+    queued call to Deliver. Nothing here emits a signal from Python: in
+    PySide6 6.12 every Python side emit leaks a reference to True, and a
+    long stream of changes ends up crashing the interpreter.
+    """
+
+    instance = None
+
+    def __init__(self):
+        super().__init__()
+        self.batches = deque()
+        self.callbacks = []
+
+    def Instance():
+        if StateSignals.instance is None:
+            StateSignals.instance = StateSignals()
+            with StateManager.lock:
+                StateManager.EnsureLoaded()
+                StateManager.listeners.append(StateSignals.instance.Listen)
+        return StateSignals.instance
+
+    def BindingLeaks():
+        """Whether this PySide6 drops a reference to None on every call of
+        a void method, as 6.12 does. Views updated that often end up
+        crashing the interpreter, see RecipeTracker."""
+        probe = QObject()
+        before = sys.getrefcount(None)
+        for i in range(16):
+            probe.setObjectName("")
+        return sys.getrefcount(None) < before - 8
+
+    def Connect(self, callback):
+        """`callback` has to be a method of a QObject. It is only weakly
+        referenced, as a signal connection would be."""
+        ref = weakref.WeakMethod(callback)
+        self.callbacks.append(ref)
+        callback.__self__.destroyed.connect(lambda: self.Disconnect(ref))
+
+    def Disconnect(self, ref):
+        if ref in self.callbacks:
+            self.callbacks.remove(ref)
+
+    def Listen(self, changes):
+        # Publisher thread, under StateManager.lock
+        self.batches.append((changes, StateManager.lastSavedState))
+        if len(self.batches) == 1:
+            QMetaObject.invokeMethod(self, "Deliver", Qt.ConnectionType.QueuedConnection)
+
+    @Slot()
+    def Deliver(self):
+        while len(self.batches) > 0:
+            changes, state = self.batches.popleft()
+            for ref in list(self.callbacks):
+                callback = ref()
+                if callback is None:
+                    self.Disconnect(ref)
+                    continue
+                try:
+                    callback(changes, state)
+                except Exception as e:
+                    logger.error(traceback.format_exc())
+
+
+class RecipeChecklistModel(QAbstractListModel):
+    """The steps under a StateManager key path (e.g. "recipes.bread.steps")
+    as checkable rows, in step order.
+
+    The model keeps the step keys and a reference to the frozen steps
+    dict of the last save, nothing per row. Saved changes under the path
+    become dataChanged for the rows they touch (contiguous rows in one
+    range), row inserts/removes for added or removed steps, and a reset
+    only when the whole list is replaced. Checking a row, or editing its
+    text when `editable`, is a StateManager.Set on that step; the row
+    updates once the change is saved, a few milliseconds later.
+    """
+
+    roles = [Qt.ItemDataRole.DisplayRole.value, Qt.ItemDataRole.EditRole.value,
+             Qt.ItemDataRole.CheckStateRole.value]
+    # Above this many added/removed rows a reset is cheaper
+    maxRowUpdates = 64
+    # Above this many changed ranges one range spanning them all is
+    # cheaper, views only repaint the part of it that is visible
+    maxRanges = 32
+
+    def __init__(self, path=None, editable=False, parent=None):
+        super().__init__(parent)
+        self.path = None
+        self.editable = editable
+        self.steps = {}
+        self.keys = []
+        self.rowOf = {}
+        StateSignals.Instance().Connect(self.ApplyChanges)
+        self.SetPath(path)
+
+    def SetPath(self, path):
+        self.beginResetModel()
+        self.path = path
+        self.LoadSteps(StateManager.lastSavedState)
+        self.endResetModel()
+
+    def LoadSteps(self, state):
+        steps = deep_get(state, self.path, {}) if self.path else {}
+        self.steps = steps if isinstance(steps, dict) else {}
+        self.keys = sorted(self.steps, key=RecipeChecklistModel.StepOrder)
+        self.rowOf = {key: row for row, key in enumerate(self.keys)}
+
+    def StepOrder(step):
+        return RecipeIndex.StepOrder(str(step))
+
+    def StepKey(self, index):
+        return self.keys[index.row()]
+
+    def StepPath(self, step):
+        return f"{self.path}.{step}"
+
+    def rowCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else len(self.keys)
+
+    def data(self, index, role=Qt.ItemDataRole.DisplayRole):
+        if not index.isValid() or index.row() >= len(self.keys):
+            return None
+        step = self.steps.get(self.keys[index.row()])
+        if step is None:
+            return None
+        if role in (Qt.ItemDataRole.DisplayRole, Qt.ItemDataRole.EditRole):
+            return step.get("text", "") if isinstance(step, dict) else str(step)
+        if role == Qt.ItemDataRole.CheckStateRole:
+            done = isinstance(step, dict) and step.get("done", False)
+            return Qt.CheckState.Checked if done else Qt.CheckState.Unchecked
+        return None
+
+    def flags(self, index):
+        flags = Qt.ItemFlag.ItemIsEnabled | Qt.ItemFlag.ItemIsSelectable | \
+            Qt.ItemFlag.ItemIsUserCheckable
+        if self.editable:
+            flags |= Qt.ItemFlag.ItemIsEditable
+        return flags
+
+    def setData(self, index, value, role=Qt.ItemDataRole.EditRole):
+        if not index.isValid() or self.path is None:
+            return False
+        step = self.StepPath(self.StepKey(index))
+        try:
+            if role == Qt.ItemDataRole.CheckStateRole:
+                done = value in (Qt.CheckState.Checked, Qt.CheckState.Checked.value)
+                StateManager.Set(f"{step}.done", done)
+                return True
+            if role == Qt.ItemDataRole.EditRole and self.editable:
+                StateManager.Set(f"{step}.text", str(value))
+                return True
+        except Exception as e:
+            logger.error(traceback.format_exc())
+        return False
+
+    def ApplyChanges(self, changes, state):
+        if self.path is None:
+            return
+
+        prefix = self.path + "."
+        reset = False
+        touched = set()
+        added = set()
+        removed = set()
+
+        for change in changes:
+            path = change["path"]
+            if path == "" or path == self.path or self.path.startswith(path + "."):
+                reset = True
+                break
+            if not path.startswith(prefix):
+                continue
+            step, _, rest = path[len(prefix):].partition(".")
+            if rest == "" and change["op"] == "remove":
+                removed.add(step)
+                added.discard(step)
+            elif step not in self.rowOf:
+                # Also a write below a step that did not exist yet
+                added.add(step)
+            else:
+                touched.add(step)
+
+        if reset or len(added) + len(removed) > RecipeChecklistModel.maxRowUpdates:
+            self.beginResetModel()
+            self.LoadSteps(state)
+            self.endResetModel()
+            return
+
+        if len(added) == 0 and len(removed) == 0 and len(touched) == 0:
+            return
+
+        steps = deep_get(state, self.path, {})
+        self.steps = steps if isinstance(steps, dict) else {}
+
+        if len(removed) > 0 or len(added) > 0:
+            for row in sorted((self.rowOf[s] for s in removed if s in self.rowOf), reverse=True):
+                self.beginRemoveRows(QModelIndex(), row, row)
+                del self.keys[row]
+                self.endRemoveRows()
+            for step in sorted((s for s in added if s in self.steps), key=RecipeChecklistModel.StepOrder):
+                row = bisect.bisect(
+                    self.keys, RecipeChecklistModel.StepOrder(step), key=RecipeChecklistModel.StepOrder)
+                self.beginInsertRows(QModelIndex(), row, row)
+                self.keys.insert(row, step)
+                self.endInsertRows()
+            self.rowOf = {key: row for row, key in enumerate(self.keys)}
+
+        rows = sorted(self.rowOf[s] for s in touched if s in self.rowOf)
+        ranges = list(RecipeChecklistModel.Ranges(rows))
+        if len(ranges) > RecipeChecklistModel.maxRanges:
+            ranges = [(ranges[0][0], ranges[-1][1])]
+        for first, last in ranges:
+            # Through the meta object, see StateSignals
+            QMetaObject.invokeMethod(
+                self, "dataChanged", Qt.ConnectionType.DirectConnection,
+                Q_ARG(QModelIndex, self.index(first)), Q_ARG(QModelIndex, self.index(last)),
+                Q_ARG("QList<int>", RecipeChecklistModel.roles))
+
+    def Ranges(rows):
+        """Sorted row numbers as (first, last) runs of consecutive rows."""
+        first = None
+        for row in rows:
+            if first is None:
+                first = last = row
+            elif row == last + 1:
+                last = row
+            else:
+                yield first, last
+                first = last = row
+        if first is not None:
+            yield first, last
+
+
+class StepDelegate(QStyledItemDelegate):
+    """Strikes through the text of steps that are done."""
+
+    def initStyleOption(self, option, index):
+        super().initStyleOption(option, index)
+        if index.data(Qt.ItemDataRole.CheckStateRole) == Qt.CheckState.Checked:
+            option.font.setStrikeOut(True)
+            option.palette.setColor(
+                QPalette.ColorRole.Text, option.palette.color(QPalette.ColorRole.PlaceholderText))
+
+
+class RecipeChecklistWidget(QListView):
+    """Checklist of a recipe's steps. Only the visible rows are ever laid
+    out or painted, so it stays fast with thousands of steps.
+
+    With no recipe given it follows "current.recipe".
+    """
+
+    def __init__(self, recipe=None, parent=None):
+        super().__init__(parent)
+        self.followCurrent = recipe is None
+        self.setUniformItemSizes(True)
+        self.setLayoutMode(QListView.LayoutMode.Batched)
+        self.setBatchSize(200)
+        self.setItemDelegate(StepDelegate(self))
+
+        self.checklist = RecipeChecklistModel(parent=self)
+        self.setModel(self.checklist)
+        self.SetRecipe(recipe if recipe is not None else
+                       deep_get(StateManager.lastSavedState, "current.recipe"))
+
+        if self.followCurrent:
+            StateSignals.Instance().Connect(self.FollowCurrent)
+
+    def SetRecipe(self, recipe):
+        self.recipe = recipe
+        self.checklist.SetPath(
+            f"recipes.{recipe}.steps" if recipe is not None else None)
+
+    def FollowCurrent(self, changes, state):
+        if any(c["path"] in ("", "current", "current.recipe") for c in changes):
+            recipe = deep_get(state, "current.recipe")
+            if recipe != self.recipe:
+                self.SetRecipe(recipe)
@@ -0,0 +1,158 @@
+import traceback
+from qtpy.QtGui import *
+from qtpy.QtWidgets import *
+from qtpy.QtCore import *
+from loguru import logger
+from .StateManager import StateManager
+from .CheckboxWidget import RecipeChecklistModel, StateSignals, StepDelegate
+from .Helpers.TSHDictHelper import deep_get
+
+
+class RecipeEditorWidget(QWidget):
+    """Edits one recipe in place: its name, tags and steps.
+
+    Steps are shown through an editable RecipeChecklistModel, so double
+    clicking a step edits its text and the list stays virtualized however
+    long the recipe is. Every edit is written to StateManager right away
+    (removing steps renumbers the rest in one transaction), and the
+    fields follow changes made elsewhere unless they are being edited.
+    """
+
+    def __init__(self, recipe=None, parent=None):
+        super().__init__(parent)
+        self.recipe = None
+        self.setLayout(QVBoxLayout())
+
+        form = QFormLayout()
+        self.layout().addLayout(form)
+        self.name = QLineEdit()
+        self.name.editingFinished.connect(self.NameEdited)
+        form.addRow(QApplication.translate("app", "Name"), self.name)
+        self.tags = QLineEdit()
+        self.tags.setPlaceholderText(
+            QApplication.translate("app", "Comma separated"))
+        self.tags.editingFinished.connect(self.TagsEdited)
+        form.addRow(QApplication.translate("app", "Tags"), self.tags)
+
+        self.steps = QListView()
+        self.steps.setUniformItemSizes(True)
+        self.steps.setLayoutMode(QListView.LayoutMode.Batched)
+        self.steps.setBatchSize(200)
+        self.steps.setItemDelegate(StepDelegate(self.steps))
+        self.steps.setSelectionMode(
+            QAbstractItemView.SelectionMode.ExtendedSelection)
+        self.steps.setEditTriggers(
+            QAbstractItemView.EditTrigger.DoubleClicked | QAbstractItemView.EditTrigger.EditKeyPressed)
+        self.checklist = RecipeChecklistModel(editable=True, parent=self)
+        self.steps.setModel(self.checklist)
+        self.layout().addWidget(self.steps)
+
+        hbox = QHBoxLayout()
+        self.layout().addLayout(hbox)
+        self.newStep = QLineEdit()
+        self.newStep.setPlaceholderText(
+            QApplication.translate("app", "New step"))
+        self.newStep.returnPressed.connect(self.AddStep)
+        hbox.addWidget(self.newStep)
+        addButton = QPushButton(QApplication.translate("app", "Add step"))
+        addButton.clicked.connect(self.AddStep)
+        hbox.addWidget(addButton)
+        removeButton = QPushButton(
+            QApplication.translate("app", "Remove selected"))
+        removeButton.clicked.connect(self.RemoveSelected)
+        hbox.addWidget(removeButton)
+
+        StateSignals.Instance().Connect(self.UpdateFields)
+        self.SetRecipe(recipe)
+
+    def SetRecipe(self, recipe):
+        self.recipe = recipe
+        self.checklist.SetPath(
+            f"recipes.{recipe}.steps" if recipe is not None else None)
+        self.setEnabled(recipe is not None)
+        self.LoadFields(StateManager.lastSavedState, force=True)
+
+    def RecipePath(self):
+        return f"recipes.{self.recipe}"
+
+    def LoadFields(self, state, force=False):
+        if self.recipe is None:
+            self.name.clear()
+            self.tags.clear()
+            return
+        if force or not self.name.hasFocus():
+            self.name.setText(
+                str(deep_get(state, f"{self.RecipePath()}.name", "")))
+        if force or not self.tags.hasFocus():
+            tags = deep_get(state, f"{self.RecipePath()}.tags", [])
+            if isinstance(tags, dict):
+                tags = list(tags.values())
+            if not isinstance(tags, (list, tuple)):
+                tags = []
+            self.tags.setText(", ".join(str(t) for t in tags))
+
+    def UpdateFields(self, changes, state):
+        if self.recipe is None:
+            return
+        path = self.RecipePath()
+        for change in changes:
+            key = change["path"]
+            if key == "" or path.startswith(key + ".") or key == path or \
+                    key.startswith(path + ".name") or key.startswith(path + ".tags"):
+                self.LoadFields(state)
+                return
+
+    def NameEdited(self):
+        if self.recipe is None:
+            return
+        name = self.name.text().strip()
+        if name != "" and name != StateManager.Get(f"{self.RecipePath()}.name"):
+            StateManager.Set(f"{self.RecipePath()}.name", name)
+
+    def TagsEdited(self):
+        if self.recipe is None:
+            return
+        tags = [t.strip() for t in self.tags.text().split(",") if t.strip() != ""]
+        if tags != StateManager.Get(f"{self.RecipePath()}.tags"):
+            StateManager.Set(f"{self.RecipePath()}.tags", tags)
+
+    def AddStep(self):
+        text = self.newStep.text().strip()
+        if self.recipe is None or text == "":
+            return
+        steps = StateManager.Get(f"{self.RecipePath()}.steps", {})
+        numbers = [int(k) for k in steps if str(k).isdigit()] if isinstance(steps, dict) else []
+        step = max(numbers) + 1 if len(numbers) > 0 else 0
+        StateManager.Set(f"{self.RecipePath()}.steps.{step}",
+                         {"text": text, "done": False})
+        self.newStep.clear()
+
+    def RemoveSelected(self):
+        if self.recipe is None:
+            return
+        selected = {self.checklist.StepKey(index)
+                    for index in self.steps.selectionModel().selectedRows()}
+        if len(selected) == 0:
+            return
+
+        path = f"{self.RecipePath()}.steps"
+        try:
+            with StateManager.transaction():
+                steps = StateManager.Get(path, {})
+                kept = [steps[k] for k in sorted(steps, key=RecipeChecklistModel.StepOrder)
+                        if k not in selected]
+                # Step keys are their position, the ones after a removed
+                # step move up
+                StateManager.Set(path, {str(i): step for i, step in enumerate(kept)})
+                current = StateManager.Get("current", {})
+                step = current.get("step", 0)
+                if current.get("recipe") == self.recipe and isinstance(step, int):
+                    # Moves up by the removed steps before it, onto the
+                    # next kept one if it was removed itself
+                    order = RecipeChecklistModel.StepOrder(str(step))
+                    moved = sum(1 for k in steps if k not in selected and
+                                RecipeChecklistModel.StepOrder(k) < order)
+                    if moved != step:
+                        StateManager.Set("current.step", moved)
+        except Exception as e:
+            logger.error(traceback.format_exc())
@@ -0,0 +1,452 @@
+import hashlib
+import os
+import re
+import shutil
+import tarfile
+import time
+import traceback
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urljoin
+import orjson
+from loguru import logger
+from ..Metrics import Metrics
+from .TSHFileHelper import write_atomically
+from .TSHHttpHelper import http_session
+
+
+class ArchiveChanged(IOError):
+    """The archive changed on the server since the part file was started."""
+
+
+class PackStream:
+    """Readable stream over a pack archive being downloaded, for tarfile's
+    streaming mode.
+
+    Every byte received is appended to `partFile` and hashed as it goes
+    by. Bytes already in `partFile` (from an interrupted download) are
+    replayed from disk first and the download continues with a Range
+    request from there, and a connection lost midway is resumed the same
+    way, up to `retries` times in a row. The ETag of the archive is kept
+    next to the part file and sent as If-Range, so a later run does not
+    resume onto a different version; ArchiveChanged is raised when the
+    server says it changed.
+    """
+
+    chunkSize = 1 << 16
+
+    def __init__(self, session, url, partFile, timeout=10, retries=5, retryDelay=1.0, progress=None):
+        self.session = session
+        self.url = url
+        self.timeout = timeout
+        self.retries = retries
+        self.retryDelay = retryDelay
+        self.progress = progress
+        self.sha256 = hashlib.sha256()
+        self.offset = 0
+        self.total = None
+        self.etagFile = partFile + ".etag"
+        self.etag = None
+        self.response = None
+        self.complete = False
+
+        self.part = open(partFile, 'ab')
+        self.resumedFrom = self.part.tell()
+        self.replay = open(partFile, 'rb') if self.resumedFrom > 0 else None
+        if self.resumedFrom > 0:
+            try:
+                with open(self.etagFile, 'r', encoding='utf-8') as file:
+                    self.etag = file.read() or None
+            except FileNotFoundError:
+                pass
+
+    def read(self, size=-1):
+        if size is None or size < 0:
+            size = PackStream.chunkSize
+
+        failures = 0
+        while True:
+            try:
+                if self.response is None and not self.complete:
+                    # Before anything is replayed too, so that a part of
+                    # another version of the archive is thrown away unread
+                    self.Connect(self.resumedFrom if self.replay is not None else self.offset)
+                if self.replay is not None:
+                    data = self.replay.read(min(size, self.resumedFrom - self.offset))
+                    if self.offset + len(data) >= self.resumedFrom or data == b"":
+                        self.replay.close()
+                        self.replay = None
+                    if data != b"":
+                        return self.Consumed(data)
+                if self.response is None:
+                    return b""
+                data = self.response.raw.read(size)
+                if data == b"" and self.total is not None and self.offset < self.total:
+                    raise IOError(
+                        f"Connection closed at {self.offset} of {self.total} bytes")
+                if data != b"":
+                    self.part.write(data)
+                return self.Consumed(data)
+            except ArchiveChanged:
+                self.Disconnect()
+                raise
+            except Exception as e:
+                self.Disconnect()
+                failures += 1
+                if failures > self.retries:
+                    raise
+                logger.warning(
+                    f"Download of {self.url} interrupted at {self.offset} bytes ({e}), resuming")
+                time.sleep(self.retryDelay * failures)
+
+    def Consumed(self, data):
+        self.sha256.update(data)
+        self.offset += len(data)
+        if self.progress is not None:
+            self.progress(self.offset, self.total)
+        return data
+
+    def Connect(self, start):
+        headers = {"Accept-Encoding": "identity"}
+        if start > 0:
+            headers["Range"] = f"bytes={start}-"
+            if self.etag:
+                headers["If-Range"] = self.etag
+        r = self.session.get(self.url, headers=headers,
+                             stream=True, timeout=self.timeout)
+        if r.status_code == 416 and start > 0:
+            # Nothing left after what was already read
+            r.close()
+            self.total = start
+            self.complete = True
+            return
+        if r.status_code not in (200, 206):
+            r.close()
+            raise IOError(f"HTTP {r.status_code}")
+        etag = r.headers.get("ETag")
+        if r.status_code == 200 and start > 0 and self.etag is not None and etag != self.etag:
+            if self.offset > 0:
+                r.close()
+                raise ArchiveChanged(f"{self.url} changed after {self.offset} bytes of it were read")
+            # Another version than the part file, start over with this one
+            logger.info(f"{self.url} changed since it was partly downloaded, starting over")
+            self.replay.close()
+            self.replay = None
+            self.part.truncate(0)
+            self.resumedFrom = 0
+            start = 0
+        if etag is not None and etag != self.etag:
+            self.etag = etag
+            with open(self.etagFile, 'w', encoding='utf-8') as file:
+                file.write(etag)
+
+        if r.status_code == 206:
+            # bytes start-end/total
+            total = r.headers.get("Content-Range", "").rpartition("/")[2]
+            self.total = int(total) if total.isdigit() else None
+        else:
+            length = r.headers.get("Content-Length")
+            self.total = int(length) if length is not None and length.isdigit() else None
+            if start > 0:
+                # The whole file again, skip what was already read
+                skipped = 0
+                while skipped < start:
+                    data = r.raw.read(min(PackStream.chunkSize, start - skipped))
+                    if data == b"":
+                        r.close()
+                        raise IOError("File shorter than what was already read")
+                    skipped += len(data)
+        self.response = r
+
+    def Disconnect(self):
+        if self.response is not None:
+            try:
+                self.response.close()
+            except Exception as e:
+                pass
+            self.response = None
+
+    def Drain(self):
+        """Reads what tarfile left unread, for the checksum."""
+        while self.read(PackStream.chunkSize) != b"":
+            pass
+
+    def close(self):
+        self.Disconnect()
+        if self.replay is not None:
+            self.replay.close()
+            self.replay = None
+        self.part.close()
+
+
+class AssetPackInstaller:
+    """Installs and updates asset packs (tar archives, compressed or not)
+    listed in a JSON index:
+
+        {"<pack>": {"url": "<archive, may be relative to the index>",
+                    "version": "...", "sha256": "<of the archive>",
+                    "size": <archive bytes>,
+                    "files": {"<path in the archive>": "<sha256>", ...}}}
+
+    Only "url" is required. Packs are installed under `root/<pack>`,
+    with a `.manifest.json` holding what was installed.
+
+    An archive is streamed (see PackStream, which resumes interrupted
+    downloads) and its members are extracted to a staging folder as they
+    arrive. Members whose hash matches the installed manifest are not
+    written at all. Once the whole archive checks out against "sha256",
+    the changed files are moved into place and files the pack no longer
+    has are removed, so a failed download leaves the installed pack as it
+    was. Packs are installed in parallel by `workers` threads.
+
+    `progress(pack, bytesRead, totalBytes)` is called from the worker
+    threads as data arrives.
+    """
+
+    manifestName = ".manifest.json"
+
+    def __init__(self, indexUrl, root="./user_data/packs", workers=3, session=None,
+                 timeout=10, retries=5, retryDelay=1.0, progress=None):
+        self.indexUrl = indexUrl
+        self.root = root
+        self.workers = workers
+        self.timeout = timeout
+        self.retries = retries
+        self.retryDelay = retryDelay
+        self.progress = progress
+
+        if session is None:
+            session = http_session(workers)
+        self.session = session
+
+    def FetchIndex(self):
+        r = self.session.get(self.indexUrl, timeout=self.timeout)
+        r.raise_for_status()
+        return orjson.loads(r.content)
+
+    def PackDir(self, pack):
+        return os.path.join(self.root, pack)
+
+    def Installed(self, pack):
+        """The manifest of the installed pack, {} if there is none."""
+        try:
+            with open(os.path.join(self.PackDir(pack), AssetPackInstaller.manifestName), 'rb') as file:
+                return orjson.loads(file.read())
+        except FileNotFoundError:
+            return {}
+        except Exception as e:
+            logger.error(traceback.format_exc())
+            return {}
+
+    def Updates(self, index=None):
+        """{pack: {"installed": version or None, "available": version,
+        "files": changed file count or None}} for packs that are not
+        installed or differ from the index."""
+        index = self.FetchIndex() if index is None else index
+        updates = {}
+        for pack, entry in index.items():
+            installed = self.Installed(pack)
+            if AssetPackInstaller.UpToDate(installed, entry):
+                continue
+            changed = None
+            if "files" in entry:
+                changed = len(AssetPackInstaller.Diff(
+                    installed.get("files", {}), entry["files"])[0])
+            updates[pack] = {"installed": installed.get("version"),
+                             "available": entry.get("version"), "files": changed}
+        return updates
+
+    def UpToDate(installed, entry):
+        if installed == {}:
+            return False
+        if entry.get("sha256"):
+            return installed.get("sha256") == entry["sha256"]
+        if entry.get("version"):
+            return installed.get("version") == entry["version"]
+        return False
+
+    def Diff(installed, available):
+        """(paths to write, paths to remove) going from one file manifest
+        to the other."""
+        changed = [path for path, digest in available.items()
+                   if installed.get(path) != digest]
+        removed = [path for path in installed if path not in available]
+        return changed, removed
+
+    def Install(self, packs=None, index=None):
+        """Installs or updates `packs` (all of the index by default).
+        Returns {pack: result}, see InstallPack."""
+        index = self.FetchIndex() if index is None else index
+        packs = list(index) if packs is None else packs
+        with ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="AssetPacks") as executor:
+            futures = {pack: executor.submit(self.InstallPack, pack, index.get(pack))
+                       for pack in packs}
+            return {pack: future.result() for pack, future in futures.items()}
+
+    def InstallPack(self, pack, entry):
+        """Returns {"status": "updated", "up_to_date" or "error",
+        "written", "unchanged", "removed", "bytes", "resumedFrom", "error"}."""
+        result = {"status": "error", "written": 0, "unchanged": 0, "removed": 0,
+                  "bytes": 0, "resumedFrom": 0, "error": None}
+        start = Metrics.Start()
+        try:
+            if entry is None or "url" not in entry:
+                raise ValueError(f"{pack} is not in the index")
+            if AssetPackInstaller.SafePath(pack) is None:
+                raise ValueError(f"Invalid pack name {pack}")
+            installed = self.Installed(pack)
+            if AssetPackInstaller.UpToDate(installed, entry):
+                result["status"] = "up_to_date"
+                return result
+            try:
+                self.Download(pack, entry, installed, result)
+            except ArchiveChanged as e:
+                # Its part file is gone, start over once
+                logger.warning(f"{e}, downloading {pack} again")
+                self.Download(pack, entry, installed, result)
+            result["status"] = "updated"
+        except Exception as e:
+            logger.error(traceback.format_exc())
+            result["error"] = str(e)
+        finally:
+            Metrics.Stop("tsh_asset_pack_seconds", start, result=result["status"])
+        return result
+
+    def Download(self, pack, entry, installed, result):
+        result.update(written=0, unchanged=0, removed=0, bytes=0)
+        url = urljoin(self.indexUrl, entry["url"])
+        expected = entry.get("sha256")
+        files = entry.get("files")
+        installedFiles = installed.get("files", {})
+        packDir = self.PackDir(pack)
+        staging = os.path.join(self.root, ".staging", pack)
+        partDir = os.path.join(self.root, ".partial")
+        os.makedirs(partDir, exist_ok=True)
+        # Named after the archive's hash, so a part of an older version is
+        # never resumed
+        partFile = os.path.join(partDir, f"{pack}-{(expected or 'latest')[:16]}.part")
+        # Only this pack's own parts, not those of a pack named "<pack>-..."
+        ownPart = re.compile(re.escape(pack) + r"-(?:[0-9a-f]{16}|latest)\.part(?:\.etag)?")
+        for name in os.listdir(partDir):
+            if ownPart.fullmatch(name) and \
+                    os.path.join(partDir, name) not in (partFile, partFile + ".etag"):
+                os.remove(os.path.join(partDir, name))
+        if not expected and not os.path.exists(partFile + ".etag"):
+            # Nothing tells whether a part left by an earlier run is of the
+            # same archive
+            AssetPackInstaller.RemovePart(partFile)
+        shutil.rmtree(staging, ignore_errors=True)
+
+        def Progress(done, total):
+            if self.progress is not None:
+                self.progress(pack, done, total or entry.get("size") or 0)
+
+        stream = PackStream(self.session, url, partFile, timeout=self.timeout, retries=self.retries,
+                            retryDelay=self.retryDelay, progress=Progress)
+        result["resumedFrom"] = stream.resumedFrom
+        # path -> sha256 of everything in the archive, and the staged ones
+        newFiles = {}
+        staged = []
+        # Folders known to exist
+        made = set()
+        try:
+            with tarfile.open(fileobj=stream, mode="r|*") as archive:
+                for member in archive:
+                    if not member.isfile():
+                        continue
+                    path = AssetPackInstaller.SafePath(member.name)
+                    if path is None:
+                        raise ValueError(f"Unsafe path in archive: {member.name}")
+                    target = os.path.join(packDir, path)
+                    known = files.get(path) if files is not None else None
+                    if known is not None and installedFiles.get(path) == known and os.path.isfile(target):
+                        # Unchanged, tarfile skips its data
+                        newFiles[path] = known
+                        result["unchanged"] += 1
+                        continue
+
+                    stagedFile = os.path.join(staging, path)
+                    AssetPackInstaller.MakeDirs(os.path.dirname(stagedFile), made)
+                    digest = AssetPackInstaller.Extract(archive.extractfile(member), stagedFile)
+                    if known is not None and digest != known:
+                        raise ValueError(f"Checksum mismatch for {path} in {pack}")
+                    newFiles[path] = digest
+                    if installedFiles.get(path) == digest and os.path.isfile(target):
+                        os.remove(stagedFile)
+                        result["unchanged"] += 1
+                    else:
+                        staged.append(path)
+            stream.Drain()
+        except ArchiveChanged:
+            AssetPackInstaller.RemovePart(partFile)
+            raise
+        finally:
+            stream.close()
+        result["bytes"] = stream.offset
+
+        digest = stream.sha256.hexdigest()
+        if expected and digest != expected:
+            AssetPackInstaller.RemovePart(partFile)
+            shutil.rmtree(staging, ignore_errors=True)
+            raise ValueError(f"Checksum mismatch for {pack}: got {digest}")
+        if files is not None and set(files) != set(newFiles):
+            shutil.rmtree(staging, ignore_errors=True)
+            raise ValueError(f"{pack} does not have the files its index lists")
+
+        # Everything checked out, swap the changed files in
+        for path in staged:
+            target = os.path.join(packDir, path)
+            AssetPackInstaller.MakeDirs(os.path.dirname(target), made)
+            os.replace(os.path.join(staging, path), target)
+        _, removed = AssetPackInstaller.Diff(installedFiles, newFiles)
+        for path in removed:
+            try:
+                os.remove(os.path.join(packDir, path))
+            except FileNotFoundError:
+                pass
+        result["written"] = len(staged)
+        result["removed"] = len(removed)
+        Metrics.Count("tsh_asset_files_total", len(staged), result="written")
+        Metrics.Count("tsh_asset_files_total", result["unchanged"], result="unchanged")
+
+        self.SaveManifest(pack, {"version": entry.get("version"), "sha256": digest,
+                                 "files": newFiles})
+        shutil.rmtree(staging, ignore_errors=True)
+        AssetPackInstaller.RemovePart(partFile)
+
+    def RemovePart(partFile):
+        for path in (partFile, partFile + ".etag"):
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+
+    def Extract(source, stagedFile):
+        """Copies a member to `stagedFile`, returning its sha256."""
+        sha256 = hashlib.sha256()
+        with open(stagedFile, 'wb') as file:
+            while True:
+                data = source.read(PackStream.chunkSize)
+                if data == b"":
+                    break
+                sha256.update(data)
+                file.write(data)
+        return sha256.hexdigest()
+
+    def MakeDirs(directory, made):
+        if directory not in made:
+            os.makedirs(directory, exist_ok=True)
+            made.add(directory)
+
+    def SafePath(name):
+        """`name` as a relative path inside its folder, None if it would
+        end up outside of it."""
+        path = os.path.normpath(name.replace("\\", "/")).replace("\\", "/")
+        if path.startswith("/") or path == ".." or path.startswith("../") or \
+                os.path.isabs(path) or ":" in path or path in ("", "."):
+            return None
+        return path
+
+    def SaveManifest(self, pack, manifest):
+        manifestFile = os.path.join(self.PackDir(pack), AssetPackInstaller.manifestName)
+        os.makedirs(os.path.dirname(manifestFile), exist_ok=True)
+        write_atomically(manifestFile, orjson.dumps(manifest, option=orjson.OPT_INDENT_2))
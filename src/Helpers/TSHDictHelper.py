@@ -1,30 +1,327 @@
 """This script is 100% torn from Tournament Stream Helper"""
-from functools import reduce
+from collections.abc import ItemsView, Mapping, ValuesView
+from functools import lru_cache
 from msgpack import unpackb, packb
 
 
+class KeyPath:
+    """A dotted key ("a.b.c") split once, ready to be walked many times.
+
+    Get instances through compile_path so every distinct key is only parsed
+    once.
+    """
+    __slots__ = ("path", "keys", "parents", "last")
+
+    def __init__(self, path):
+        self.path = path
+        self.keys = tuple(path.split("."))
+        self.parents = self.keys[:-1]
+        self.last = self.keys[-1]
+
+    def get(self, dictionary, default=None):
+        d = dictionary
+        for key in self.keys:
+            if not isinstance(d, mapping_types):
+                return default
+            d = d.get(key, default)
+        return d
+
+    def exists(self, dictionary):
+        d = dictionary
+        for key in self.keys:
+            if not isinstance(d, mapping_types) or key not in d:
+                return False
+            d = d[key]
+        return True
+
+    def parent(self, dictionary):
+        d = dictionary
+        for key in self.parents:
+            if key not in d:
+                d[key] = {}
+            d = d[key]
+        return d
+
+    def set(self, dictionary, value):
+        self.parent(dictionary)[self.last] = value
+
+    def unset(self, dictionary):
+        d = dictionary
+        for key in self.parents:
+            if not isinstance(d, mapping_types) or key not in d:
+                return
+            d = d[key]
+        if isinstance(d, mapping_types) and self.last in d:
+            del d[self.last]
+
+    def assoc(self, dictionary, value, owned):
+        """Copy-on-write set, returns the new root.
+
+        Dicts along the path are shallow copied unless they are in `owned`
+        (id -> dict, the dicts this writer already copied), everything off
+        the path is shared with `dictionary`.
+        """
+        root = own(dictionary, owned)
+        d = root
+        for key in self.parents:
+            if key not in d:
+                child = {}
+                owned[id(child)] = child
+            else:
+                child = own(d[key], owned)
+            d[key] = child
+            d = child
+        d[self.last] = value
+        return root
+
+    def dissoc(self, dictionary, owned):
+        """Copy-on-write unset, returns the new root."""
+        if not self.exists(dictionary):
+            return dictionary
+        root = own(dictionary, owned)
+        d = root
+        for key in self.parents:
+            child = own(d[key], owned)
+            d[key] = child
+            d = child
+        del d[self.last]
+        return root
+
+
+class PersistentMap(Mapping):
+    """A read-only looking mapping that is cheap to copy on write, for
+    levels of the state too wide to shallow copy on every change.
+
+    A hash trie: nodes are lists of 32 slots indexed by 5 bits of the key
+    hash, holding a child node or a small dict of the keys ending there.
+    Copies share every node, and writing a key only copies the nodes on
+    its way down, a few short lists whatever the size, unless they are in
+    `owned` (as for `own`). Writes are only meant for copies made with
+    `own`, through item assignment and deletion.
+    """
+    __slots__ = ("root", "count", "owned")
+
+    leafSize = 8
+
+    def __init__(self, items=None, owned=None):
+        self.owned = owned if owned is not None else {}
+        if not isinstance(items, Mapping):
+            items = dict(items or ())
+        items = list(items.items())
+        self.root = self.Build([(hash(k), k, v) for k, v in items], 0)
+        self.count = len(items)
+
+    def Build(self, entries, shift):
+        # Whole levels at once, much cheaper than inserting one by one.
+        # Keys that appear twice are taken care of by the leaf dicts.
+        node = [None] * 32
+        self.owned[id(node)] = node
+        buckets = {}
+        for entry in entries:
+            buckets.setdefault((entry[0] >> shift) & 31, []).append(entry)
+        for i, bucket in buckets.items():
+            if len(bucket) <= PersistentMap.leafSize or shift >= 60:
+                leaf = {k: v for h, k, v in bucket}
+                self.owned[id(leaf)] = leaf
+                node[i] = leaf
+            else:
+                node[i] = self.Build(bucket, shift + 5)
+        return node
+
+    def Copy(self, owned):
+        copy = PersistentMap.__new__(PersistentMap)
+        copy.root = self.root
+        copy.count = self.count
+        copy.owned = owned
+        return copy
+
+    def Own(self, node):
+        if self.owned.get(id(node)) is node:
+            return node
+        node = node.copy()
+        self.owned[id(node)] = node
+        return node
+
+    def get(self, key, default=None):
+        h = hash(key)
+        node = self.root
+        shift = 0
+        while True:
+            slot = node[(h >> shift) & 31]
+            if slot.__class__ is list:
+                node = slot
+                shift += 5
+            elif slot is None:
+                return default
+            else:
+                return slot.get(key, default)
+
+    def __getitem__(self, key):
+        value = self.get(key, _missing)
+        if value is _missing:
+            raise KeyError(key)
+        return value
+
+    def __contains__(self, key):
+        return self.get(key, _missing) is not _missing
+
+    def __setitem__(self, key, value):
+        h = hash(key)
+        self.root = node = self.Own(self.root)
+        shift = 0
+        while True:
+            i = (h >> shift) & 31
+            slot = node[i]
+            if slot.__class__ is list:
+                node[i] = node = self.Own(slot)
+                shift += 5
+            elif slot is None:
+                leaf = {key: value}
+                self.owned[id(leaf)] = leaf
+                node[i] = leaf
+                self.count += 1
+                return
+            elif key in slot or len(slot) < PersistentMap.leafSize or shift >= 60:
+                if key not in slot:
+                    self.count += 1
+                node[i] = leaf = self.Own(slot)
+                leaf[key] = value
+                return
+            else:
+                # Full leaf, push its keys one level down
+                node[i] = node = self.Build(
+                    [(hash(k), k, v) for k, v in slot.items()], shift + 5)
+                shift += 5
+
+    def __delitem__(self, key):
+        if key not in self:
+            raise KeyError(key)
+        h = hash(key)
+        self.root = node = self.Own(self.root)
+        shift = 0
+        while True:
+            i = (h >> shift) & 31
+            slot = node[i]
+            if slot.__class__ is list:
+                node[i] = node = self.Own(slot)
+                shift += 5
+            else:
+                if len(slot) == 1:
+                    node[i] = None
+                else:
+                    node[i] = leaf = self.Own(slot)
+                    del leaf[key]
+                self.count -= 1
+                return
+
+    def Walk(self):
+        stack = [self.root]
+        while stack:
+            for slot in stack.pop():
+                if slot.__class__ is list:
+                    stack.append(slot)
+                elif slot is not None:
+                    yield from slot.items()
+
+    def __iter__(self):
+        for k, v in self.Walk():
+            yield k
+
+    def __len__(self):
+        return self.count
+
+    def items(self):
+        return PersistentItems(self)
+
+    def values(self):
+        return PersistentValues(self)
+
+    def __repr__(self):
+        return f"PersistentMap({dict(self.Walk())!r})"
+
+
+class PersistentItems(ItemsView):
+    def __iter__(self):
+        return self._mapping.Walk()
+
+
+class PersistentValues(ValuesView):
+    def __iter__(self):
+        for k, v in self._mapping.Walk():
+            yield v
+
+
+_missing = object()
+mapping_types = (dict, PersistentMap)
+
+
+def plain(value):
+    """`default` for orjson and msgpack: PersistentMaps as dicts."""
+    if isinstance(value, PersistentMap):
+        return dict(value.Walk())
+    raise TypeError(f"Type is not serializable: {type(value).__name__}")
+
+
+def own(dictionary, owned):
+    if owned.get(id(dictionary)) is dictionary:
+        return dictionary
+    if isinstance(dictionary, PersistentMap):
+        copy = dictionary.Copy(owned)
+    else:
+        copy = dict(dictionary)
+    owned[id(copy)] = copy
+    return copy
+
+
+@lru_cache(maxsize=4096)
+def compile_path(keys):
+    return KeyPath(keys)
+
+
 def deep_get(dictionary, keys, default=None):
-    return reduce(lambda d, key: d.get(key, default) if isinstance(d, dict) else default, keys.split("."), dictionary)
+    return compile_path(keys).get(dictionary, default)
+
+
+def deep_exists(dictionary, keys):
+    return compile_path(keys).exists(dictionary)
 
 
 def deep_set(dictionary, keys, value):
-    d = dictionary
-    for key in keys.split(".")[:-1]:
-        if key not in d:
-            d[key] = {}
-        d = d[key]
-    d[keys.split(".")[-1]] = value
+    compile_path(keys).set(dictionary, value)
 
 
 def deep_unset(dictionary, keys):
-    d = dictionary
-    for key in keys.split(".")[:-1]:
-        if key not in d:
-            d[key] = {}
-        d = d[key]
-    if keys.split(".")[-1] in d:
-        del d[keys.split(".")[-1]]
+    compile_path(keys).unset(dictionary)
+
+
+def deep_assoc(dictionary, keys, value, owned):
+    return compile_path(keys).assoc(dictionary, value, owned)
+
+
+def deep_dissoc(dictionary, keys, owned):
+    return compile_path(keys).dissoc(dictionary, owned)
 
-def deep_clone(dictionary):
-    return unpackb(packb(dictionary), strict_map_key=False)
 
+def deep_get_many(dictionary, keys, default=None):
+    return [compile_path(k).get(dictionary, default) for k in keys]
+
+
+def deep_set_many(dictionary, items):
+    # Siblings in a row share their parent lookup
+    lastParents = None
+    d = None
+    for keys, value in items:
+        path = compile_path(keys)
+        if path.parents != lastParents:
+            d = path.parent(dictionary)
+            lastParents = path.parents
+        d[path.last] = value
+
+
+def deep_unset_many(dictionary, keys):
+    for k in keys:
+        compile_path(k).unset(dictionary)
+
+
+def deep_clone(dictionary):
+    return unpackb(packb(dictionary, default=plain), strict_map_key=False)
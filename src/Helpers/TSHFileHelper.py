@@ -0,0 +1,20 @@
+import os
+import shutil
+
+
+def write_atomically(path, data, sync=True, keepMode=False):
+    """Replaces `path` with `data` without ever exposing a partial file.
+
+    With `sync` the data reaches the disk before the rename, so a crash
+    leaves either file whole. Files that are cheap to rebuild can skip
+    it. With `keepMode` the new file gets the old one's permissions.
+    """
+    tmpPath = path + ".tmp"
+    with open(tmpPath, 'wb') as file:
+        file.write(data)
+        if sync:
+            file.flush()
+            os.fsync(file.fileno())
+    if keepMode:
+        shutil.copymode(path, tmpPath)
+    os.replace(tmpPath, path)
@@ -0,0 +1,11 @@
+def http_session(workers):
+    """A keep-alive requests session pooling `workers` connections per
+    host, one for each thread sharing it."""
+    # requests is only paid for once something is downloaded
+    import requests
+    session = requests.Session()
+    adapter = requests.adapters.HTTPAdapter(
+        pool_connections=workers, pool_maxsize=workers)
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+    return session
@@ -0,0 +1,290 @@
+import bisect
+import gc
+import heapq
+import itertools
+import re
+import threading
+import unicodedata
+from array import array
+from collections import Counter
+
+
+class SearchIndex:
+    """Ranked, typo tolerant search over a catalog of (key, text) entries.
+
+    Every word of the query has to match a word of the text, ranked from
+    best to worst: the same word, a word starting with it, a word
+    containing it, a misspelling of it (sharing enough trigrams). A text
+    ranks as its worst matched word, and texts equal to or starting with
+    the whole query come before everything else. Case and accents are
+    ignored.
+
+    Matching happens on the vocabulary (the distinct words), which is far
+    smaller than the catalog: a sorted word list for prefixes and a
+    trigram index of the words for substrings and typos. Entries are then
+    collected through per-word posting lists, starting with the rarest
+    query word and its best alternatives, and stopping once enough
+    results that nothing left could beat are found. So a search costs
+    about as much as its results, not the size of the catalog.
+
+    Add/Remove are cheap: removed entries are tombstoned and dropped
+    once they make up half of the index. Bulk builds pause the garbage
+    collector, which would otherwise walk the growing index over and over
+    while nothing in it can be garbage. Thread safe.
+    """
+
+    # Share of a word's trigrams a misspelling must have
+    fuzzyThreshold = 0.5
+    # The sorted text list takes new entries in batches of this many
+    recentLimit = 4096
+
+    separators = re.compile(r"[\W_]+")
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.Clear()
+
+    def Clear(self):
+        # Entry id -> (key, original text, normalized text, words), None
+        # once removed
+        self.entries = []
+        # Entry id -> length of its normalized text, to rank by
+        self.lengths = array("l")
+        self.ids = {}
+        self.removed = 0
+        # Sorted (normalized text, id) and the ones added since, kept
+        # sorted too
+        self.texts = []
+        self.recentTexts = []
+        # word -> array of entry ids, the sorted words and
+        # trigram -> words having it
+        self.postings = {}
+        self.vocabulary = []
+        self.wordTrigrams = {}
+
+    def Normalize(text):
+        text = str(text).casefold()
+        if not text.isascii():
+            text = "".join(c for c in unicodedata.normalize("NFKD", text)
+                           if not unicodedata.combining(c))
+        return SearchIndex.separators.sub(" ", text).strip()
+
+    def Trigrams(word):
+        # Padded in front so the start of a word counts. Not at the end,
+        # the last word of a query may still be being typed.
+        word = f" {word}"
+        return {word[i:i+3] for i in range(len(word) - 2)}
+
+    def Build(self, items):
+        """Replaces the whole catalog with (key, text) pairs, in bulk."""
+        with self.lock:
+            self.Rebuild(items)
+
+    def Add(self, key, text):
+        """Adds or replaces the entry for `key`."""
+        with self.lock:
+            old = self.ids.get(key)
+            if old is not None:
+                if self.entries[old][1] == text:
+                    return
+                self.RemoveEntry(old)
+            self.AddEntry(key, text)
+            if len(self.recentTexts) > SearchIndex.recentLimit:
+                self.MergeTexts()
+
+    def Remove(self, key):
+        with self.lock:
+            entry = self.ids.get(key)
+            if entry is not None:
+                self.RemoveEntry(entry)
+
+    def AddEntry(self, key, text, bulk=False):
+        entry = len(self.entries)
+        normalized = SearchIndex.Normalize(text)
+        words = tuple(set(normalized.split(" "))) if normalized != "" else ()
+        self.entries.append((key, text, normalized, words))
+        self.lengths.append(len(normalized))
+        self.ids[key] = entry
+        if bulk:
+            self.recentTexts.append((normalized, entry))
+        else:
+            bisect.insort(self.recentTexts, (normalized, entry))
+
+        for word in words:
+            postings = self.postings.get(word)
+            if postings is None:
+                postings = self.postings[word] = array("l")
+                if bulk:
+                    self.vocabulary.append(word)
+                else:
+                    bisect.insort(self.vocabulary, word)
+                for trigram in SearchIndex.Trigrams(word):
+                    self.wordTrigrams.setdefault(trigram, []).append(word)
+            postings.append(entry)
+
+    def RemoveEntry(self, entry):
+        del self.ids[self.entries[entry][0]]
+        self.entries[entry] = None
+        self.removed += 1
+        if self.removed * 2 > len(self.entries):
+            self.Rebuild([entry[:2] for entry in self.entries if entry is not None])
+
+    def Rebuild(self, items):
+        self.Clear()
+        enabled = gc.isenabled()
+        gc.disable()
+        try:
+            for key, text in items:
+                self.AddEntry(key, text, bulk=True)
+        finally:
+            if enabled:
+                gc.enable()
+        self.vocabulary.sort()
+        self.MergeTexts()
+
+    def MergeTexts(self):
+        self.texts = sorted(t for t in self.texts + self.recentTexts
+                            if self.entries[t[1]] is not None)
+        self.recentTexts = []
+
+    def __len__(self):
+        return len(self.ids)
+
+    def Search(self, query, limit=50):
+        """Up to `limit` (key, text) pairs, best match first."""
+        query = SearchIndex.Normalize(query)
+        with self.lock:
+            if query == "":
+                return [self.entries[e][:2] for _, e in self.texts[:limit]
+                        if self.entries[e] is not None]
+
+            found = {}
+            self.Prefixed(query, found, limit)
+            self.Matching(query.split(" "), found, limit)
+
+            entries = self.entries
+            ranked = sorted(found.items(), key=lambda item: (
+                item[1], len(entries[item[0]][2]), entries[item[0]][2]))
+            return [entries[e][:2] for e, _ in ranked[:limit]]
+
+    def Prefixed(self, query, found, limit):
+        """Texts equal to (-2) or starting with (-1) the query."""
+        for texts in (self.texts, self.recentTexts):
+            i = bisect.bisect_left(texts, (query,))
+            while i < len(texts) and len(found) < limit and texts[i][0].startswith(query):
+                text, entry = texts[i]
+                if self.entries[entry] is not None:
+                    found[entry] = -2 if text == query else -1
+                i += 1
+
+    def Alternatives(self, word):
+        """{vocabulary word: score} of the words `word` can stand for."""
+        alternatives = {}
+        i = bisect.bisect_left(self.vocabulary, word)
+        while i < len(self.vocabulary) and self.vocabulary[i].startswith(word):
+            alternatives[self.vocabulary[i]] = 0 if self.vocabulary[i] == word else 1
+            i += 1
+
+        if len(word) >= 3:
+            trigrams = SearchIndex.Trigrams(word)
+            # A word containing it has all but the leading trigram
+            inner = len(trigrams) - 1
+            needed = max(2, int(len(trigrams) * SearchIndex.fuzzyThreshold + 0.999))
+            counts = Counter()
+            for trigram in trigrams:
+                counts.update(self.wordTrigrams.get(trigram, ()))
+            for candidate, shared in counts.items():
+                if candidate in alternatives:
+                    continue
+                if shared >= inner and word in candidate:
+                    alternatives[candidate] = 2
+                elif shared >= needed:
+                    # 3, 3.25 or 3.5 as fewer trigrams are shared
+                    alternatives[candidate] = 3 + round(
+                        (1 - shared / len(trigrams)) * 4) / 4
+        return alternatives
+
+    def Matching(self, words, found, limit):
+        """Texts with a match for every word, scored as the worst one.
+
+        Goes through the score levels best first. At each level the
+        entries matching every word are the intersection of each word's
+        postings up to that level, starting from the rarest word. Words
+        much more common than what is left are checked against each
+        candidate's own words rather than turned into a set, and so are
+        words of one or two letters, after all the others.
+        """
+        alternatives = [self.Alternatives(w) for w in words]
+        if any(len(a) == 0 for a in alternatives):
+            return
+
+        entries = self.entries
+        postings = self.postings
+        sizes = [sum(len(postings[w]) for w in a) for a in alternatives]
+        order = sorted(range(len(words)), key=sizes.__getitem__)
+        # Each word's postings up to the current level, filled in lazily
+        pending = [sorted((s, w) for w, s in a.items()) for a in alternatives]
+        unions = [set() for _ in words]
+        added = [0] * len(words)
+
+        def Union(i, level):
+            while added[i] < len(pending[i]) and pending[i][added[i]][0] <= level:
+                unions[i].update(postings[pending[i][added[i]][1]])
+                added[i] += 1
+            return unions[i]
+
+        # Nothing can match before every word has an alternative
+        start = max(min(a.values()) for a in alternatives)
+        for level in sorted({s for a in alternatives for s in a.values() if s >= start}):
+            needed = limit - len(found)
+            if needed <= 0:
+                return
+
+            first = order[0]
+            if len(words) == 1 and sum(len(postings[w]) for s, w in pending[first]
+                                       if s == level) > 64 * limit:
+                # Far more than needed, take them as they come
+                for s, w in pending[first]:
+                    if s != level:
+                        continue
+                    for entry in postings[w]:
+                        if entry not in found and entries[entry] is not None:
+                            found[entry] = level
+                            if len(found) >= limit:
+                                return
+                continue
+
+            # Left as the cached union until something narrows it
+            candidates = Union(first, level)
+            if len(found) > 0:
+                candidates = candidates - found.keys()
+            short = []
+            for i in order[1:]:
+                if len(candidates) == 0:
+                    break
+                if len(words[i]) <= 2 and sum(len(postings[w]) for s, w in pending[i]
+                                              if s <= level) > len(candidates):
+                    # Starts a good share of the vocabulary, checked last
+                    # and only as far as needed
+                    short.append({w for w, s in alternatives[i].items() if s <= level})
+                elif sizes[i] <= 8 * len(candidates):
+                    candidates = candidates & Union(i, level)
+                else:
+                    matches = {w for w, s in alternatives[i].items() if s <= level}
+                    candidates = {e for e in candidates
+                                  if entries[e] is not None and not matches.isdisjoint(entries[e][3])}
+
+            new = candidates
+            if self.removed > 0:
+                new = (e for e in new if entries[e] is not None)
+            if len(short) > 0:
+                new = (e for e in new if all(not m.isdisjoint(entries[e][3]) for m in short))
+            if len(short) > 0 and len(candidates) > 64 * limit:
+                # Far more than needed, take them as they come
+                new = list(itertools.islice(new, needed))
+            else:
+                new = list(new)
+            if len(new) > needed:
+                new = heapq.nsmallest(needed, new, key=self.lengths.__getitem__)
+            for entry in new:
+                found[entry] = level
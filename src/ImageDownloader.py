@@ -0,0 +1,160 @@
+import hashlib
+import io
+import os
+import shutil
+import threading
+import traceback
+from concurrent.futures import ThreadPoolExecutor
+import orjson
+from loguru import logger
+from .Metrics import Metrics
+from .Helpers.TSHFileHelper import write_atomically
+from .Helpers.TSHHttpHelper import http_session
+
+
+class ImageDownloader:
+    """Downloads images through a fixed pool of workers and a disk cache.
+
+    All requests share one keep-alive session. Files are cached under
+    `cacheDir`, named by a hash of the URL and the ETag the server sent.
+    Cached URLs are revalidated with If-None-Match once per run. Asking for
+    a URL that is already being downloaded returns the same future.
+    With `convert`, jpgs are converted to png by the worker that fetched
+    them.
+    """
+
+    def __init__(self, cacheDir="./out/.cache/images", workers=4, timeout=10, session=None, convert=True):
+        self.cacheDir = cacheDir
+        self.timeout = timeout
+        self.convert = convert
+        self.executor = ThreadPoolExecutor(
+            max_workers=workers, thread_name_prefix="ImageDownloader")
+
+        if session is None:
+            session = http_session(workers)
+        self.session = session
+
+        self.lock = threading.Lock()
+        self.inFlight = {}
+        self.validated = set()
+        # url -> {"etag": ..., "file": ...}
+        self.index = None
+
+    def Fetch(self, url):
+        """Returns a future with the path of the cached (converted) file."""
+        with self.lock:
+            future = self.inFlight.get(url)
+            if future is None:
+                future = self.executor.submit(self.FetchNow, url)
+                self.inFlight[url] = future
+                future.add_done_callback(
+                    lambda f, url=url: self.Done(url, f))
+            return future
+
+    def Done(self, url, future):
+        with self.lock:
+            if self.inFlight.get(url) is future:
+                del self.inFlight[url]
+
+    def FetchNow(self, url):
+        start = Metrics.Start()
+        result = "error"
+        try:
+            cachedFile, result = self.Download(url)
+            return cachedFile
+        finally:
+            Metrics.Stop("tsh_image_download_seconds", start, result=result)
+            Metrics.Count("tsh_image_downloads_total", result=result)
+
+    def Download(self, url):
+        """Returns (cached file or None, how it was obtained)."""
+        index = self.LoadIndex()
+        with self.lock:
+            entry = index.get(url)
+            validated = url in self.validated
+
+        if entry is not None and os.path.isfile(entry["file"]):
+            if validated:
+                return entry["file"], "cached"
+            headers = {"If-None-Match": entry["etag"]} if entry.get("etag") else {}
+        else:
+            entry = None
+            headers = {}
+
+        r = self.session.get(url, headers=headers,
+                             stream=True, timeout=self.timeout)
+        try:
+            if r.status_code == 304 and entry is not None:
+                with self.lock:
+                    self.validated.add(url)
+                return entry["file"], "not_modified"
+
+            if r.status_code != 200:
+                logger.error(
+                    f"Could not download {url}: HTTP {r.status_code}")
+                return None, "error"
+
+            etag = r.headers.get("ETag", "")
+            digest = hashlib.sha256(
+                (url + "\0" + etag).encode("utf-8")).hexdigest()
+            extension = url.rsplit(".", 1)[-1]
+            os.makedirs(self.cacheDir, exist_ok=True)
+            cachedFile = os.path.join(self.cacheDir, f"{digest}.{extension}")
+
+            tmpFile = cachedFile + ".tmp"
+            with open(tmpFile, 'wb') as f:
+                r.raw.decode_content = True
+                shutil.copyfileobj(r.raw, f)
+            os.replace(tmpFile, cachedFile)
+        finally:
+            r.close()
+
+        if self.convert and extension == "jpg":
+            cachedFile = ImageDownloader.ConvertToPng(cachedFile)
+
+        with self.lock:
+            index[url] = {"etag": etag, "file": cachedFile}
+            self.validated.add(url)
+            self.SaveIndex()
+
+        return cachedFile, "downloaded"
+
+    def ConvertToPng(path):
+        from PIL import Image
+
+        pngPath = path.rsplit(".", 1)[0] + ".png"
+        data = io.BytesIO()
+        with Image.open(path) as original:
+            original.save(data, format="png")
+        # A new file, an older one may be linked into the output folder
+        write_atomically(pngPath, data.getvalue(), sync=False)
+        os.remove(path)
+        return pngPath
+
+    def Place(cachedFile, outputFile):
+        if os.path.exists(outputFile):
+            if os.path.samefile(cachedFile, outputFile):
+                return
+            os.remove(outputFile)
+        try:
+            os.link(cachedFile, outputFile)
+        except OSError:
+            shutil.copyfile(cachedFile, outputFile)
+
+    def LoadIndex(self):
+        with self.lock:
+            if self.index is None:
+                try:
+                    with open(os.path.join(self.cacheDir, "index.json"), 'rb') as file:
+                        self.index = orjson.loads(file.read())
+                except FileNotFoundError:
+                    self.index = {}
+                except Exception as e:
+                    logger.error(traceback.format_exc())
+                    self.index = {}
+            return self.index
+
+    def SaveIndex(self):
+        # Only a cache, not worth an fsync per download
+        write_atomically(os.path.join(self.cacheDir, "index.json"),
+                         orjson.dumps(self.index), sync=False)
@@ -0,0 +1,170 @@
+import difflib
+import glob
+import hashlib
+import os
+import re
+import shutil
+import traceback
+from concurrent.futures import ThreadPoolExecutor, as_completed
+import orjson
+from loguru import logger
+from .Helpers.TSHFileHelper import write_atomically
+
+
+class LayoutMigrator:
+    """Migrates overlay layout scripts to the multi-scoreboard data layout.
+
+    Takes a file, a directory (every .js file below it) or a glob. All
+    rules are compiled into one regex and applied in a single pass over
+    each file, by a pool of worker threads. Files are written atomically
+    (through a temporary file) after the original is copied to
+    `<file>.bak`, and only when something changed.
+
+    Each directory gets a `.layout_migration.json` manifest with the hash
+    of every file as it was left by a migration, so files that were
+    already migrated (and not edited since) are skipped without being
+    matched again. Changing the rules invalidates the manifests.
+
+    With `dryRun` nothing is written and every result carries a unified
+    diff of what would change. `progress(done, total, result)` is called
+    from the calling thread after every file.
+    """
+
+    # Applied as if in this order, each on the output of the previous one
+    # (which is how they used to be applied). "data.score[1].ruleset" is
+    # turned back into "data.score.ruleset", so the latter is left alone.
+    rules = [
+        ("data.score.ruleset", "data.score.ruleset"),
+        ("data.score[1].ruleset", "data.score.ruleset"),
+        ("data.score.", "data.score[1]."),
+        ("oldData.score.", "oldData.score[1]."),
+        ("_.get(data, \"score.stage_strike.", "_.get(data, \"score.1.stage_strike."),
+        ("_.get(oldData, \"score.stage_strike.", "_.get(oldData, \"score.1.stage_strike."),
+        ("source: `score.team.${t + 1}`", "source: `score.1.team.${t + 1}`"),
+    ]
+
+    manifestName = ".layout_migration.json"
+    extensions = (".js",)
+
+    def __init__(self, rules=None, workers=None, progress=None):
+        self.rules = rules if rules is not None else LayoutMigrator.rules
+        self.table = dict(self.rules)
+        # Longest first, so a rule wins over the shorter ones it contains
+        self.pattern = re.compile("(" + "|".join(
+            re.escape(old) for old in sorted(self.table, key=len, reverse=True)) + ")")
+        self.rulesHash = hashlib.sha256(orjson.dumps(self.rules)).hexdigest()
+        self.workers = workers or min(8, os.cpu_count() or 1)
+        self.progress = progress
+
+    def Files(self, target):
+        """The layout files `target` (a file, directory or glob) stands for."""
+        if os.path.isdir(target):
+            files = [os.path.join(root, name)
+                     for root, dirs, names in os.walk(target)
+                     for name in names if name.endswith(LayoutMigrator.extensions)]
+        elif glob.has_magic(target):
+            files = [f for f in glob.glob(target, recursive=True) if os.path.isfile(f)]
+        else:
+            files = [target]
+        return sorted(os.path.abspath(f) for f in files)
+
+    def Migrate(self, target, dryRun=False):
+        """Returns one result per file: {"path", "status", "replacements",
+        "diff", "error"}, status one of "migrated", "unchanged",
+        "skipped" (already migrated) or "error". In a dry run "migrated"
+        means it would be."""
+        files = self.Files(target)
+        manifests = {}
+        for directory in {os.path.dirname(f) for f in files}:
+            manifests[directory] = self.LoadManifest(directory)
+
+        results = []
+        with ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="LayoutMigrator") as executor:
+            futures = [executor.submit(
+                self.MigrateFile, f,
+                manifests[os.path.dirname(f)].get(os.path.basename(f)), dryRun) for f in files]
+            for future in as_completed(futures):
+                result = future.result()
+                results.append(result)
+                if "hash" in result:
+                    directory, name = os.path.split(result["path"])
+                    manifests[directory][name] = result.pop("hash")
+                self.Report(len(results), len(files), result)
+
+        if not dryRun:
+            for directory, manifest in manifests.items():
+                self.SaveManifest(directory, manifest)
+
+        results.sort(key=lambda r: r["path"])
+        return results
+
+    def MigrateFile(self, path, knownHash, dryRun):
+        result = {"path": path, "status": "unchanged",
+                  "replacements": 0, "diff": None, "error": None}
+        try:
+            with open(path, 'rb') as file:
+                raw = file.read()
+            if hashlib.sha256(raw).hexdigest() == knownHash:
+                result["status"] = "skipped"
+                return result
+
+            # Bytes are decoded as is, line endings are left alone
+            text = raw.decode("utf-8")
+            # Text between matches, match, text... Mapping the matches as
+            # a list is cheaper than a Python callback per match.
+            parts = self.pattern.split(text)
+            matches = parts[1::2]
+            parts[1::2] = [self.table[m] for m in matches]
+            replaced = sum(map(str.__ne__, matches, parts[1::2]))
+            if replaced > 0:
+                migrated = "".join(parts)
+                result["status"] = "migrated"
+                result["replacements"] = replaced
+                if dryRun:
+                    result["diff"] = LayoutMigrator.Diff(path, text, migrated)
+                else:
+                    raw = migrated.encode("utf-8")
+                    LayoutMigrator.WriteAtomically(path, raw)
+            if not dryRun:
+                result["hash"] = hashlib.sha256(raw).hexdigest()
+        except Exception as e:
+            logger.error(traceback.format_exc())
+            result["status"] = "error"
+            result["error"] = str(e)
+        return result
+
+    def Diff(path, old, new):
+        return "".join(difflib.unified_diff(
+            old.splitlines(keepends=True), new.splitlines(keepends=True),
+            fromfile=path, tofile=path + " (migrated)"))
+
+    def WriteAtomically(path, data):
+        shutil.copy2(path, path + ".bak")
+        write_atomically(path, data, keepMode=True)
+
+    def Report(self, done, total, result):
+        if self.progress is not None:
+            try:
+                self.progress(done, total, result)
+            except Exception as e:
+                logger.error(traceback.format_exc())
+
+    def LoadManifest(self, directory):
+        try:
+            with open(os.path.join(directory, LayoutMigrator.manifestName), 'rb') as file:
+                manifest = orjson.loads(file.read())
+            if manifest.get("rules") == self.rulesHash:
+                return manifest.get("files", {})
+        except FileNotFoundError:
+            pass
+        except Exception as e:
+            logger.error(traceback.format_exc())
+        return {}
+
+    def SaveManifest(self, directory, files):
+        manifestFile = os.path.join(directory, LayoutMigrator.manifestName)
+        try:
+            write_atomically(manifestFile, orjson.dumps(
+                {"rules": self.rulesHash, "files": files}, option=orjson.OPT_INDENT_2))
+        except Exception as e:
+            logger.error(traceback.format_exc())
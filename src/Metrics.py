@@ -0,0 +1,235 @@
+import bisect
+import os
+import threading
+import time
+import traceback
+from loguru import logger
+
+
+class Histogram:
+    # Seconds, 1us to 10s
+    buckets = [1e-6, 2.5e-6, 5e-6, 1e-5, 2.5e-5, 5e-5, 1e-4, 2.5e-4, 5e-4,
+               1e-3, 2.5e-3, 5e-3, 1e-2, 2.5e-2, 5e-2, 0.1, 0.25, 0.5, 1, 2.5, 5, 10]
+
+    def __init__(self):
+        # One more for +Inf
+        self.counts = [0] * (len(Histogram.buckets) + 1)
+        self.count = 0
+        self.sum = 0.0
+
+    def Observe(self, value):
+        self.counts[bisect.bisect_left(Histogram.buckets, value)] += 1
+        self.count += 1
+        self.sum += value
+
+    def Quantile(counts, count, q):
+        """Upper bound of the bucket the q-quantile falls in."""
+        if count == 0:
+            return 0.0
+        rank = q * count
+        seen = 0
+        for i, n in enumerate(counts):
+            seen += n
+            if seen >= rank:
+                return Histogram.buckets[i] if i < len(Histogram.buckets) else float("inf")
+        return float("inf")
+
+
+class Metrics:
+    """Counters and latency histograms for the hot paths.
+
+    Disabled unless Enable() is called (src.bootstrap() does when
+    TSH_METRICS is set, which main.py --metrics sets), and until then
+    every call below returns right away, so instrumented code pays a
+    function call and nothing else. Timed sections look like:
+
+        start = Metrics.Start()
+        ...
+        Metrics.Stop("tsh_state_set_seconds", start)
+
+    GET /metrics on the web server returns everything in the Prometheus
+    text format, and a summary line is logged every `summaryInterval`
+    seconds.
+    """
+
+    enabled = False
+    lock = threading.Lock()
+    # (name, labels) -> value or Histogram, labels a sorted tuple of pairs
+    counters = {}
+    histograms = {}
+    help = {
+        "tsh_state_set_seconds": "StateManager.Set latency",
+        "tsh_state_unset_seconds": "StateManager.Unset latency",
+        "tsh_state_diff_seconds": "Collecting the changes of a save",
+        "tsh_state_changes_total": "Changes saved",
+        "tsh_state_saves_total": "Saves with at least one change",
+        "tsh_state_serialize_seconds": "Encoding the journal, snapshot or pretty export",
+        "tsh_state_disk_write_seconds": "Writing the journal, snapshot or pretty export",
+        "tsh_state_disk_bytes_total": "Bytes written for the state",
+        "tsh_web_emit_seconds": "Encoding and queueing a delta for the overlays",
+        "tsh_web_messages_total": "Messages sent to the overlays",
+        "tsh_export_write_seconds": "Writing one exported file under ./out",
+        "tsh_export_files_total": "Exported files, written or skipped as unchanged",
+        "tsh_image_download_seconds": "Fetching one image",
+        "tsh_image_downloads_total": "Image fetches by result",
+        "tsh_asset_pack_seconds": "Installing or updating one asset pack",
+        "tsh_asset_files_total": "Asset pack files written or left alone as unchanged",
+    }
+
+    summaryInterval = 60.0
+    summaryThread = None
+    lastSummary = {}
+
+    def Enable(summaryInterval=None):
+        if summaryInterval is not None:
+            Metrics.summaryInterval = summaryInterval
+        Metrics.enabled = True
+        with Metrics.lock:
+            if Metrics.summaryInterval and Metrics.summaryThread is None:
+                Metrics.summaryThread = threading.Thread(
+                    target=Metrics.SummaryLoop, name="Metrics", daemon=True)
+                Metrics.summaryThread.start()
+
+    def EnableFromEnvironment():
+        """TSH_METRICS=1 enables metrics, a number also sets the summary
+        interval in seconds (0 for none)."""
+        value = os.environ.get("TSH_METRICS", "")
+        if value in ("", "0", "false", "no"):
+            return
+        try:
+            Metrics.Enable(float(value) if value != "1" else None)
+        except ValueError:
+            Metrics.Enable()
+
+    def Start():
+        return time.perf_counter() if Metrics.enabled else None
+
+    def Stop(name, start, **labels):
+        if start is None:
+            return
+        Metrics.Observe(name, time.perf_counter() - start, **labels)
+
+    def Observe(name, value, **labels):
+        if not Metrics.enabled:
+            return
+        key = (name, tuple(sorted(labels.items())))
+        with Metrics.lock:
+            histogram = Metrics.histograms.get(key)
+            if histogram is None:
+                histogram = Metrics.histograms[key] = Histogram()
+            histogram.Observe(value)
+
+    def Count(name, value=1, **labels):
+        if not Metrics.enabled:
+            return
+        key = (name, tuple(sorted(labels.items())))
+        with Metrics.lock:
+            Metrics.counters[key] = Metrics.counters.get(key, 0) + value
+
+    def Reset():
+        with Metrics.lock:
+            Metrics.counters = {}
+            Metrics.histograms = {}
+            Metrics.lastSummary = {}
+
+    def Labels(labels, extra=()):
+        pairs = list(labels) + list(extra)
+        if len(pairs) == 0:
+            return ""
+        return "{" + ",".join(f'{k}="{Metrics.Escape(v)}"' for k, v in pairs) + "}"
+
+    def Escape(value):
+        return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+    def Render():
+        """Everything in the Prometheus text exposition format."""
+        with Metrics.lock:
+            counters = sorted(Metrics.counters.items())
+            histograms = sorted(
+                (key, list(h.counts), h.count, h.sum) for key, h in Metrics.histograms.items())
+
+        lines = []
+        described = set()
+
+        def describe(name, kind):
+            if name not in described:
+                described.add(name)
+                if name in Metrics.help:
+                    lines.append(f"# HELP {name} {Metrics.help[name]}")
+                lines.append(f"# TYPE {name} {kind}")
+
+        for (name, labels), value in counters:
+            describe(name, "counter")
+            lines.append(f"{name}{Metrics.Labels(labels)} {value}")
+
+        for (name, labels), counts, count, total in histograms:
+            describe(name, "histogram")
+            cumulative = 0
+            for bound, n in zip(Histogram.buckets + ["+Inf"], counts):
+                cumulative += n
+                lines.append(
+                    f"{name}_bucket{Metrics.Labels(labels, [('le', bound)])} {cumulative}")
+            lines.append(f"{name}_sum{Metrics.Labels(labels)} {total}")
+            lines.append(f"{name}_count{Metrics.Labels(labels)} {count}")
+
+        return "\n".join(lines) + "\n"
+
+    def Route(method, body):
+        """GET /metrics"""
+        if not Metrics.enabled:
+            return 404, "text/plain", b"Metrics are disabled, start with --metrics"
+        return 200, "text/plain; version=0.0.4", Metrics.Render().encode("utf-8")
+
+    def Summary():
+        """One line with what happened since the last summary: count and
+        p50/p99 of every histogram, and counter increments."""
+        with Metrics.lock:
+            histograms = sorted(
+                (key, list(h.counts), h.count) for key, h in Metrics.histograms.items())
+            counters = sorted(Metrics.counters.items())
+            last = Metrics.lastSummary
+            Metrics.lastSummary = {key: (counts, count) for key, counts, count in histograms}
+            Metrics.lastSummary.update(counters)
+
+        parts = []
+        for key, counts, count in histograms:
+            lastCounts, lastCount = last.get(key, ([0] * len(counts), 0))
+            delta = [a - b for a, b in zip(counts, lastCounts)]
+            n = count - lastCount
+            if n == 0:
+                continue
+            p50 = Histogram.Quantile(delta, n, 0.5)
+            p99 = Histogram.Quantile(delta, n, 0.99)
+            parts.append(
+                f"{Metrics.ShortName(key)} n={n} p50<={Metrics.Duration(p50)} p99<={Metrics.Duration(p99)}")
+        for key, value in counters:
+            n = value - last.get(key, 0)
+            if n != 0:
+                parts.append(f"{Metrics.ShortName(key)} +{n}")
+        return " | ".join(parts)
+
+    def ShortName(key):
+        name, labels = key
+        name = name.removeprefix("tsh_").removesuffix("_seconds").removesuffix("_total")
+        if len(labels) > 0:
+            name += "[" + ",".join(str(v) for _, v in labels) + "]"
+        return name
+
+    def Duration(seconds):
+        if seconds == float("inf"):
+            return "inf"
+        if seconds < 1e-3:
+            return f"{seconds * 1e6:g}us"
+        if seconds < 1:
+            return f"{seconds * 1e3:g}ms"
+        return f"{seconds:g}s"
+
+    def SummaryLoop():
+        while True:
+            time.sleep(Metrics.summaryInterval)
+            try:
+                summary = Metrics.Summary()
+                if summary != "":
+                    logger.info(f"metrics: {summary}")
+            except Exception as e:
+                logger.error(traceback.format_exc())
@@ -0,0 +1,133 @@
+import asyncio
+import inspect
+import traceback
+import orjson
+from loguru import logger
+from .StateManager import StateManager
+
+
+class RecipeEngine:
+    """The recipe tracker's commands, with no UI attached.
+
+    Recipes live under "recipes.<id>" with their steps keyed by index,
+    "recipes.<id>.steps.<i>" = {"text": ..., "done": bool}. The recipe on
+    stream is "current.recipe" and the step being cooked "current.step".
+    The stdin driver of `main.py --headless` and POST /command both go
+    through Run(), so hotkey tools can use either.
+    """
+
+    def Run(line: str):
+        """Runs one command line ("advance", "check 3", "select bread"...)
+        and returns the resulting "current" state. Raises ValueError for
+        unknown commands or bad arguments."""
+        words = line.split()
+        if len(words) == 0:
+            raise ValueError("Empty command")
+
+        command = RecipeEngine.commands.get(words[0].lower())
+        if command is None:
+            raise ValueError(f"Unknown command: {words[0]}")
+
+        try:
+            inspect.signature(command).bind(*words[1:])
+        except TypeError:
+            raise ValueError(f"Wrong arguments for {words[0]}")
+
+        with StateManager.transaction():
+            command(*words[1:])
+            return StateManager.Get("current", {})
+
+    def Select(recipe):
+        if StateManager.Get(f"recipes.{recipe}") is None:
+            raise ValueError(f"Unknown recipe: {recipe}")
+        StateManager.Set("current", {"recipe": recipe, "step": 0})
+
+    def Advance():
+        """Checks the current step and moves on to the next one."""
+        recipe, step = RecipeEngine.Current()
+        count = RecipeEngine.StepCount(recipe)
+        if step < count:
+            StateManager.Set(f"recipes.{recipe}.steps.{step}.done", True)
+            StateManager.Set("current.step", step + 1)
+
+    def Undo():
+        """Goes back one step and unchecks it."""
+        recipe, step = RecipeEngine.Current()
+        if step > 0:
+            StateManager.Set(f"recipes.{recipe}.steps.{step - 1}.done", False)
+            StateManager.Set("current.step", step - 1)
+
+    def Check(step):
+        recipe, _ = RecipeEngine.Current()
+        key = f"recipes.{recipe}.steps.{RecipeEngine.StepIndex(recipe, step)}.done"
+        StateManager.Set(key, not StateManager.Get(key, False))
+
+    def Reset():
+        recipe, _ = RecipeEngine.Current()
+        for step in range(RecipeEngine.StepCount(recipe)):
+            StateManager.Set(f"recipes.{recipe}.steps.{step}.done", False)
+        StateManager.Set("current.step", 0)
+
+    def Current():
+        recipe = StateManager.Get("current.recipe")
+        if recipe is None:
+            raise ValueError("No recipe selected")
+        return recipe, StateManager.Get("current.step", 0)
+
+    def StepCount(recipe):
+        return len(StateManager.Get(f"recipes.{recipe}.steps", {}))
+
+    def StepIndex(recipe, step):
+        try:
+            step = int(step)
+        except ValueError:
+            raise ValueError(f"Not a step number: {step}")
+        if not 0 <= step < RecipeEngine.StepCount(recipe):
+            raise ValueError(f"No step {step} in {recipe}")
+        return step
+
+    def CommandRoute(method, body):
+        """POST /command with the command line as the body, or as
+        {"command": ...} JSON."""
+        if method != "POST":
+            return 405, "text/plain", b"POST a command"
+        try:
+            line = body.decode("utf-8")
+            if line.lstrip().startswith("{"):
+                line = orjson.loads(line).get("command", "")
+            current = RecipeEngine.Run(line)
+            return 200, "application/json", orjson.dumps(current, option=orjson.OPT_NON_STR_KEYS)
+        except ValueError as e:
+            return 400, "application/json", orjson.dumps({"error": str(e)})
+        except Exception as e:
+            logger.error(traceback.format_exc())
+            return 500, "application/json", orjson.dumps({"error": str(e)})
+
+    async def ReadCommands(stream):
+        """Runs every line of `stream` as a command. Once the stream ends
+        (or there never was one, as under a service manager) it keeps
+        waiting so the overlay server stays up."""
+        loop = asyncio.get_running_loop()
+        while stream is not None:
+            line = await loop.run_in_executor(None, stream.readline)
+            if line == "":
+                break
+            if line.strip() == "":
+                continue
+            try:
+                current = RecipeEngine.Run(line)
+                logger.info(f"{line.strip()}: {current}")
+            except ValueError as e:
+                logger.error(str(e))
+            except Exception as e:
+                logger.error(traceback.format_exc())
+        await asyncio.Event().wait()
+
+
+RecipeEngine.commands = {
+    "select": RecipeEngine.Select,
+    "advance": RecipeEngine.Advance,
+    "undo": RecipeEngine.Undo,
+    "check": RecipeEngine.Check,
+    "reset": RecipeEngine.Reset,
+}
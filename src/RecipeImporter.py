@@ -0,0 +1,288 @@
+import csv
+import io
+import json
+import os
+import re
+import traceback
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+import msgpack
+import orjson
+from loguru import logger
+from .StateManager import StateManager
+
+
+class RecipeImporter:
+    """Bulk imports recipes from .json, .jsonl/.ndjson, .csv or .msgpack.
+
+    Files are read as a stream, a chunk of records at a time. A pool of
+    worker processes parses (JSONL), validates and normalizes the chunks,
+    and each chunk is committed to StateManager in one transaction, in
+    file order. At most two chunks per worker are in flight, so memory
+    stays bounded however big the file is. JSON and msgpack files can
+    hold a top-level array, a top-level object keyed by recipe id or (for
+    msgpack) a plain sequence of records.
+
+    Recipes end up as "recipes.<id>" = {"name", "tags", "ingredients",
+    "steps": {"0": {"text", "done"}, ...}}. The id comes from an "id"
+    field or the object key, or is derived from the name. In CSV files
+    tags, ingredients and steps are "|" separated.
+
+    `progress(imported, errors, bytesRead, totalBytes)` is called after
+    every committed chunk.
+    """
+
+    readSize = 1 << 20
+
+    def __init__(self, workers=None, chunkSize=1000, progress=None):
+        # One core is left to this process, which reads and commits. With
+        # 0 workers everything runs here, best for small files or machines.
+        if workers is None:
+            workers = max(0, (os.cpu_count() or 1) - 1)
+        self.workers = workers
+        self.chunkSize = chunkSize
+        self.progress = progress
+
+    def Import(self, path):
+        """Returns (recipes imported, list of error messages)."""
+        totalBytes = os.path.getsize(path)
+        imported = 0
+        errors = []
+
+        with open(path, 'rb') as file:
+            chunks = RecipeImporter.Chunks(
+                RecipeImporter.Records(path, file), self.chunkSize)
+
+            if self.workers == 0:
+                for chunk in chunks:
+                    imported += self.Commit(
+                        RecipeImporter.NormalizeChunk(chunk), errors)
+                    self.Report(imported, errors, file.tell(), totalBytes)
+                return imported, errors
+
+            with ProcessPoolExecutor(max_workers=self.workers) as executor:
+                inFlight = deque()
+                for chunk in chunks:
+                    inFlight.append(executor.submit(
+                        RecipeImporter.NormalizeChunk, chunk))
+                    if len(inFlight) >= self.workers * 2:
+                        imported += self.Commit(
+                            inFlight.popleft().result(), errors)
+                        self.Report(imported, errors,
+                                    file.tell(), totalBytes)
+                while len(inFlight) > 0:
+                    imported += self.Commit(inFlight.popleft().result(), errors)
+                    self.Report(imported, errors, file.tell(), totalBytes)
+
+        return imported, errors
+
+    def Report(self, imported, errors, bytesRead, totalBytes):
+        if self.progress is not None:
+            try:
+                self.progress(imported, len(errors),
+                              min(bytesRead, totalBytes), totalBytes)
+            except Exception as e:
+                logger.error(traceback.format_exc())
+
+    def Commit(self, normalized, errors):
+        recipes, chunkErrors = normalized
+        errors.extend(chunkErrors)
+        with StateManager.transaction():
+            for recipe, data in recipes:
+                StateManager.Set(f"recipes.{recipe}", data)
+        return len(recipes)
+
+    def Chunks(records, size):
+        chunk = []
+        for record in records:
+            chunk.append(record)
+            if len(chunk) >= size:
+                yield chunk
+                chunk = []
+        if len(chunk) > 0:
+            yield chunk
+
+    def Records(path, file):
+        extension = os.path.splitext(path)[1].lower()
+        if extension in (".jsonl", ".ndjson"):
+            # Parsed by the workers
+            return (line for line in file if line.strip() != b"")
+        if extension == ".json":
+            return RecipeImporter.ReadText(file, RecipeImporter.ReadJson, encoding="utf-8")
+        if extension == ".csv":
+            return RecipeImporter.ReadText(file, csv.DictReader, encoding="utf-8-sig", newline="")
+        if extension in (".msgpack", ".mpk"):
+            return RecipeImporter.ReadMsgpack(file)
+        raise ValueError(f"Unsupported recipe file: {path}")
+
+    def ReadText(file, read, **kwargs):
+        text = io.TextIOWrapper(file, **kwargs)
+        try:
+            yield from read(text)
+        finally:
+            # Closing the wrapper would close the file under Import
+            text.detach()
+
+    def ReadJson(file):
+        """Yields the items of a top-level JSON array, or the values of a
+        top-level object with their key as "id", without reading the
+        whole file at once."""
+        decoder = json.JSONDecoder()
+        buffer = ""
+        pos = 0
+        eof = False
+        container = None
+        key = None
+
+        while True:
+            while pos < len(buffer) and buffer[pos] in " \t\r\n,:":
+                pos += 1
+
+            if pos >= len(buffer):
+                if eof:
+                    return
+                more = file.read(RecipeImporter.readSize)
+                buffer = buffer[pos:] + more
+                pos = 0
+                eof = more == ""
+                continue
+
+            if container is None:
+                if buffer[pos] not in "[{":
+                    raise ValueError("Expected a JSON array or object of recipes")
+                container = buffer[pos]
+                pos += 1
+                continue
+
+            if buffer[pos] in "]}":
+                return
+
+            try:
+                value, end = decoder.raw_decode(buffer, pos)
+                # A value cut at the end of the buffer may still decode
+                complete = end < len(buffer) or eof
+            except json.JSONDecodeError:
+                if eof:
+                    raise
+                complete = False
+
+            if not complete:
+                more = file.read(RecipeImporter.readSize)
+                buffer = buffer[pos:] + more
+                pos = 0
+                eof = more == ""
+                continue
+
+            pos = end
+            if container == "[":
+                yield value
+            elif key is None:
+                key = value
+            else:
+                yield RecipeImporter.WithId(value, key)
+                key = None
+
+    def ReadMsgpack(file):
+        first = file.peek(1)[:1]
+        unpacker = msgpack.Unpacker(file, raw=False, strict_map_key=False)
+        if first == b"":
+            return
+
+        if 0x90 <= first[0] <= 0x9f or first[0] in (0xdc, 0xdd):
+            for _ in range(unpacker.read_array_header()):
+                yield unpacker.unpack()
+            return
+
+        if 0x80 <= first[0] <= 0x8f or first[0] in (0xde, 0xdf):
+            # Either a map of id -> recipe or the first of a sequence of
+            # records, told apart by whether its first value is a recipe
+            size = unpacker.read_map_header()
+            if size > 0:
+                key = unpacker.unpack()
+                value = unpacker.unpack()
+                if isinstance(value, dict):
+                    yield RecipeImporter.WithId(value, key)
+                    for _ in range(size - 1):
+                        key = unpacker.unpack()
+                        yield RecipeImporter.WithId(unpacker.unpack(), key)
+                    return
+                record = {key: value}
+                for _ in range(size - 1):
+                    key = unpacker.unpack()
+                    record[key] = unpacker.unpack()
+                yield record
+
+        yield from unpacker
+
+    def WithId(value, key):
+        if isinstance(value, dict) and "id" not in value:
+            return dict(value, id=key)
+        return value
+
+    def NormalizeChunk(records):
+        """Runs in the worker processes. Returns ([(id, recipe)], errors)."""
+        recipes = []
+        errors = []
+        for record in records:
+            try:
+                if isinstance(record, bytes):
+                    record = orjson.loads(record)
+                recipes.append(RecipeImporter.Normalize(record))
+            except (ValueError, TypeError) as e:
+                errors.append(f"{str(record)[:80]}: {e}")
+        return recipes, errors
+
+    def Normalize(record):
+        if not isinstance(record, dict):
+            raise ValueError("a recipe must be an object")
+
+        name = record.get("name") or record.get("title")
+        if not isinstance(name, str) or name.strip() == "":
+            raise ValueError("missing name")
+        name = name.strip()
+
+        recipe = record.get("id")
+        if recipe is None or str(recipe).strip() == "":
+            recipe = re.sub(r"[^a-z0-9]+", "-", name.lower()).strip("-")
+        # Ids are path segments
+        recipe = str(recipe).strip().replace(".", "_")
+        if recipe == "":
+            raise ValueError(f"no usable id for {name}")
+
+        ingredients = []
+        for ingredient in RecipeImporter.List(record.get("ingredients")):
+            if isinstance(ingredient, dict):
+                if not isinstance(ingredient.get("name"), str):
+                    raise ValueError("ingredient without a name")
+                ingredients.append({k: str(v) for k, v in ingredient.items()
+                                    if v is not None})
+            else:
+                ingredients.append(str(ingredient))
+
+        steps = {}
+        for step in RecipeImporter.List(record.get("steps")):
+            if isinstance(step, dict):
+                steps[str(len(steps))] = {
+                    "text": str(step.get("text", "")),
+                    "done": bool(step.get("done", False))
+                }
+            else:
+                steps[str(len(steps))] = {"text": str(step), "done": False}
+
+        return recipe, {
+            "name": name,
+            "tags": [str(t) for t in RecipeImporter.List(record.get("tags"))],
+            "ingredients": ingredients,
+            "steps": steps
+        }
+
+    def List(value):
+        if value is None:
+            return []
+        if isinstance(value, str):
+            return [v.strip() for v in value.split("|") if v.strip() != ""]
+        if isinstance(value, dict):
+            return list(value.values())
+        if isinstance(value, (list, tuple)):
+            return list(value)
+        raise ValueError(f"expected a list, got {type(value).__name__}")
@@ -0,0 +1,203 @@
+import threading
+from .StateManager import StateManager
+from .Helpers.TSHDictHelper import deep_get, mapping_types
+from .Helpers.TSHSearchHelper import SearchIndex
+
+
+class RecipeIndex:
+    """Secondary indexes over the recipes in the state.
+
+    Keeps recipe ids by tag and by ingredient, and each recipe's steps by
+    whether they are done, so that questions like "unchecked steps of X"
+    or "recipes using flour" cost as much as their answer. Attach() hooks
+    it to StateManager: every saved batch of changes only re-indexes the
+    steps or recipes it touched. Queries see the state as of the last
+    save, which follows a Set within milliseconds and a transaction or
+    Flush() right away.
+
+    Tags and ingredients can be lists or index-keyed dicts, ingredients
+    either names or {"name": ...} dicts. Names are matched case
+    insensitively. Recipe names are also kept in a SearchIndex for
+    Search().
+    """
+
+    instance = None
+    instanceLock = threading.Lock()
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.tags = {}
+        self.ingredients = {}
+        self.done = {}
+        self.todo = {}
+        # recipe id -> the tags/ingredients it is indexed under
+        self.recipeTags = {}
+        self.recipeIngredients = {}
+        self.names = SearchIndex()
+
+    def Attach(self):
+        # The initial build runs without the state lock, so saves are not
+        # held up by a big catalog. Batches saved meanwhile are queued and
+        # applied right after.
+        StateManager.EnsureLoaded()
+        queued = []
+        with StateManager.lock:
+            state = StateManager.lastSavedState
+            StateManager.listeners.append(queued.append)
+        self.Rebuild(state)
+        with StateManager.lock:
+            for changes in queued:
+                self.Apply(changes)
+            StateManager.listeners[StateManager.listeners.index(queued.append)] = self.Apply
+        return self
+
+    def Instance():
+        """The index of StateManager's state, attached on first use."""
+        with RecipeIndex.instanceLock:
+            if RecipeIndex.instance is None:
+                RecipeIndex.instance = RecipeIndex().Attach()
+            return RecipeIndex.instance
+
+    def Rebuild(self, state):
+        recipes = state.get("recipes", {})
+        if not isinstance(recipes, mapping_types):
+            recipes = {}
+        with self.lock:
+            for recipe in list(self.recipeTags):
+                self.RemoveRecipe(recipe, search=False)
+            for recipe, data in recipes.items():
+                self.AddRecipe(recipe, data, search=False)
+            self.names.Build((recipe, RecipeIndex.Name(recipe, data))
+                             for recipe, data in recipes.items())
+
+    def Apply(self, changes):
+        state = StateManager.lastSavedState
+        if any(c["path"] == "" or c["path"] == "recipes" for c in changes):
+            self.Rebuild(state)
+            return
+
+        with self.lock:
+            for change in changes:
+                path = change["path"]
+                if not path.startswith("recipes."):
+                    continue
+
+                keys = path.split(".", 4)
+                recipe = keys[1]
+                if len(keys) >= 4 and keys[2] == "steps" and recipe in self.recipeTags:
+                    self.IndexStep(recipe, keys[3], deep_get(
+                        state, ".".join(keys[:4])))
+                else:
+                    # Add() leaves the name alone if it did not change
+                    self.RemoveRecipe(recipe, search=False)
+                    data = deep_get(state, f"recipes.{recipe}", StateManager.missing)
+                    if data is not StateManager.missing:
+                        self.AddRecipe(recipe, data)
+                    else:
+                        self.names.Remove(recipe)
+
+    def AddRecipe(self, recipe, data, search=True):
+        if not isinstance(data, dict):
+            data = {}
+        if search:
+            self.names.Add(recipe, RecipeIndex.Name(recipe, data))
+
+        tags = RecipeIndex.Names(data.get("tags"))
+        ingredients = RecipeIndex.Names(data.get("ingredients"))
+        self.recipeTags[recipe] = tags
+        self.recipeIngredients[recipe] = ingredients
+        for tag in tags:
+            self.tags.setdefault(tag, set()).add(recipe)
+        for ingredient in ingredients:
+            self.ingredients.setdefault(ingredient, set()).add(recipe)
+
+        self.done[recipe] = set()
+        self.todo[recipe] = set()
+        steps = data.get("steps")
+        if isinstance(steps, dict):
+            for step, stepData in steps.items():
+                self.IndexStep(recipe, step, stepData)
+
+    def RemoveRecipe(self, recipe, search=True):
+        if search:
+            self.names.Remove(recipe)
+        for tag in self.recipeTags.pop(recipe, ()):
+            RecipeIndex.Discard(self.tags, tag, recipe)
+        for ingredient in self.recipeIngredients.pop(recipe, ()):
+            RecipeIndex.Discard(self.ingredients, ingredient, recipe)
+        self.done.pop(recipe, None)
+        self.todo.pop(recipe, None)
+
+    def IndexStep(self, recipe, step, data):
+        self.done[recipe].discard(step)
+        self.todo[recipe].discard(step)
+        if isinstance(data, dict):
+            if data.get("done"):
+                self.done[recipe].add(step)
+            else:
+                self.todo[recipe].add(step)
+
+    def Discard(index, key, recipe):
+        recipes = index.get(key)
+        if recipes is not None:
+            recipes.discard(recipe)
+            if len(recipes) == 0:
+                del index[key]
+
+    def Name(recipe, data):
+        name = data.get("name") if isinstance(data, dict) else None
+        return name if isinstance(name, str) and name != "" else str(recipe)
+
+    def Names(values):
+        if isinstance(values, dict):
+            values = values.values()
+        elif not isinstance(values, (list, tuple)):
+            return ()
+        names = set()
+        for value in values:
+            if isinstance(value, dict):
+                value = value.get("name")
+            if isinstance(value, str) and value.strip() != "":
+                names.add(value.strip().lower())
+        return tuple(names)
+
+    def StepOrder(step):
+        return (0, int(step), "") if step.isdigit() else (1, 0, step)
+
+    def UncheckedSteps(self, recipe):
+        with self.lock:
+            return sorted(self.todo.get(recipe, ()), key=RecipeIndex.StepOrder)
+
+    def CheckedSteps(self, recipe):
+        with self.lock:
+            return sorted(self.done.get(recipe, ()), key=RecipeIndex.StepOrder)
+
+    def Progress(self, recipe):
+        """(done, total) steps of a recipe."""
+        with self.lock:
+            done = len(self.done.get(recipe, ()))
+            return done, done + len(self.todo.get(recipe, ()))
+
+    def WithTag(self, tag):
+        with self.lock:
+            return sorted(self.tags.get(tag.strip().lower(), ()))
+
+    def WithIngredient(self, ingredient):
+        with self.lock:
+            return sorted(self.ingredients.get(ingredient.strip().lower(), ()))
+
+    def Search(self, query, limit=50):
+        """Up to `limit` (recipe id, name) pairs for what was typed in a
+        picker, best match first. See SearchIndex."""
+        return self.names.Search(query, limit)
+
+    def Query(self, tags=(), ingredients=()):
+        """Recipes having every tag and every ingredient given."""
+        with self.lock:
+            sets = [self.tags.get(t.strip().lower(), set()) for t in tags] + \
+                [self.ingredients.get(i.strip().lower(), set())
+                 for i in ingredients]
+            if len(sets) == 0:
+                return sorted(self.recipeTags)
+            sets.sort(key=len)
+            return sorted(r for r in sets[0] if all(r in s for s in sets[1:]))
@@ -0,0 +1,117 @@
+import threading
+import traceback
+from qtpy.QtGui import *
+from qtpy.QtWidgets import *
+from qtpy.QtCore import *
+from loguru import logger
+from .StateManager import StateManager
+from .RecipeIndex import RecipeIndex
+from .CheckboxWidget import StateSignals
+from .Helpers.TSHDictHelper import deep_get
+
+
+class SearchResultsModel(QAbstractListModel):
+    """The (recipe id, name) pairs of the last search."""
+
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self.results = []
+
+    def SetResults(self, results):
+        self.beginResetModel()
+        self.results = results
+        self.endResetModel()
+
+    def rowCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else len(self.results)
+
+    def data(self, index, role=Qt.ItemDataRole.DisplayRole):
+        if not index.isValid() or index.row() >= len(self.results):
+            return None
+        recipe, name = self.results[index.row()]
+        if role in (Qt.ItemDataRole.DisplayRole, Qt.ItemDataRole.EditRole):
+            return name
+        if role == Qt.ItemDataRole.UserRole:
+            return recipe
+        return None
+
+
+class RecipePicker(QLineEdit):
+    """Type-to-search recipe picker.
+
+    Every keystroke asks RecipeIndex.Search for the best matches (prefix,
+    word, substring and typo tolerant, see SearchIndex) and shows them in
+    a completer popup, which does no filtering of its own. The index is
+    built on a background thread the first time, and follows the state
+    from then on. Picking a result emits `recipeSelected(recipe id)`. The
+    text shows the current recipe while the picker is not being used.
+    """
+    recipeSelected = Signal(str)
+    indexReady = Signal()
+
+    def __init__(self, parent=None, limit=50):
+        super().__init__(parent)
+        self.limit = limit
+        self.index = None
+        self.setPlaceholderText(
+            QApplication.translate("app", "Search recipes..."))
+        self.setClearButtonEnabled(True)
+
+        self.results = SearchResultsModel(self)
+        self.picker = QCompleter(self.results, self)
+        self.picker.setCompletionMode(
+            QCompleter.CompletionMode.UnfilteredPopupCompletion)
+        self.picker.setMaxVisibleItems(15)
+        self.picker.popup().setUniformItemSizes(True)
+        self.picker.activated[QModelIndex].connect(self.Picked)
+        self.setCompleter(None)
+
+        self.textEdited.connect(self.Search)
+        self.indexReady.connect(self.IndexReady)
+
+        # Loads the state too, so nothing waits for it on the UI thread
+        threading.Thread(target=self.LoadIndex,
+                         name="RecipePicker", daemon=True).start()
+
+    def LoadIndex(self):
+        try:
+            RecipeIndex.Instance()
+            self.indexReady.emit()
+        except Exception as e:
+            logger.error(traceback.format_exc())
+
+    def IndexReady(self):
+        self.index = RecipeIndex.Instance()
+        StateSignals.Instance().Connect(self.ShowCurrent)
+        if not self.hasFocus():
+            self.ShowRecipe(StateManager.lastSavedState)
+        elif self.text() != "":
+            self.Search(self.text())
+
+    def Search(self, text):
+        if self.index is None:
+            return
+        self.results.SetResults(self.index.Search(text, self.limit))
+        if len(self.results.results) > 0:
+            self.picker.setWidget(self)
+            self.picker.complete()
+        else:
+            self.picker.popup().hide()
+
+    def Picked(self, index):
+        recipe = index.data(Qt.ItemDataRole.UserRole)
+        if recipe is not None:
+            self.setText(index.data(Qt.ItemDataRole.DisplayRole))
+            self.recipeSelected.emit(recipe)
+
+    def ShowCurrent(self, changes, state):
+        if self.hasFocus():
+            return
+        if any(c["path"] == "" or c["path"] == "current" or c["path"].startswith("current.recipe")
+               for c in changes):
+            self.ShowRecipe(state)
+
+    def ShowRecipe(self, state):
+        recipe = deep_get(state, "current.recipe")
+        name = deep_get(state, f"recipes.{recipe}.name") if recipe is not None else None
+        self.setText(str(name if name is not None else recipe or ""))
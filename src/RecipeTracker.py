@@ -1,97 +1,46 @@
 #!/usr/bin/env python3
 # -*- coding: utf-8 -*-
 
-import shutil
-import tarfile
-import qdarktheme
-import requests
-import urllib
+import asyncio
 import json
 import orjson
 import traceback
 import time
+import threading
 import os
 import unicodedata
 import sys
 import atexit
-import time
 import qtpy
 from qtpy.QtGui import *
 from qtpy.QtWidgets import *
 from qtpy.QtCore import *
 from packaging.version import parse
 from loguru import logger
+from .Bootstrap import bootstrap
 
-QCoreApplication.setAttribute(Qt.AA_ShareOpenGLContexts)
-
-if parse(qtpy.QT_VERSION).major == 6:
-    QImageReader.setAllocationLimit(0)
-
-App = QApplication(sys.argv)
-
-fmt = ("<green>{time:YYYY-MM-DD HH:mm:ss}</green> " +
-       "| <level>{level}</level> | " +
-       "<yellow>{file}</yellow>:<blue>{function}</blue>:<cyan>{line}</cyan> " +
-       "- <level>{message}</level>")
-
-if sys.stdout != None:
-    config = {
-        "handlers": [
-            {"sink": sys.stdout, "format": fmt},
-        ],
-    }
-    logger.configure(**config)
-else:
-    # Handle all uncaught exceptions and forward to loguru
-    def handle_exception(exc_type, exc_value, exc_traceback):
-        if issubclass(exc_type, KeyboardInterrupt):
-            sys.__excepthook__(exc_type, exc_value, exc_traceback)
-            return
-
-        logger.critical("Uncaught exception", exc_info=(
-            exc_type, exc_value, exc_traceback))
-
-    sys.excepthook = handle_exception
+App = None
 
-    class LoggerWriter(object):
-        def __init__(self, writer):
-            self._writer = writer
-            self._msg = ''
 
-        def write(self, message):
-            self._msg = self._msg + message
-            while '\n' in self._msg:
-                pos = self._msg.find('\n')
-                self._writer(self._msg[:pos])
-                self._msg = self._msg[pos+1:]
+def create_app(argv=None):
+    """Bootstraps logging and creates the QApplication, once. Nothing Qt
+    related is set up just by importing the package."""
+    global App
+    if App is not None:
+        return App
 
-        def flush(self):
-            if self._msg != '':
-                self._writer(self._msg)
-                self._msg = ''
+    bootstrap()
 
-    sys.stdout = LoggerWriter(logger.info)
-    sys.stderr = LoggerWriter(logger.error)
+    QCoreApplication.setAttribute(Qt.AA_ShareOpenGLContexts)
 
-logger.add(
-    "./logs/tsh.log",
-    format="[{time:YYYY-MM-DD HH:mm:ss}] - {level} - {file}:{function}:{line} | {message}",
-    encoding="utf-8",
-    level="INFO",
-    rotation="20 MB"
-)
+    if parse(qtpy.QT_VERSION).major == 6:
+        QImageReader.setAllocationLimit(0)
 
-logger.add(
-    "./logs/tsh-error.log",
-    format="[{time:YYYY-MM-DD HH:mm:ss}] - {level} - {file}:{function}:{line} | {message}",
-    encoding="utf-8",
-    level="ERROR",
-    rotation="20 MB"
-)
+    App = QApplication(sys.argv if argv is None else argv)
 
-logger.critical("=== TSH IS STARTING ===")
+    logger.info("QApplication successfully initialized")
+    return App
 
-logger.info("QApplication successfully initialized")
 
 # autopep8: off
 # from .Settings.TSHSettingsWindow import TSHSettingsWindow
@@ -110,18 +59,27 @@ logger.info("QApplication successfully initialized")
 # from .Helpers.TSHCountryHelper import TSHCountryHelper
 # from .TSHScoreboardManager import TSHScoreboardManager
 # from .TSHThumbnailSettingsWidget import TSHThumbnailSettingsWidget
-# from src.TSHAssetDownloader import TSHAssetDownloader
 # from src.TSHAboutWidget import TSHAboutWidget
 # from .TSHScoreboardStageWidget import TSHScoreboardStageWidget
-# from src.TSHWebServer import WebServer
 # autopep8: on
-from.StateManager import StateManager
+from .StateManager import StateManager
+from .TSHWebServer import WebServer
+from .CheckboxWidget import RecipeChecklistWidget, StateSignals
+from .RecipePicker import RecipePicker
+from .RecipeEngine import RecipeEngine
+from .LayoutMigrator import LayoutMigrator
+from .TSHAssetDownloader import TSHAssetDownloader
 
 class WindowSignals(QObject):
     StopTimer = Signal()
 
+class MigrationSignals(QObject):
+    progress = Signal(int, int)
+    finished = Signal()
+
 class Window(QMainWindow):
     signals = WindowSignals()
+    startupScheduled = False
 
     def __init__(self, loop):
         super().__init__()
@@ -135,10 +93,6 @@ class Window(QMainWindow):
         #     QPixmap('assets/icons/icon.png').scaled(128, 128))
         # splash.show()
 
-        time.sleep(0.1)
-
-        App.processEvents()
-
         self.programState = {}
         self.savedProgramState = {}
         self.programStateDiff = {}
@@ -199,10 +153,17 @@ class Window(QMainWindow):
         # TSHScoreboardManager.instance.setWindowTitle(
         #     QApplication.translate("app", "Scoreboard Manager"))
 
-        # self.webserver = WebServer(
-        #     parent=None, stageWidget=self.stageWidget)
-        # StateManager.webServer = self.webserver
-        # self.webserver.start()
+        self.webserver = WebServer(parent=None)
+        StateManager.webServer = self.webserver
+        self.webserver.start()
+
+        # Its list needs the saved state, it is filled in by
+        # DeferredStartup once the state is loaded off the UI thread
+        checklist = QDockWidget(QApplication.translate("app", "Checklist"))
+        checklist.setObjectName(QApplication.translate("app", "Checklist"))
+        self.addDockWidget(Qt.DockWidgetArea.BottomDockWidgetArea, checklist)
+        self.dockWidgets.append(checklist)
+        self.checklist = checklist
 
         # commentary = TSHCommentaryWidget()
         # commentary.setWindowIcon(QIcon('assets/icons/mic.svg'))
@@ -210,9 +171,10 @@ class Window(QMainWindow):
         # self.addDockWidget(Qt.DockWidgetArea.BottomDockWidgetArea, commentary)
         # self.dockWidgets.append(commentary)
 
-        self.tabifyDockWidget(self.scoreboard, self.stageWidget)
-        # self.tabifyDockWidget(self.scoreboard, commentary)
-        self.scoreboard.raise_()
+        for dock in self.dockWidgets[1:]:
+            self.tabifyDockWidget(self.dockWidgets[0], dock)
+        if len(self.dockWidgets) > 0:
+            self.dockWidgets[0].raise_()
 
         # Game
         base_layout = QHBoxLayout()
@@ -295,7 +257,7 @@ class Window(QMainWindow):
         action = self.optionsBt.menu().addAction(
             QApplication.translate("app", "Download assets"))
         action.setIcon(QIcon('assets/icons/download.svg'))
-        # action.triggered.connect(TSHAssetDownloader.instance.DownloadAssets)
+        action.triggered.connect(self.DownloadAssets)
         self.downloadAssetsAction = action
 
         action = self.optionsBt.menu().addAction(
@@ -305,16 +267,8 @@ class Window(QMainWindow):
         # action.setChecked(SettingsManager.Get("light_mode", False))
         action.toggled.connect(self.ToggleLightMode)
 
-        toggleWidgets = QMenu(QApplication.translate(
-            "app", "Toggle widgets") + menu_margin, self.optionsBt.menu())
-        self.optionsBt.menu().addMenu(toggleWidgets)
-        toggleWidgets.addAction(self.scoreboard.toggleViewAction())
-        toggleWidgets.addAction(self.stageWidget.toggleViewAction())
-        # toggleWidgets.addAction(commentary.toggleViewAction())
-        # toggleWidgets.addAction(thumbnailSetting.toggleViewAction())
-        # toggleWidgets.addAction(tournamentInfo.toggleViewAction())
-        # toggleWidgets.addAction(playerList.toggleViewAction())
-        # toggleWidgets.addAction(bracket.toggleViewAction())
+        self.AddLazyMenu(QApplication.translate(
+            "app", "Toggle widgets") + menu_margin, self.BuildToggleWidgetsMenu)
 
         self.optionsBt.menu().addSeparator()
 
@@ -324,17 +278,140 @@ class Window(QMainWindow):
 
         self.optionsBt.menu().addSeparator()
 
-        languageSelect = QMenu(QApplication.translate(
-            "app", "Program Language") + menu_margin, self.optionsBt.menu())
-        self.optionsBt.menu().addMenu(languageSelect)
+        # Secondary menus are only filled in when they are first opened
+        self.AddLazyMenu(QApplication.translate(
+            "app", "Program Language") + menu_margin, self.BuildProgramLanguageMenu)
+        self.AddLazyMenu(QApplication.translate(
+            "app", "Game Asset Language") + menu_margin, self.BuildGameAssetLanguageMenu)
+        self.AddLazyMenu(QApplication.translate(
+            "app", "Tournament term language") + menu_margin, self.BuildTermLanguageMenu)
+
+        self.optionsBt.menu().addSeparator()
+
+        self.AddLazyMenu(QApplication.translate(
+            "app", "Help") + menu_margin, self.BuildHelpMenu)
+
+        # self.settingsWindow = TSHSettingsWindow(self)
+
+        # action = self.optionsBt.menu().addAction(
+        #     QApplication.translate("Settings", "Settings"))
+        # action.setIcon(QIcon('assets/icons/settings.svg'))
+        # action.triggered.connect(lambda: self.settingsWindow.show())
+
+        # Game Select and Scoreboard Count
+        hbox = QHBoxLayout()
+        group_box.layout().addLayout(hbox)
+
+        # Searches an index instead of filtering every item per keystroke
+        self.gameSelect = RecipePicker()
+        self.gameSelect.setFont(self.font_small)
+        self.gameSelect.recipeSelected.connect(self.SelectRecipe)
+        # self.gameSelect.activated.connect(
+        #     lambda x: TSHGameAssetManager.instance.LoadGameAssets(self.gameSelect.currentData()))
+        # TSHGameAssetManager.instance.signals.onLoad.connect(
+        #     self.SetGame)
+        # TSHGameAssetManager.instance.signals.onLoadAssets.connect(
+        #     self.ReloadGames)
+        # TSHGameAssetManager.instance.signals.onLoad.connect(
+        #     TSHAssetDownloader.instance.CheckAssetUpdates
+        # )
+        # TSHAssetDownloader.instance.signals.AssetUpdates.connect(
+        #     self.OnAssetUpdates
+        # )
+        # TSHTournamentDataProvider.instance.signals.tournament_changed.connect(
+        #     self.SetGame)
+
+        pre_base_layout.addLayout(base_layout)
+        hbox.addWidget(self.gameSelect)
+
+        self.scoreboardAmount = QSpinBox()
+        self.scoreboardAmount.setMaximumWidth(100)
+        self.scoreboardAmount.lineEdit().setReadOnly(True)
+        self.scoreboardAmount.setMinimum(1)
+        self.scoreboardAmount.setMaximum(10)
 
-        languageSelectGroup = QActionGroup(languageSelect)
+        # self.scoreboardAmount.valueChanged.connect(
+        #     lambda val:
+        #     TSHScoreboardManager.instance.signals.ScoreboardAmountChanged.emit(
+        #         val)
+        # )
+
+        label_margin = " "*18
+        label = QLabel(
+            label_margin + QApplication.translate("app", "Number of Scoreboards"))
+        label.setSizePolicy(QSizePolicy.Policy.Fixed,
+                            QSizePolicy.Policy.Minimum)
+
+        self.btLoadModifyTabName = QPushButton(
+            QApplication.translate("app", "Modify Tab Name"))
+        self.btLoadModifyTabName.setSizePolicy(
+            QSizePolicy.Policy.Fixed, QSizePolicy.Policy.Minimum)
+        self.btLoadModifyTabName.clicked.connect(self.ChangeTab)
+
+        hbox.addWidget(label)
+        hbox.addWidget(self.scoreboardAmount)
+        hbox.addWidget(self.btLoadModifyTabName)
+
+        # TSHScoreboardManager.instance.UpdateAmount(1)
+
+        self.qtSettings = QSettings("joao_shino", "TournamentStreamHelper")
+
+        if self.qtSettings.value("geometry"):
+            self.restoreGeometry(self.qtSettings.value("geometry"))
+
+        if self.qtSettings.value("windowState"):
+            self.restoreState(self.qtSettings.value("windowState"))
+
+        # splash.finish(self)
+        # Update checks and game loading happen after the first paint,
+        # see event(). The timer covers a window that is never painted.
+        self.show()
+        QTimer.singleShot(500, self.StartDeferred)
+
+        # TSHCountryHelper.LoadCountries()
+        # self.settingsWindow.UiMounted()
+        # TSHTournamentDataProvider.instance.UiMounted()
+        # TSHGameAssetManager.instance.UiMounted()
+        # TSHAlertNotification.instance.UiMounted()
+        # TSHAssetDownloader.instance.UiMounted()
+        # TSHHotkeys.instance.UiMounted(self)
+        # TSHPlayerDB.LoadDB()
+
+        StateManager.ReleaseSaving()
+
+        # TSHScoreboardManager.instance.signals.ScoreboardAmountChanged.connect(
+        #     self.ToggleTopOption)
+
+    def AddLazyMenu(self, title, build):
+        """Adds a submenu to the options menu that `build(menu)` fills in
+        right before it is shown for the first time."""
+        menu = QMenu(title, self.optionsBt.menu())
+        self.optionsBt.menu().addMenu(menu)
+
+        def populate():
+            menu.aboutToShow.disconnect(populate)
+            build(menu)
+
+        menu.aboutToShow.connect(populate)
+        return menu
+
+    def BuildToggleWidgetsMenu(self, menu):
+        for dock in self.dockWidgets:
+            menu.addAction(dock.toggleViewAction())
+        # toggleWidgets.addAction(commentary.toggleViewAction())
+        # toggleWidgets.addAction(thumbnailSetting.toggleViewAction())
+        # toggleWidgets.addAction(tournamentInfo.toggleViewAction())
+        # toggleWidgets.addAction(playerList.toggleViewAction())
+        # toggleWidgets.addAction(bracket.toggleViewAction())
+
+    def BuildProgramLanguageMenu(self, menu):
+        languageSelectGroup = QActionGroup(menu)
         languageSelectGroup.setExclusive(True)
 
         # program_language_messagebox = generate_restart_messagebox(
         #     QApplication.translate("app", "Program language changed successfully."))
 
-        action = languageSelect.addAction(
+        action = menu.addAction(
             QApplication.translate("app", "System language"))
         languageSelectGroup.addAction(action)
         action.setCheckable(True)
@@ -345,7 +422,7 @@ class Window(QMainWindow):
         # ])
 
         # for code, language in TSHLocaleHelper.languages.items():
-        #     action = languageSelect.addAction(f"{language[0]} / {language[1]}")
+        #     action = menu.addAction(f"{language[0]} / {language[1]}")
         #     action.setCheckable(True)
         #     languageSelectGroup.addAction(action)
         #     action.triggered.connect(lambda x=None, c=code: [
@@ -355,17 +432,14 @@ class Window(QMainWindow):
         #     if SettingsManager.Get("program_language") == code:
         #         action.setChecked(True)
 
-        languageSelect = QMenu(QApplication.translate(
-            "app", "Game Asset Language") + menu_margin, self.optionsBt.menu())
-        self.optionsBt.menu().addMenu(languageSelect)
-
-        languageSelectGroup = QActionGroup(languageSelect)
+    def BuildGameAssetLanguageMenu(self, menu):
+        languageSelectGroup = QActionGroup(menu)
         languageSelectGroup.setExclusive(True)
 
         # game_asset_language_messagebox = generate_restart_messagebox(
         #     QApplication.translate("app", "Game Asset Language changed successfully."))
 
-        action = languageSelect.addAction(
+        action = menu.addAction(
             QApplication.translate("app", "Same as program language"))
         languageSelectGroup.addAction(action)
         action.setCheckable(True)
@@ -376,7 +450,7 @@ class Window(QMainWindow):
         # ])
 
         # for code, language in TSHLocaleHelper.languages.items():
-        #     action = languageSelect.addAction(f"{language[0]} / {language[1]}")
+        #     action = menu.addAction(f"{language[0]} / {language[1]}")
         #     action.setCheckable(True)
         #     languageSelectGroup.addAction(action)
         #     action.triggered.connect(lambda x=None, c=code: [
@@ -386,17 +460,14 @@ class Window(QMainWindow):
         #     if SettingsManager.Get("game_asset_language") == code:
         #         action.setChecked(True)
 
-        languageSelect = QMenu(QApplication.translate(
-            "app", "Tournament term language") + menu_margin, self.optionsBt.menu())
-        self.optionsBt.menu().addMenu(languageSelect)
-
-        languageSelectGroup = QActionGroup(languageSelect)
+    def BuildTermLanguageMenu(self, menu):
+        languageSelectGroup = QActionGroup(menu)
         languageSelectGroup.setExclusive(True)
 
         # fg_language_messagebox = generate_restart_messagebox(
         #     QApplication.translate("app", "Tournament term language changed successfully."))
 
-        action = languageSelect.addAction(
+        action = menu.addAction(
             QApplication.translate("app", "Same as program language"))
         languageSelectGroup.addAction(action)
         action.setCheckable(True)
@@ -407,7 +478,7 @@ class Window(QMainWindow):
         # ])
 
         # for code, language in TSHLocaleHelper.languages.items():
-        #     action = languageSelect.addAction(f"{language[0]} / {language[1]}")
+        #     action = menu.addAction(f"{language[0]} / {language[1]}")
         #     action.setCheckable(True)
         #     languageSelectGroup.addAction(action)
         #     action.triggered.connect(lambda x=None, c=code: [
@@ -417,19 +488,15 @@ class Window(QMainWindow):
         #     if SettingsManager.Get("fg_term_language") == code:
         #         action.setChecked(True)
 
-        self.optionsBt.menu().addSeparator()
-
+    def BuildHelpMenu(self, menu):
         # Help menu code
-        help_messagebox = QMessageBox()
+        help_messagebox = QMessageBox(self)
         help_messagebox.setWindowTitle(
             QApplication.translate("app", "Warning"))
         help_messagebox.setText(QApplication.translate(
             "app", "A new window has been opened in your default webbrowser."))
 
-        helpMenu = QMenu(QApplication.translate(
-            "app", "Help") + menu_margin, self.optionsBt.menu())
-        self.optionsBt.menu().addMenu(helpMenu)
-        action = helpMenu.addAction(
+        action = menu.addAction(
             QApplication.translate("app", "Open the Wiki"))
         wiki_url = "https://github.com/joaorb64/TournamentStreamHelper/wiki"
         action.triggered.connect(lambda x=None: [
@@ -437,7 +504,7 @@ class Window(QMainWindow):
             help_messagebox.exec()
         ])
 
-        action = helpMenu.addAction(
+        action = menu.addAction(
             QApplication.translate("app", "Look for Help on the forum"))
         help_url = "https://github.com/joaorb64/TournamentStreamHelper/discussions/categories/q-a"
         action.triggered.connect(lambda x=None: [
@@ -445,7 +512,7 @@ class Window(QMainWindow):
             help_messagebox.exec()
         ])
 
-        action = helpMenu.addAction(
+        action = menu.addAction(
             QApplication.translate("app", "Report a bug"))
         issues_url = "https://github.com/joaorb64/TournamentStreamHelper/issues"
         action.triggered.connect(lambda x=None: [
@@ -453,7 +520,7 @@ class Window(QMainWindow):
             help_messagebox.exec()
         ])
 
-        action = helpMenu.addAction(
+        action = menu.addAction(
             QApplication.translate("app", "Ask for Help on Discord"))
         discord_url = "https://discord.gg/X9Sp2FkcHF"
         action.triggered.connect(lambda x=None: [
@@ -461,9 +528,9 @@ class Window(QMainWindow):
             help_messagebox.exec()
         ])
 
-        helpMenu.addSeparator()
+        menu.addSeparator()
 
-        action = helpMenu.addAction(
+        action = menu.addAction(
             QApplication.translate("app", "Contribute to the Asset Database"))
         asset_url = "https://github.com/joaorb64/StreamHelperAssets/"
         action.triggered.connect(lambda x=None: [
@@ -471,102 +538,85 @@ class Window(QMainWindow):
             help_messagebox.exec()
         ])
 
-        # self.settingsWindow = TSHSettingsWindow(self)
-
-        # action = self.optionsBt.menu().addAction(
-        #     QApplication.translate("Settings", "Settings"))
-        # action.setIcon(QIcon('assets/icons/settings.svg'))
-        # action.triggered.connect(lambda: self.settingsWindow.show())
-
-        # Game Select and Scoreboard Count
-        hbox = QHBoxLayout()
-        group_box.layout().addLayout(hbox)
-
-        self.gameSelect = QComboBox()
-        self.gameSelect.setEditable(True)
-        self.gameSelect.completer().setFilterMode(Qt.MatchFlag.MatchContains)
-        self.gameSelect.completer().setCompletionMode(QCompleter.PopupCompletion)
-        proxyModel = QSortFilterProxyModel()
-        proxyModel.setSortCaseSensitivity(Qt.CaseSensitivity.CaseInsensitive)
-        proxyModel.setSourceModel(self.gameSelect.model())
-        self.gameSelect.model().setParent(proxyModel)
-        self.gameSelect.setModel(proxyModel)
-        self.gameSelect.setFont(self.font_small)
-        # self.gameSelect.activated.connect(
-        #     lambda x: TSHGameAssetManager.instance.LoadGameAssets(self.gameSelect.currentData()))
-        # TSHGameAssetManager.instance.signals.onLoad.connect(
-        #     self.SetGame)
-        # TSHGameAssetManager.instance.signals.onLoadAssets.connect(
-        #     self.ReloadGames)
-        # TSHGameAssetManager.instance.signals.onLoad.connect(
-        #     TSHAssetDownloader.instance.CheckAssetUpdates
-        # )
-        # TSHAssetDownloader.instance.signals.AssetUpdates.connect(
-        #     self.OnAssetUpdates
-        # )
-        # TSHTournamentDataProvider.instance.signals.tournament_changed.connect(
-        #     self.SetGame)
-
-        pre_base_layout.addLayout(base_layout)
-        hbox.addWidget(self.gameSelect)
-
-        self.scoreboardAmount = QSpinBox()
-        self.scoreboardAmount.setMaximumWidth(100)
-        self.scoreboardAmount.lineEdit().setReadOnly(True)
-        self.scoreboardAmount.setMinimum(1)
-        self.scoreboardAmount.setMaximum(10)
-
-        # self.scoreboardAmount.valueChanged.connect(
-        #     lambda val:
-        #     TSHScoreboardManager.instance.signals.ScoreboardAmountChanged.emit(
-        #         val)
-        # )
-
-        label_margin = " "*18
-        label = QLabel(
-            label_margin + QApplication.translate("app", "Number of Scoreboards"))
-        label.setSizePolicy(QSizePolicy.Policy.Fixed,
-                            QSizePolicy.Policy.Minimum)
-
-        self.btLoadModifyTabName = QPushButton(
-            QApplication.translate("app", "Modify Tab Name"))
-        self.btLoadModifyTabName.setSizePolicy(
-            QSizePolicy.Policy.Fixed, QSizePolicy.Policy.Minimum)
-        self.btLoadModifyTabName.clicked.connect(self.ChangeTab)
-
-        hbox.addWidget(label)
-        hbox.addWidget(self.scoreboardAmount)
-        hbox.addWidget(self.btLoadModifyTabName)
-
-        # TSHScoreboardManager.instance.UpdateAmount(1)
+    def SelectRecipe(self, recipe):
+        try:
+            RecipeEngine.Select(recipe)
+        except Exception as e:
+            logger.error(traceback.format_exc())
+
+    def event(self, event):
+        result = super().event(event)
+        # The window has been painted once an UpdateRequest is handled
+        if event.type() == QEvent.Type.UpdateRequest and not self.startupScheduled:
+            QTimer.singleShot(0, self.StartDeferred)
+        return result
+
+    def StartDeferred(self):
+        if self.startupScheduled:
+            return
+        self.startupScheduled = True
+        asyncio.ensure_future(self.DeferredStartup(), loop=StateManager.loop)
+
+    async def DeferredStartup(self):
+        loop = asyncio.get_running_loop()
+        await loop.run_in_executor(None, StateManager.EnsureLoaded)
+        if StateSignals.BindingLeaks():
+            # Every toggle would bring the crash closer
+            logger.error(
+                f"PySide6 {qtpy.PYSIDE_VERSION} leaks references, the checklist is disabled")
+            self.checklist.setWidget(QLabel(QApplication.translate(
+                "app", "The checklist needs a different PySide6 version (6.7 works).")))
+            self.checklist.setEnabled(False)
+        else:
+            self.checklist.setWidget(RecipeChecklistWidget())
+
+        downloader = TSHAssetDownloader.Instance()
+        if downloader.indexUrl:
+            await loop.run_in_executor(None, downloader.CheckNow)
 
         self.CheckForUpdates(True)
         self.ReloadGames()
 
-        self.qtSettings = QSettings("joao_shino", "TournamentStreamHelper")
-
-        if self.qtSettings.value("geometry"):
-            self.restoreGeometry(self.qtSettings.value("geometry"))
-
-        if self.qtSettings.value("windowState"):
-            self.restoreState(self.qtSettings.value("windowState"))
-
-        # splash.finish(self)
-        self.show()
-
-        # TSHCountryHelper.LoadCountries()
-        # self.settingsWindow.UiMounted()
-        # TSHTournamentDataProvider.instance.UiMounted()
-        # TSHGameAssetManager.instance.UiMounted()
-        # TSHAlertNotification.instance.UiMounted()
-        # TSHAssetDownloader.instance.UiMounted()
-        # TSHHotkeys.instance.UiMounted(self)
-        # TSHPlayerDB.LoadDB()
-
-        StateManager.ReleaseSaving()
-
-        # TSHScoreboardManager.instance.signals.ScoreboardAmountChanged.connect(
-        #     self.ToggleTopOption)
+    def DownloadAssets(self):
+        downloader = TSHAssetDownloader.Instance()
+        progress = QProgressDialog(
+            QApplication.translate("app", "Downloading assets..."), None, 0, 1000, self)
+        progress.setWindowTitle(
+            QApplication.translate("app", "Download assets"))
+        progress.setMinimumWidth(400)
+        progress.setMinimumDuration(0)
+        progress.setAutoClose(False)
+        progress.setValue(0)
+
+        def UpdateProgress(pack, done, total):
+            progress.setLabelText(
+                f"{pack}: {done / 1048576:.1f} / {total / 1048576:.1f} MB")
+            progress.setValue(int(done * 1000 / total) if total > 0 else 0)
+
+        def Disconnect():
+            downloader.progress.disconnect(UpdateProgress)
+            downloader.finished.disconnect(Finished)
+            progress.close()
+
+        def Finished():
+            Disconnect()
+            failed = [pack for pack, result in downloader.results.items()
+                      if result["status"] == "error"]
+            if downloader.error is not None:
+                QMessageBox.warning(self, QApplication.translate("app", "Download assets"),
+                                    QApplication.translate("app", "Could not download assets:") + " " + downloader.error)
+            elif len(failed) > 0:
+                QMessageBox.warning(self, QApplication.translate("app", "Download assets"),
+                                    QApplication.translate("app", "Could not update:") + " " + ", ".join(failed))
+
+        # Before the download starts, a quick one may be done already
+        # by the time this returns
+        downloader.progress.connect(UpdateProgress)
+        downloader.finished.connect(Finished)
+        if not downloader.DownloadAssets():
+            Disconnect()
+            return
+        progress.show()
 
     def ChangeTab(self):
         tabNameWindow = QDialog(self)
@@ -610,15 +660,36 @@ class Window(QMainWindow):
         hbox = QHBoxLayout()
         label = QLabel(QApplication.translate("app", "File Path"))
         filePath = QLineEdit()
+        filePath.setPlaceholderText(QApplication.translate(
+            "app", "A layout file, a folder of layouts or a pattern like layout/**/*.js"))
         fileExplorer = QPushButton(
             text=QApplication.translate("app", "Find File..."))
+        folderExplorer = QPushButton(
+            text=QApplication.translate("app", "Find Folder..."))
         hbox.addWidget(label)
         hbox.addWidget(filePath)
         hbox.addWidget(fileExplorer)
+        hbox.addWidget(folderExplorer)
         vbox.addLayout(hbox)
 
+        preview = QPlainTextEdit()
+        preview.setReadOnly(True)
+        preview.setLineWrapMode(QPlainTextEdit.LineWrapMode.NoWrap)
+        preview.setMinimumHeight(300)
+        vbox.addWidget(preview)
+
+        progress = QProgressBar()
+        progress.setVisible(False)
+        vbox.addWidget(progress)
+
+        hbox = QHBoxLayout()
+        dryRun = QPushButton(
+            text=QApplication.translate("app", "Preview Changes"))
         migrate = QPushButton(
             text=QApplication.translate("app", "Migrate Layout"))
+        hbox.addWidget(dryRun)
+        hbox.addWidget(migrate)
+        vbox.addLayout(hbox)
 
         def open_dialog():
             fname, _ok = QFileDialog.getOpenFileName(
@@ -630,28 +701,77 @@ class Window(QMainWindow):
             if fname:
                 filePath.setText(str(fname))
 
-        fileExplorer.clicked.connect(open_dialog)
-
-        def MigrateLayout():
-            data = None
-            with open(filePath.text(), 'r') as file:
-                data = file.read()
-
-                data = data.replace("data.score.", "data.score[1].")
-                data = data.replace("oldData.score.", "oldData.score[1].")
-                data = data.replace(
-                    "_.get(data, \"score.stage_strike.", "_.get(data, \"score.1.stage_strike.")
-                data = data.replace(
-                    "_.get(oldData, \"score.stage_strike.", "_.get(oldData, \"score.1.stage_strike.")
-                data = data.replace(
-                    "source: `score.team.${t + 1}`", "source: `score.1.team.${t + 1}`")
-                data = data.replace(
-                    "data.score[1].ruleset", "data.score.ruleset")
-
-            with open(filePath.text(), 'w') as file:
-                file.write(data)
+        def open_folder_dialog():
+            folder = QFileDialog.getExistingDirectory(
+                migrateWindow,
+                QApplication.translate("app", "Open Layout Folder"),
+                os.getcwd(),
+            )
+            if folder:
+                filePath.setText(str(folder))
 
-            logger.info("Completed Layout Migration at: " + filePath.text())
+        fileExplorer.clicked.connect(open_dialog)
+        folderExplorer.clicked.connect(open_folder_dialog)
+
+        # Files are migrated on a worker thread, the dialog only hears
+        # about progress and picks the results up when it is done
+        signals = MigrationSignals(migrateWindow)
+        outcome = {}
+
+        def Run(target, isDryRun):
+            try:
+                migrator = LayoutMigrator(
+                    progress=lambda done, total, result: signals.progress.emit(done, total))
+                outcome["results"] = migrator.Migrate(target, dryRun=isDryRun)
+            except Exception as e:
+                logger.error(traceback.format_exc())
+                outcome["results"] = []
+            outcome["dryRun"] = isDryRun
+            signals.finished.emit()
+
+        def MigrateLayout(isDryRun=False):
+            target = filePath.text().strip()
+            if target == "":
+                return
+            dryRun.setEnabled(False)
+            migrate.setEnabled(False)
+            progress.setValue(0)
+            progress.setVisible(True)
+            preview.setPlainText(QApplication.translate("app", "Migrating..."))
+            threading.Thread(target=Run, args=(target, isDryRun),
+                             name="LayoutMigration", daemon=True).start()
+
+        def UpdateProgress(done, total):
+            progress.setMaximum(total)
+            progress.setValue(done)
+
+        def Finished():
+            dryRun.setEnabled(True)
+            migrate.setEnabled(True)
+            progress.setVisible(False)
+            results = outcome.get("results", [])
+            counts = {}
+            for result in results:
+                counts[result["status"]] = counts.get(result["status"], 0) + 1
+
+            lines = []
+            for result in results:
+                if result["status"] == "error":
+                    lines.append(f"{result['path']}: {result['error']}")
+                elif result["diff"]:
+                    lines.append(result["diff"])
+                elif result["status"] == "migrated":
+                    lines.append(
+                        f"{result['path']}: {result['replacements']} replacements")
+            summary = ", ".join(f"{n} {status}" for status, n in sorted(counts.items()))
+            preview.setPlainText("\n".join(
+                [summary or QApplication.translate("app", "No layout files found"), ""] + lines))
+
+            if outcome.get("dryRun"):
+                return
+
+            logger.info(
+                f"Completed Layout Migration at: {filePath.text()} ({summary})")
 
             completeDialog = QDialog(migrateWindow)
             completeDialog.setWindowTitle(
@@ -660,7 +780,7 @@ class Window(QMainWindow):
             vbox2 = QVBoxLayout()
             completeDialog.setLayout(vbox2)
             completeText = QLabel(QApplication.translate(
-                "app", "Layout Migration has completed!"))
+                "app", "Layout Migration has completed!") + "\n" + summary)
             completeText.setAlignment(Qt.AlignmentFlag.AlignCenter)
             closeButton = QPushButton(
                 text=QApplication.translate("app", "Close Window"))
@@ -669,8 +789,9 @@ class Window(QMainWindow):
             closeButton.clicked.connect(completeDialog.close)
             completeDialog.show()
 
-        migrate.clicked.connect(MigrateLayout)
-
-        vbox.addWidget(migrate)
+        signals.progress.connect(UpdateProgress)
+        signals.finished.connect(Finished)
+        dryRun.clicked.connect(lambda: MigrateLayout(True))
+        migrate.clicked.connect(lambda: MigrateLayout(False))
 
         migrateWindow.show()
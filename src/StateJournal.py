@@ -0,0 +1,172 @@
+import os
+import shutil
+import orjson
+import traceback
+from msgpack import packb, unpackb
+from loguru import logger
+from .Helpers.TSHDictHelper import deep_set, deep_unset, plain
+from .Helpers.TSHFileHelper import write_atomically
+
+
+class StateJournal:
+    """Write-ahead journal plus snapshot for the program state.
+
+    Every save appends one compact JSON line per change to the journal, so
+    its cost follows the size of the change. Once the journal grows past
+    `compactBytes` (or the size of the snapshot, whichever is larger, so
+    compacting a big state stays proportional to what was written), the
+    full state is written to the snapshot through a temp file and
+    os.replace and the journal starts over. StateManager also compacts on
+    shutdown. Replaying a change twice is harmless, so a crash
+    between those two steps loses nothing either.
+
+    Snapshots are meant for machines: `snapshotFormat` is "msgpack" or
+    "json", both without indentation. `legacyPath` is read when no snapshot
+    exists yet, e.g. an older pretty-printed program_state.json. It can be
+    newer than the journal, so nothing is appended to a journal before a
+    snapshot exists: the first save writes one.
+    """
+
+    def __init__(self, snapshotPath, journalPath, snapshotFormat="msgpack", legacyPath=None, compactBytes=1024*1024):
+        self.snapshotPath = snapshotPath
+        self.journalPath = journalPath
+        self.snapshotFormat = snapshotFormat
+        self.legacyPath = legacyPath
+        self.compactBytes = compactBytes
+        self.journalFile = None
+        self.journalSize = 0
+        self.snapshotSize = 0
+        self.hasSnapshot = False
+
+    def Dump(self, state, timestamp):
+        # The timestamp goes next to the state instead of into it, so the
+        # live dict never has to be touched
+        snapshot = {"timestamp": timestamp, "state": state}
+        if self.snapshotFormat == "msgpack":
+            return packb(snapshot, default=plain)
+        return orjson.dumps(snapshot, default=plain, option=orjson.OPT_NON_STR_KEYS)
+
+    def Load(self, data):
+        if self.snapshotFormat == "msgpack":
+            return unpackb(data, strict_map_key=False).get("state", {})
+        return orjson.loads(data).get("state", {})
+
+    def Encode(changes):
+        return b"".join(
+            orjson.dumps(
+                {"op": change["op"], "path": change["path"],
+                 "value": change.get("value")},
+                default=plain, option=orjson.OPT_NON_STR_KEYS) + b"\n"
+            for change in changes
+        )
+
+    def Append(self, data):
+        if self.journalFile is None:
+            self.journalFile = open(self.journalPath, 'ab')
+            self.journalSize = self.journalFile.tell()
+
+        self.journalFile.write(data)
+        self.journalFile.flush()
+        self.journalSize += len(data)
+
+    def NeedsCompaction(self):
+        # The journal is only ever replayed onto the snapshot it follows
+        if not self.hasSnapshot:
+            return True
+        if self.journalSize == 0:
+            return False
+        return self.journalSize >= max(self.compactBytes, self.snapshotSize)
+
+    def Compact(self, data):
+        """Replaces the snapshot with `data` and empties the journal."""
+        write_atomically(self.snapshotPath, data)
+        self.snapshotSize = len(data)
+        self.hasSnapshot = True
+
+        if self.journalFile is not None:
+            self.journalFile.close()
+        self.journalFile = open(self.journalPath, 'wb')
+        self.journalSize = 0
+
+    def Recover(self):
+        """Loads the last snapshot and replays the journal on top of it.
+
+        A torn line at the end of the journal (the process died while
+        appending) is dropped and cut off the file. Replay stops at a
+        change that cannot be applied, the rest of the journal is kept
+        next to it as .rejected.
+        """
+        state = None
+
+        if os.path.isfile(self.snapshotPath):
+            try:
+                with open(self.snapshotPath, 'rb') as file:
+                    data = file.read()
+                state = self.Load(data)
+                self.snapshotSize = len(data)
+                self.hasSnapshot = True
+            except Exception as e:
+                logger.error(traceback.format_exc())
+                # Out of the way of the next compaction
+                os.replace(self.snapshotPath, self.snapshotPath + ".corrupt")
+
+        if state is None and self.legacyPath is not None and os.path.isfile(self.legacyPath):
+            try:
+                with open(self.legacyPath, 'rb') as file:
+                    state = orjson.loads(file.read())
+                state.pop("timestamp", None)
+            except Exception as e:
+                logger.error(traceback.format_exc())
+                state = None
+
+        if state is None:
+            state = {}
+
+        try:
+            with open(self.journalPath, 'rb') as file:
+                validSize = 0
+                replayed = 0
+                rejected = False
+                for line in file:
+                    if not line.endswith(b"\n"):
+                        break
+                    try:
+                        change = orjson.loads(line)
+                    except orjson.JSONDecodeError:
+                        break
+                    try:
+                        state = StateJournal.Apply(state, change)
+                    except Exception as e:
+                        logger.error(
+                            f"Stopping journal replay at {change.get('op')} {change.get('path')!r}: {e!r}")
+                        rejected = True
+                        break
+                    validSize += len(line)
+                    replayed += 1
+
+            if validSize != os.path.getsize(self.journalPath):
+                if rejected:
+                    shutil.copyfile(self.journalPath, self.journalPath + ".rejected")
+                logger.warning(
+                    f"Dropping journal tail after {replayed} changes")
+                os.truncate(self.journalPath, validSize)
+
+            self.journalSize = validSize
+            if replayed > 0:
+                logger.info(f"Replayed {replayed} journaled changes")
+        except FileNotFoundError:
+            pass
+        except Exception as e:
+            # Keep whatever was loaded so far
+            logger.error(traceback.format_exc())
+
+        return state
+
+    def Apply(state, change):
+        if change["path"] == "":
+            return change["value"] if change["op"] != "remove" else {}
+        if change["op"] == "remove":
+            deep_unset(state, change["path"])
+        else:
+            deep_set(state, change["path"], change["value"])
+        return state
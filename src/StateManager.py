@@ -1,256 +1,653 @@
 """This is almost 100% torn from Tournament Stream Helper. I removed settings checking, because this app will be much smaller and not require settings."""
+import asyncio
 import os
 import orjson
 import traceback
-from deepdiff import DeepDiff, extract
-from functools import partial
-import shutil
 import threading
-import requests
-from PIL import Image
 import time
+import atexit
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
 from loguru import logger
-from .Helpers.TSHDictHelper import deep_get, deep_set, deep_unset, deep_clone
+from .StateWriter import StateWriter
+from .StateJournal import StateJournal
+from .TextExporter import TextExporter
+from .Metrics import Metrics
+from .Helpers.TSHDictHelper import deep_get, compile_path, mapping_types, plain, PersistentMap
+from .Helpers.TSHFileHelper import write_atomically
 
 
 class StateManager:
+    # state is copy-on-write: writers path-copy every dict they change
+    # unless it is in `owned` (dicts created since the last snapshot), so
+    # lastSavedState and other snapshots share everything that did not
+    # change and are never modified afterwards. Values handed to Set must
+    # not be mutated by the caller later on. The level right above the
+    # shards (all the recipes) is a PersistentMap, which only copies a few
+    # short nodes per write instead of every recipe.
     lastSavedState = {}
     state = {}
+    owned = {}
     saveBlocked = 0
+    blockLock = threading.Lock()
     webServer = None
 
+    # Key paths touched by Set/Unset since the last save. "" marks the
+    # whole tree (e.g. after LoadState).
+    dirtyKeys = set()
+    missing = object()
+
+    # Writers only lock the shard they write to: one per top-level
+    # namespace, or per deeper key where shardDepths says so, so every
+    # recipe is its own shard. Shards are striped over a fixed set of
+    # locks, so taking all of them costs the same however many recipes
+    # there are. rootLock covers dirtyKeys and the few dicts above the
+    # shards. Writes spanning several shards, snapshots and transactions
+    # take `lock`, and Freeze also takes every stripe. Get never locks,
+    # single dict reads are atomic so it sees every write either whole or
+    # not at all.
+    shardDepths = {"recipes": 2}
+    shards = [threading.RLock() for i in range(16)]
+    # Closed while Freeze collects the shard locks. Writers wait here
+    # rather than grabbing their shard again right away, which would
+    # starve Freeze while it holds the shards it already has.
+    writeGate = threading.Event()
+    writeGate.set()
+    rootLock = threading.Lock()
     lock = threading.RLock()
-    threads = []
     loop = None
 
+    # Per thread: the undo log of its open transaction, a list of
+    # (key, previous value), and the shards it keeps until it ends
+    local = threading.local()
+
+    # Collects and publishes changes shortly after a write, off the
+    # writer's thread, so bursts of writes are saved as one batch
+    publisher = None
+    savePending = False
+
+    # Runs the blocking half of aset/aunset/aflush. One worker, so async
+    # writes are applied in the order they were awaited.
+    executor = None
+    # (event loop, asyncio.Queue) for every changes() iterator
+    subscribers = []
+    # Called with every saved batch of changes, in order, under `lock`,
+    # while lastSavedState is the state they lead to
+    listeners = []
+
+    # Seconds to wait for more changes before writing to disk
+    saveDebounce = 0.1
+    writer = None
+
+    # "msgpack" or "json", the compact snapshot the journal compacts into
+    snapshotFormat = "msgpack"
+    journal = None
+    # Changes saved but not yet handed to the journal
+    pendingChanges = []
+    compactRequested = False
+
+    # Human readable program_state.json, rewritten at most once per
+    # prettyExportInterval seconds. None disables it.
+    prettyExportInterval = 1.0
+    prettyDirty = False
+    lastPrettyExport = 0
+    prettyTimer = None
+
+    # Write every leaf of the state to its own file under ./out for OBS
+    exportText = True
+    exporter = None
+
+    # Nothing is read from or written to ./out until the state is first used
+    loaded = False
+
     def BlockSaving():
-        StateManager.saveBlocked += 1
-        logger.critical(
-            "Initial Block - Current Blocking Status: " + str(StateManager.saveBlocked))
+        blocked = StateManager.AdjustBlocked(1)
+        logger.debug(
+            "Initial Block - Current Blocking Status: " + str(blocked))
 
     def ReleaseSaving():
-        StateManager.saveBlocked -= 1
-        logger.critical(
-            "Release Block - Current Blocking Status: " + str(StateManager.saveBlocked))
-        if StateManager.saveBlocked == 0:
+        blocked = StateManager.AdjustBlocked(-1)
+        logger.debug(
+            "Release Block - Current Blocking Status: " + str(blocked))
+        if blocked == 0:
             StateManager.SaveState()
 
+    def AdjustBlocked(delta):
+        # Transactions on other threads change it too
+        with StateManager.blockLock:
+            StateManager.saveBlocked += delta
+            return StateManager.saveBlocked
+
+    def EnsureLoaded():
+        if StateManager.loaded:
+            return
+        with StateManager.lock:
+            if not StateManager.loaded:
+                os.makedirs("./out", exist_ok=True)
+                StateManager.LoadState()
+
     def SaveState():
+        # Nothing can have changed before the state is loaded, and
+        # loading it here would do so on whoever releases a block first
+        if not StateManager.loaded:
+            return
         if StateManager.saveBlocked == 0:
             with StateManager.lock:
-                StateManager.threads = []
-
-                def ExportAll(ref_diff):
-                    with open("./out/program_state.json", 'wb', buffering=8192) as file:
-                        # logger.info("SaveState")
-                        StateManager.state.update({"timestamp": time.time()})
-                        file.write(orjson.dumps(
-                            StateManager.state, option=orjson.OPT_NON_STR_KEYS | orjson.OPT_INDENT_2))
-                        StateManager.state.pop("timestamp")
-                    StateManager.lastSavedState = deep_clone(
-                        StateManager.state)
-
-                diff = DeepDiff(StateManager.lastSavedState,
-                                StateManager.state)
-
-                if len(diff) > 0:
+                StateManager.savePending = False
+                start = Metrics.Start()
+                changes = StateManager.CollectChanges()
+                Metrics.Stop("tsh_state_diff_seconds", start)
+
+                if len(changes) > 0:
+                    Metrics.Count("tsh_state_saves_total")
+                    Metrics.Count("tsh_state_changes_total", len(changes))
                     try:
                         if StateManager.webServer is not None:
-                            StateManager.webServer.emit(
-                                'program_state', StateManager.state)
+                            StateManager.webServer.PushChanges(changes)
                     except Exception as e:
                         logger.error(traceback.format_exc())
 
-                    exportThread = threading.Thread(
-                        target=partial(ExportAll, ref_diff=diff))
-                    StateManager.threads.append(exportThread)
-                    exportThread.start()
+                    for listener in StateManager.listeners:
+                        try:
+                            listener(changes)
+                        except Exception as e:
+                            logger.error(traceback.format_exc())
 
-                    for t in StateManager.threads:
-                        t.join()
+                    StateManager.pendingChanges.extend(changes)
+                    StateManager.GetWriter().Schedule()
+                    StateManager.Publish(changes)
+
+    def RequestSave():
+        if StateManager.saveBlocked == 0 and not StateManager.savePending:
+            StateManager.savePending = True
+            StateManager.GetPublisher().Schedule()
+
+    def Publish(changes):
+        for subscriber in list(StateManager.subscribers):
+            loop, queue = subscriber
+            try:
+                loop.call_soon_threadsafe(queue.put_nowait, changes)
+            except RuntimeError:
+                # Its loop is closed, nobody is listening anymore
+                StateManager.subscribers.remove(subscriber)
+
+    def ExportAll():
+        snapshot = None
+        journalData = None
+        pretty = None
+        timestamp = time.time()
+        journal = StateManager.GetJournal()
 
-    def LoadState():
-        try:
-            with open("./out/program_state.json", 'rb') as file:
-                StateManager.state = orjson.loads(file.read())
-        except Exception as e:
-            logger.error(traceback.format_exc())
-            StateManager.state = {}
-            StateManager.SaveState()
+        with StateManager.lock:
+            changes = StateManager.pendingChanges
+            StateManager.pendingChanges = []
+            # Exactly the state those changes lead to, and no need to stop
+            # the writers for a Freeze
+            state = StateManager.lastSavedState
+
+            if len(changes) > 0:
+                StateManager.prettyDirty = True
+
+            forced = StateManager.compactRequested
+            compact = forced or journal.NeedsCompaction()
+            StateManager.compactRequested = False
+
+            prettyWait = None
+            writePretty = False
+            if StateManager.prettyExportInterval is not None and StateManager.prettyDirty:
+                prettyWait = StateManager.lastPrettyExport + \
+                    StateManager.prettyExportInterval - time.monotonic()
+                if forced or prettyWait <= 0:
+                    writePretty = True
+                    StateManager.prettyDirty = False
+                    StateManager.lastPrettyExport = time.monotonic()
+
+        # Everything below works on frozen trees, no lock needed
+        start = Metrics.Start()
+        if compact:
+            snapshot = journal.Dump(state, timestamp)
+            Metrics.Stop("tsh_state_serialize_seconds", start, file="snapshot")
+        elif len(changes) > 0:
+            journalData = StateJournal.Encode(changes)
+            Metrics.Stop("tsh_state_serialize_seconds", start, file="journal")
+
+        if writePretty:
+            # logger.info("SaveState")
+            start = Metrics.Start()
+            pretty = orjson.dumps(
+                dict(state, timestamp=timestamp), default=plain,
+                option=orjson.OPT_NON_STR_KEYS | orjson.OPT_INDENT_2)
+            Metrics.Stop("tsh_state_serialize_seconds", start, file="pretty")
+
+        start = Metrics.Start()
+        if snapshot is not None:
+            journal.Compact(snapshot)
+            Metrics.Stop("tsh_state_disk_write_seconds", start, file="snapshot")
+            Metrics.Count("tsh_state_disk_bytes_total", len(snapshot), file="snapshot")
+        elif journalData is not None:
+            journal.Append(journalData)
+            Metrics.Stop("tsh_state_disk_write_seconds", start, file="journal")
+            Metrics.Count("tsh_state_disk_bytes_total", len(journalData), file="journal")
+
+        if pretty is not None:
+            start = Metrics.Start()
+            write_atomically("./out/program_state.json", pretty)
+            Metrics.Stop("tsh_state_disk_write_seconds", start, file="pretty")
+            Metrics.Count("tsh_state_disk_bytes_total", len(pretty), file="pretty")
+        elif prettyWait is not None:
+            StateManager.SchedulePrettyExport(prettyWait)
+
+        if StateManager.exportText and len(changes) > 0:
+            StateManager.ExportText(changes)
+
+    def Freeze():
+        """Returns the current state tree and guarantees it will not be
+        modified anymore, so it can be read without holding the lock."""
+        StateManager.EnsureLoaded()
+        with StateManager.AllShards():
+            return StateManager.FreezeLocked()
+
+    def FreezeLocked():
+        # With every shard held
+        StateManager.owned = {}
+        return StateManager.state
+
+    def Shard(key):
+        """The lock of the shard `key` is in, None when it spans shards."""
+        keys = compile_path(key).keys
+        depth = StateManager.shardDepths.get(keys[0], 1)
+        if len(keys) < depth:
+            return None
+        shardKey = keys[0] if depth == 1 else ".".join(keys[:depth])
+        return StateManager.shards[hash(shardKey) % len(StateManager.shards)]
+
+    def ShardLock(key):
+        shard = StateManager.Shard(key)
+        return shard if shard is not None else StateManager.AllShards()
+
+    @contextmanager
+    def AllShards():
+        """Waits for every writer and keeps them out."""
+        with StateManager.lock:
+            StateManager.writeGate.clear()
+            shards = StateManager.shards
+            for shard in shards:
+                shard.acquire()
+            StateManager.writeGate.set()
+            try:
+                yield
+            finally:
+                for shard in shards:
+                    shard.release()
+
+    def SchedulePrettyExport(delay):
+        # Come back for the trailing export once the interval has passed
+        with StateManager.lock:
+            if StateManager.prettyTimer is not None and StateManager.prettyTimer.is_alive():
+                return
+            StateManager.prettyTimer = threading.Timer(
+                delay, StateManager.GetWriter().Schedule)
+            StateManager.prettyTimer.daemon = True
+            StateManager.prettyTimer.start()
+
+    def GetJournal():
+        with StateManager.lock:
+            if StateManager.journal is None:
+                extension = "msgpack" if StateManager.snapshotFormat == "msgpack" else "min.json"
+                StateManager.journal = StateJournal(
+                    f"./out/program_state.{extension}",
+                    "./out/program_state.journal",
+                    snapshotFormat=StateManager.snapshotFormat,
+                    legacyPath="./out/program_state.json")
+            return StateManager.journal
+
+    def GetPublisher():
+        if StateManager.publisher is None:
+            with StateManager.lock:
+                if StateManager.publisher is None:
+                    StateManager.publisher = StateWriter(
+                        StateManager.SaveState, 0, name="StatePublisher")
+                    StateManager.publisher.start()
+        return StateManager.publisher
 
-    def Set(key: str, value):
+    def GetWriter():
+        with StateManager.lock:
+            if StateManager.writer is None:
+                StateManager.writer = StateWriter(
+                    StateManager.ExportAll, StateManager.saveDebounce)
+                StateManager.writer.start()
+                atexit.register(StateManager.Flush, compact=True)
+            return StateManager.writer
+
+    def Flush(timeout=None, compact=False):
+        """Blocks until every scheduled save is on disk. Meant for shutdown
+        and tests, regular callers never need to wait for the writer.
+        With compact=True the journal is also folded into the snapshot."""
+        StateManager.SaveState()
+        if compact:
+            StateManager.compactRequested = True
+            StateManager.GetWriter().Schedule()
+        if StateManager.writer is not None:
+            return StateManager.writer.Flush(timeout)
+        return True
+
+    def CollectChanges():
+        """Turns the dirty key paths into a list of changes and makes the
+        current state the new lastSavedState, which only takes a reference
+        since the state is copy-on-write.
+
+        Each change is a dict with "op" ("add", "replace" or "remove") and
+        "path" (dotted key, "" for the whole state), plus "value" for the new
+        value and "old" for the previously saved one where they exist.
+        """
         with StateManager.lock:
-            # StateManager.lastSavedState = deep_clone(StateManager.state)
+            with StateManager.AllShards():
+                dirtyKeys = StateManager.dirtyKeys
+                StateManager.dirtyKeys = set()
+                new = StateManager.FreezeLocked()
+
+            # Writers carry on meanwhile, old and new are both frozen
+            old = StateManager.lastSavedState
+            StateManager.lastSavedState = new
+
+            if "" in dirtyKeys:
+                if old is new or old == new:
+                    return []
+                return [{"op": "replace", "path": "", "value": new, "old": old}]
+
+            changes = []
+
+            for key in StateManager.CollapseKeys(dirtyKeys):
+                oldValue = deep_get(old, key, StateManager.missing)
+                newValue = deep_get(new, key, StateManager.missing)
+
+                # Untouched subtrees are shared, so identity settles most keys
+                if oldValue is newValue:
+                    continue
+
+                if newValue is StateManager.missing:
+                    changes.append(
+                        {"op": "remove", "path": key, "old": oldValue})
+                elif oldValue is StateManager.missing:
+                    changes.append(
+                        {"op": "add", "path": key, "value": newValue})
+                elif oldValue != newValue:
+                    changes.append(
+                        {"op": "replace", "path": key, "value": newValue, "old": oldValue})
+
+            return changes
+
+    def CollapseKeys(keys):
+        # Drop keys whose ancestor is also dirty, the ancestor covers them
+        collapsed = set()
+        for key in sorted(keys, key=lambda k: k.count(".")):
+            parts = compile_path(key).keys
+            if not any(".".join(parts[:i]) in collapsed for i in range(1, len(parts))):
+                collapsed.add(key)
+        return sorted(collapsed)
 
-            deep_set(StateManager.state, key, value)
+    def LoadState():
+        with StateManager.AllShards():
+            try:
+                state = StateManager.GetJournal().Recover()
+            except Exception as e:
+                logger.error(traceback.format_exc())
+                state = {}
+            for top in StateManager.shardDepths:
+                state = StateManager.Widen(state, top)
+            StateManager.state = state
+            StateManager.lastSavedState = state
+            StateManager.owned = {}
+            StateManager.dirtyKeys = set()
+            StateManager.loaded = True
 
-            if StateManager.saveBlocked == 0:
-                StateManager.SaveState()
-                # StateManager.ExportText(oldState)
+    def Set(key: str, value):
+        start = Metrics.Start()
+        StateManager.EnsureLoaded()
+        StateManager.WaitForGate()
+        with StateManager.ShardLock(key):
+            StateManager.Remember(key)
+            StateManager.Assign(key, value)
+        StateManager.RequestSave()
+        Metrics.Stop("tsh_state_set_seconds", start)
 
     def Unset(key: str):
+        start = Metrics.Start()
+        StateManager.EnsureLoaded()
+        StateManager.WaitForGate()
+        with StateManager.ShardLock(key):
+            StateManager.Remember(key)
+            StateManager.Remove(key)
+        StateManager.RequestSave()
+        Metrics.Stop("tsh_state_unset_seconds", start)
+
+    def WaitForGate():
+        # A transaction may hold shards Freeze is waiting for, it goes on
+        if not StateManager.writeGate.is_set() and getattr(StateManager.local, "undoLog", None) is None:
+            StateManager.writeGate.wait()
+
+    def Assign(key, value):
+        # Copy-on-write inside the shard first, then link the new shard in
+        # under rootLock
+        with StateManager.ShardLock(key):
+            path = compile_path(key)
+            depth = StateManager.shardDepths.get(path.keys[0], 1)
+            if len(path.keys) <= depth:
+                if len(path.keys) < depth and isinstance(value, dict):
+                    value = PersistentMap(value, StateManager.owned)
+                with StateManager.rootLock:
+                    StateManager.state = path.assoc(
+                        StateManager.Widen(StateManager.state, path.keys[0], create=True),
+                        value, StateManager.owned)
+                    StateManager.dirtyKeys.add(key)
+                return
+
+            shardPath = compile_path(".".join(path.keys[:depth]))
+            shard = shardPath.get(StateManager.state, StateManager.missing)
+            if shard is StateManager.missing:
+                shard = {}
+            shard = compile_path(".".join(path.keys[depth:])).assoc(
+                shard, value, StateManager.owned)
+
+            with StateManager.rootLock:
+                StateManager.state = shardPath.assoc(
+                    StateManager.Widen(StateManager.state, path.keys[0], create=True),
+                    shard, StateManager.owned)
+                StateManager.dirtyKeys.add(key)
+
+    def Widen(state, top, create=False):
+        """`state` with its `top` level as a PersistentMap if that level is
+        above the shards. Converting costs as much as one copy of the
+        level, once (after loading or after it was Set as a dict). A
+        missing level is only added when `create`, for a write under it."""
+        if StateManager.shardDepths.get(top, 1) < 2:
+            return state
+        level = state.get(top, StateManager.missing)
+        if isinstance(level, PersistentMap):
+            return state
+        if level is StateManager.missing:
+            if not create:
+                return state
+            level = {}
+        elif not isinstance(level, dict):
+            return state
+        return compile_path(top).assoc(
+            state, PersistentMap(level, StateManager.owned), StateManager.owned)
+
+    def Remove(key):
+        with StateManager.ShardLock(key):
+            path = compile_path(key)
+            depth = StateManager.shardDepths.get(path.keys[0], 1)
+            if len(path.keys) <= depth:
+                with StateManager.rootLock:
+                    StateManager.state = path.dissoc(
+                        StateManager.Widen(StateManager.state, path.keys[0]),
+                        StateManager.owned)
+                    StateManager.dirtyKeys.add(key)
+                return
+
+            shardPath = compile_path(".".join(path.keys[:depth]))
+            rest = compile_path(".".join(path.keys[depth:]))
+            shard = shardPath.get(StateManager.state, StateManager.missing)
+            if isinstance(shard, dict) and rest.exists(shard):
+                shard = rest.dissoc(shard, StateManager.owned)
+                with StateManager.rootLock:
+                    StateManager.state = shardPath.assoc(
+                        StateManager.Widen(StateManager.state, path.keys[0]),
+                        shard, StateManager.owned)
+                    StateManager.dirtyKeys.add(key)
+            else:
+                with StateManager.rootLock:
+                    StateManager.dirtyKeys.add(key)
+
+    def Remember(key):
+        undoLog = getattr(StateManager.local, "undoLog", None)
+        if undoLog is None:
+            return
+        undoLog.append(StateManager.UndoEntry(key))
+        # Keep the shard (all of them for a spanning key) until the
+        # transaction ends, so that a rollback never undoes another
+        # thread's write
+        held = StateManager.local.held
+        shard = StateManager.Shard(key)
+        token = shard if shard is not None else "*"
+        if token not in held:
+            lock = shard if shard is not None else StateManager.AllShards()
+            lock.__enter__()
+            held[token] = lock
+
+    @contextmanager
+    def transaction():
+        """Groups Set/Unset calls into one save, disk write and web push.
+
+        Transactions nest. If the block raises, every write made inside it
+        is undone before the exception propagates.
+
+            with StateManager.transaction():
+                StateManager.Set("recipes.1.name", "Bread")
+                StateManager.Set("recipes.1.steps", steps)
+        """
+        StateManager.EnsureLoaded()
+        local = StateManager.local
         with StateManager.lock:
-            # StateManager.lastSavedState = deep_clone(StateManager.state)
-            deep_unset(StateManager.state, key)
-            if StateManager.saveBlocked == 0:
+            outermost = getattr(local, "undoLog", None) is None
+            if outermost:
+                local.undoLog = []
+                local.held = {}
+            mark = len(local.undoLog)
+            StateManager.AdjustBlocked(1)
+
+            try:
+                yield
+            except BaseException:
+                StateManager.Rollback(mark)
+                raise
+            finally:
+                blocked = StateManager.AdjustBlocked(-1)
+                if outermost:
+                    for lock in reversed(list(local.held.values())):
+                        lock.__exit__(None, None, None)
+                    local.undoLog = None
+                    local.held = None
+                # Even after a rollback: writes other threads made
+                # meanwhile were not saved while saving was blocked
+                if blocked == 0:
+                    StateManager.RequestSave()
+
+            if blocked == 0:
                 StateManager.SaveState()
-                # StateManager.ExportText(oldState)
-
-    def Get(key: str, default=None):
-        return deep_get(StateManager.state, key, default)
 
-    def ExportText(oldState, diff):
-        # logger.info("ExportState")
-        # logger.info(diff)
-
-        mergedDiffs = list(diff.get("values_changed", {}).items())
-        mergedDiffs.extend(list(diff.get("type_changes", {}).items()))
-
-        # logger.info(mergedDiffs)
-
-        for changeKey, change in mergedDiffs:
-            # Remove "root[" from start and separate keys
-            filename = "/".join(changeKey[5:].replace(
-                "'", "").replace("]", "").replace("/", "_").split("["))
-
-            # logger.info(filename)
-
-            if change.get("new_type") == type(None):
-                StateManager.RemoveFilesDict(
-                    filename, extract(oldState, changeKey))
+    def UndoEntry(key):
+        # Remember the shallowest missing level too, so that rolling back
+        # also drops the parents deep_assoc creates on the way
+        keys = compile_path(key).keys
+        d = StateManager.state
+        for i, k in enumerate(keys):
+            if not isinstance(d, mapping_types) or k not in d:
+                return (".".join(keys[:i+1]), StateManager.missing)
+            d = d[k]
+        return (key, d)
+
+    def Rollback(mark):
+        undoLog = StateManager.local.undoLog
+        for key, old in reversed(undoLog[mark:]):
+            if old is StateManager.missing:
+                StateManager.Remove(key)
             else:
-                StateManager.CreateFilesDict(
-                    filename, change.get("new_value"))
-
-        removedKeys = diff.get("dictionary_item_removed", {})
-
-        for key in removedKeys:
-            item = extract(oldState, key)
-
-            # Remove "root[" from start and separate keys
-            filename = "/".join(key[5:].replace(
-                "'", "").replace("]", "").replace("/", "_").split("["))
+                StateManager.Assign(key, old)
+        del undoLog[mark:]
 
-            # logger.info("Removed:", filename, item)
-
-            StateManager.RemoveFilesDict(filename, item)
-
-        addedKeys = diff.get("dictionary_item_added", {})
-
-        for key in addedKeys:
-            item = extract(StateManager.state, key)
-
-            # Remove "root[" from start and separate keys
-            path = "/".join(key[5:].replace(
-                "'", "").replace("]", "").replace("/", "_").split("["))
-
-            # logger.info("Added:", path, item)
+    def GetExecutor():
+        with StateManager.lock:
+            if StateManager.executor is None:
+                StateManager.executor = ThreadPoolExecutor(
+                    max_workers=1, thread_name_prefix="StateManager")
+            return StateManager.executor
+
+    async def aset(key: str, value):
+        """Set() without ever blocking the calling event loop on the state
+        lock or on saving."""
+        await asyncio.get_running_loop().run_in_executor(
+            StateManager.GetExecutor(), StateManager.Set, key, value)
+
+    async def aunset(key: str):
+        await asyncio.get_running_loop().run_in_executor(
+            StateManager.GetExecutor(), StateManager.Unset, key)
+
+    async def aflush(timeout=None, compact=False):
+        """Waits until everything set so far, aset calls included, is on
+        disk."""
+        return await asyncio.get_running_loop().run_in_executor(
+            StateManager.GetExecutor(), StateManager.Flush, timeout, compact)
+
+    async def changes(prefix=""):
+        """Yields every saved change (as in CollectChanges) touching
+        `prefix` or anything under it, in save order:
+
+            async for change in StateManager.changes("recipes.bread"):
+                ...
+
+        Changes are queued for each iterator until it gets to them.
+        """
+        queue = asyncio.Queue()
+        subscriber = (asyncio.get_running_loop(), queue)
+        with StateManager.lock:
+            StateManager.subscribers.append(subscriber)
+        try:
+            while True:
+                for change in await queue.get():
+                    path = change["path"]
+                    if prefix == "" or path == "" or path == prefix or \
+                            path.startswith(prefix + ".") or prefix.startswith(path + "."):
+                        yield change
+        finally:
+            with StateManager.lock:
+                if subscriber in StateManager.subscribers:
+                    StateManager.subscribers.remove(subscriber)
 
-            StateManager.CreateFilesDict(path, item)
+    def Get(key: str, default=None):
+        """The value at `key`, shared with the state and its snapshots: Set
+        a new value instead of modifying it. The level above the shards
+        ("recipes") is a PersistentMap, a Mapping but not a dict, and comes
+        as a copy of its own that writes cannot leak out of."""
+        StateManager.EnsureLoaded()
+        value = deep_get(StateManager.state, key, default)
+        if isinstance(value, PersistentMap):
+            return value.Copy({})
+        return value
+
+    def ExportText(changes):
+        StateManager.GetExporter().Export(changes)
+
+    def GetExporter():
+        with StateManager.lock:
+            if StateManager.exporter is None:
+                StateManager.exporter = TextExporter("./out")
+            return StateManager.exporter
 
     def CreateFilesDict(path, di):
-        pathdirs = "/".join(path.split("/")[0:-1])
-
-        if not os.path.isdir("./out/"+pathdirs):
-            os.makedirs("./out/"+pathdirs)
-
-        if type(di) == dict:
-            for k, i in di.items():
-                StateManager.CreateFilesDict(
-                    path+"/"+str(k).replace("/", "_"), i)
-        else:
-            # logger.info("try to add: ", path)
-            if type(di) == str and di.startswith("./"):
-                if os.path.exists(f"./out/{path}" + "." + di.rsplit(".", 1)[-1]):
-                    try:
-                        os.remove(f"./out/{path}" + "." +
-                                  di.rsplit(".", 1)[-1])
-                    except Exception as e:
-                        logger.error(traceback.format_exc())
-                if os.path.exists(di):
-                    try:
-                        os.link(os.path.abspath(di),
-                                f"./out/{path}" + "." + di.rsplit(".", 1)[-1])
-                    except Exception as e:
-                        logger.error(traceback.format_exc())
-            elif type(di) == str and di.startswith("http") and (di.endswith(".png") or di.endswith(".jpg")):
-                try:
-                    if os.path.exists(f"./out/{path}" + "." + di.rsplit(".", 1)[-1]):
-                        try:
-                            os.remove(f"./out/{path}" +
-                                      "." + di.rsplit(".", 1)[-1])
-                        except Exception as e:
-                            logger.error(traceback.format_exc())
-
-                    def downloadImage(url, dlpath):
-                        try:
-                            r = requests.get(url, stream=True)
-                            if r.status_code == 200:
-                                with open(dlpath, 'wb') as f:
-                                    r.raw.decode_content = True
-                                    shutil.copyfileobj(r.raw, f)
-                                    f.flush()
-                            if url.endswith(".jpg"):
-                                original = Image.open(dlpath)
-                                original.save(dlpath.rsplit(
-                                    ".", 1)[0]+".png", format="png")
-                                os.remove(dlpath)
-                        except Exception as e:
-                            logger.error(traceback.format_exc())
-
-                    t = threading.Thread(
-                        target=downloadImage,
-                        args=[
-                            di,
-                            f"./out/{path}" + "." + di.rsplit(".", 1)[-1]
-                        ]
-                    )
-                    StateManager.threads.append(t)
-                    t.start()
-                except Exception as e:
-                    logger.error(traceback.format_exc())
-            else:
-                with open(f"./out/{path}.txt", 'w', encoding='utf-8') as file:
-                    file.write(str(di))
+        StateManager.GetExporter().CreateFiles(path, di)
 
     def RemoveFilesDict(path, di):
-        pathdirs = "/".join(path.split("/")[0:-1])
-
-        if type(di) == dict:
-            for k, i in di.items():
-                StateManager.RemoveFilesDict(
-                    path+"/"+str(k).replace("/", "_"), i)
-        else:
-            if type(di) == str and (di.startswith("./") or di.startswith("http")):
-                try:
-                    removeFile = f"./out/{path}" + \
-                        "." + di.rsplit(".", 1)[-1]
-                    # logger.info("try to remove: ", removeFile)
-                    if os.path.exists(removeFile):
-                        os.remove(removeFile)
-                except:
-                    logger.error(traceback.format_exc())
-            else:
-                try:
-                    removeFile = f"./out/{path}.txt"
-                    # logger.info("try to remove: ", removeFile)
-                    if os.path.exists(removeFile):
-                        os.remove(removeFile)
-                except:
-                    logger.error(traceback.format_exc())
-
-        try:
-            # logger.info("Remove path", f"./out/{path}")
-            if os.path.exists(f"./out/{path}"):
-                shutil.rmtree(f"./out/{path}")
-        except:
-            logger.error(traceback.format_exc())
-
-
-if not os.path.exists("./out"):
-    os.makedirs("./out/")
-
-if not os.path.isfile("./out/program_state.json"):
-    StateManager.SaveState()
+        StateManager.GetExporter().RemoveFiles(path, di)
 
-StateManager.LoadState()
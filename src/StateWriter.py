@@ -0,0 +1,63 @@
+import threading
+import time
+import traceback
+from loguru import logger
+
+
+class StateWriter(threading.Thread):
+    """Long-lived thread that runs `write` after a debounce window.
+
+    Schedule() never blocks: every request that arrives while a write is
+    pending is merged into it, so a burst of changes costs a single write
+    and writes happen at most once per `debounce` seconds.
+    """
+
+    def __init__(self, write, debounce=0.1, name="StateWriter"):
+        super().__init__(name=name, daemon=True)
+        self.write = write
+        self.debounce = debounce
+        self.condition = threading.Condition()
+        self.requested = 0
+        self.written = 0
+        self.flushNow = False
+
+    def Schedule(self):
+        with self.condition:
+            self.requested += 1
+            self.condition.notify_all()
+
+    def Flush(self, timeout=None):
+        """Writes any pending request right away and waits for it."""
+        with self.condition:
+            target = self.requested
+            if self.written >= target:
+                return True
+            self.flushNow = True
+            self.condition.notify_all()
+            return self.condition.wait_for(
+                lambda: self.written >= target, timeout)
+
+    def run(self):
+        while True:
+            with self.condition:
+                self.condition.wait_for(
+                    lambda: self.requested > self.written)
+
+                deadline = time.monotonic() + self.debounce
+                while not self.flushNow:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        break
+                    self.condition.wait(remaining)
+
+                self.flushNow = False
+                target = self.requested
+
+            try:
+                self.write()
+            except Exception as e:
+                logger.error(traceback.format_exc())
+
+            with self.condition:
+                self.written = target
+                self.condition.notify_all()
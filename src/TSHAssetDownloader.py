@@ -0,0 +1,120 @@
+import os
+import threading
+import time
+import traceback
+from qtpy.QtCore import *
+from loguru import logger
+from .Helpers.TSHAssetPackHelper import AssetPackInstaller
+
+
+class TSHAssetDownloader(QObject):
+    """Checks for and installs asset pack updates in the background (see
+    AssetPackInstaller), reporting through signals:
+
+    - `AssetUpdates()` once CheckAssetUpdates found what can be updated,
+      in `updates`
+    - `progress(pack, bytesRead, totalBytes)`, at most every
+      `progressInterval` seconds per pack
+    - `packFinished(pack, ok)` and then `finished()` once every pack of a
+      DownloadAssets is done, with the results in `results` (or what kept
+      it from starting, such as an unreachable index, in `error`)
+
+    The index URL is the TSH_ASSET_INDEX environment variable unless
+    given. Results are kept on the object rather than sent through the
+    signals, which PySide does not keep reliably alive across threads.
+    """
+    AssetUpdates = Signal()
+    # Sizes past 2 GB do not fit in an int
+    progress = Signal(str, 'qint64', 'qint64')
+    packFinished = Signal(str, bool)
+    finished = Signal()
+
+    instance = None
+    progressInterval = 0.1
+
+    def __init__(self, indexUrl=None, root="./user_data/packs", parent=None):
+        super().__init__(parent)
+        self.indexUrl = indexUrl or os.environ.get("TSH_ASSET_INDEX")
+        self.root = root
+        self.installer = None
+        self.lock = threading.Lock()
+        self.running = False
+        self.updates = {}
+        self.results = {}
+        # Why the last DownloadAssets could not even start, if it could not
+        self.error = None
+        self.lastProgress = {}
+
+    def Instance():
+        if TSHAssetDownloader.instance is None:
+            TSHAssetDownloader.instance = TSHAssetDownloader()
+        return TSHAssetDownloader.instance
+
+    def Installer(self):
+        if self.installer is None:
+            self.installer = AssetPackInstaller(
+                self.indexUrl, root=self.root, progress=self.Progress)
+        return self.installer
+
+    def UiMounted(self):
+        if self.indexUrl:
+            self.CheckAssetUpdates()
+
+    def CheckAssetUpdates(self):
+        if not self.indexUrl:
+            logger.warning("No asset index configured (TSH_ASSET_INDEX)")
+            return
+        threading.Thread(target=self.CheckNow,
+                         name="AssetUpdates", daemon=True).start()
+
+    def CheckNow(self):
+        try:
+            self.updates = self.Installer().Updates()
+            logger.info(f"Asset pack updates: {', '.join(self.updates) or 'none'}")
+            self.AssetUpdates.emit()
+        except Exception as e:
+            logger.error(traceback.format_exc())
+
+    def DownloadAssets(self, packs=None):
+        """Installs or updates `packs`, every pack of the index by
+        default. Returns False if a download is already running."""
+        if not self.indexUrl:
+            logger.warning("No asset index configured (TSH_ASSET_INDEX)")
+            return False
+        with self.lock:
+            if self.running:
+                return False
+            self.running = True
+        threading.Thread(target=self.DownloadNow, args=(packs,),
+                         name="AssetDownload", daemon=True).start()
+        return True
+
+    def DownloadNow(self, packs):
+        self.lastProgress = {}
+        self.results = {}
+        self.error = None
+        try:
+            self.results = self.Installer().Install(packs)
+            for pack, result in self.results.items():
+                logger.info(
+                    f"Asset pack {pack}: {result['status']}, {result['written']} files written, "
+                    f"{result['unchanged']} unchanged, {result['removed']} removed")
+                self.packFinished.emit(pack, result["status"] != "error")
+            self.updates = {pack: update for pack, update in self.updates.items()
+                            if self.results.get(pack, {}).get("status") == "error"
+                            or pack not in self.results}
+        except Exception as e:
+            logger.error(traceback.format_exc())
+            self.error = str(e)
+        finally:
+            with self.lock:
+                self.running = False
+            self.finished.emit()
+
+    def Progress(self, pack, done, total):
+        # Worker threads, once per chunk received
+        now = time.monotonic()
+        if done < total and now - self.lastProgress.get(pack, 0) < TSHAssetDownloader.progressInterval:
+            return
+        self.lastProgress[pack] = now
+        self.progress.emit(pack, done, total)
@@ -0,0 +1,371 @@
+import asyncio
+import base64
+import hashlib
+import hmac
+import ipaddress
+import mimetypes
+import os
+import struct
+import threading
+import traceback
+from collections import deque
+from urllib.parse import unquote, urlsplit
+import orjson
+from loguru import logger
+from .StateManager import StateManager
+from .Metrics import Metrics
+from .Helpers.TSHDictHelper import plain
+
+WEBSOCKET_GUID = "258EAFA5-E914-47DA-95CA-C5AB0DC85B11"
+
+
+class WebSocketClient:
+    # Clients only send small requests, bigger frames close the socket
+    maxFrameSize = 1 << 20
+    # Messages waiting for a client that does not read. Past that it is
+    # closed, overlays reconnect and start over from a snapshot. Room for
+    # a whole catch up from the history.
+    maxQueued = 4096
+
+    def __init__(self, reader, writer):
+        self.reader = reader
+        self.writer = writer
+        self.queue = asyncio.Queue(maxsize=WebSocketClient.maxQueued)
+        self.closed = False
+        # Last delta sent, None while catching up. Deltas broadcast
+        # meanwhile are held and sent after.
+        self.seq = None
+        self.held = []
+
+    def Send(self, payload):
+        if self.closed:
+            return
+        try:
+            self.queue.put_nowait(payload)
+        except asyncio.QueueFull:
+            logger.warning("Closing a WebSocket client that stopped reading")
+            self.Close()
+            self.writer.transport.abort()
+
+    def Close(self):
+        self.closed = True
+        while not self.queue.empty():
+            self.queue.get_nowait()
+        # Wakes SendLoop up
+        self.queue.put_nowait(None)
+
+    def SendDelta(self, seq, payload):
+        if self.closed:
+            return
+        if self.seq is None:
+            if len(self.held) >= WebSocketClient.maxQueued:
+                logger.warning("Closing a WebSocket client that stopped reading")
+                self.Close()
+                self.writer.transport.abort()
+                return
+            self.held.append((seq, payload))
+        elif seq > self.seq:
+            self.seq = seq
+            self.Send(payload)
+
+    async def SendLoop(self):
+        try:
+            while not self.closed:
+                payload = await self.queue.get()
+                if payload is None:
+                    break
+                self.writer.write(WebSocketClient.Frame(0x1, payload))
+                await self.writer.drain()
+        except (ConnectionError, asyncio.CancelledError):
+            pass
+        finally:
+            self.closed = True
+
+    async def Receive(self):
+        """Returns the next text message, or None once the socket closed."""
+        while True:
+            header = await self.reader.readexactly(2)
+            opcode = header[0] & 0x0F
+            masked = header[1] & 0x80
+            length = header[1] & 0x7F
+
+            if length == 126:
+                length = struct.unpack("!H", await self.reader.readexactly(2))[0]
+            elif length == 127:
+                length = struct.unpack("!Q", await self.reader.readexactly(8))[0]
+
+            if length > WebSocketClient.maxFrameSize:
+                # 1009: message too big
+                self.writer.write(WebSocketClient.Frame(0x8, struct.pack("!H", 1009)))
+                return None
+
+            mask = await self.reader.readexactly(4) if masked else None
+            data = await self.reader.readexactly(length)
+
+            if mask is not None:
+                data = bytes(b ^ mask[i % 4] for i, b in enumerate(data))
+
+            if opcode == 0x8:
+                self.writer.write(WebSocketClient.Frame(0x8, b""))
+                return None
+            elif opcode == 0x9:
+                self.writer.write(WebSocketClient.Frame(0xA, data))
+            elif opcode == 0x1:
+                return data
+
+    def Frame(opcode, payload):
+        length = len(payload)
+        if length < 126:
+            header = struct.pack("!BB", 0x80 | opcode, length)
+        elif length < 65536:
+            header = struct.pack("!BBH", 0x80 | opcode, 126, length)
+        else:
+            header = struct.pack("!BBQ", 0x80 | opcode, 127, length)
+        return header + payload
+
+
+class WebServer(threading.Thread):
+    """Serves the overlay files and pushes state changes to the overlays.
+
+    Browser sources connect a WebSocket to /ws and get one message
+    {"type": "snapshot", "seq": n, "state": {...}}, followed by
+    {"type": "delta", "seq": n, "changes": [{"op", "path", "value"}]} for
+    every save. `path` is the same dotted key StateManager uses ("" is the
+    whole state). A client that notices a gap in `seq` sends
+    {"type": "resync", "since": lastSeq} and receives the missing deltas,
+    or a new snapshot if they are no longer in the history.
+
+    Only this computer can connect unless `host` (or the TSH_WEB_HOST
+    environment variable) says otherwise, e.g. "0.0.0.0" for the LAN.
+    """
+
+    # Routes only take small bodies (commands), bigger ones get a 413
+    maxBodySize = 1 << 16
+
+    def __init__(self, parent=None, host=None, port=5000, root="./overlay", historySize=1024):
+        super().__init__(name="WebServer", daemon=True)
+        self.host = host or os.environ.get("TSH_WEB_HOST", "127.0.0.1")
+        self.port = port
+        # Needed by other computers for private routes
+        self.token = os.environ.get("TSH_COMMAND_TOKEN") or None
+        self.privateRoutes = set()
+        self.root = root
+        self.loop = None
+        self.clients = set()
+        self.seq = 0
+        self.history = deque(maxlen=historySize)
+        self.routes = {
+            "/program_state": self.ProgramStateRoute,
+            "/metrics": Metrics.Route
+        }
+
+    def run(self):
+        self.loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(self.loop)
+        try:
+            server = self.loop.run_until_complete(
+                asyncio.start_server(self.HandleConnection, self.host, self.port))
+            logger.info(f"Web server listening on {self.host}:{self.port}")
+            self.loop.run_until_complete(server.serve_forever())
+        except Exception as e:
+            logger.error(traceback.format_exc())
+
+    def AddRoute(self, path, handler, private=False):
+        """`handler(method, body)` returns (status, content type, bytes).
+        Private routes only answer requests with an
+        `Authorization: Bearer <TSH_COMMAND_TOKEN>` header, or from this
+        computer when they come without an `Origin` header: browsers send
+        one, so web pages cannot post to them. They are not shared with
+        other origins either."""
+        self.routes[path] = handler
+        if private:
+            self.privateRoutes.add(path)
+            if not WebServer.Loopback(self.host) and self.token is None:
+                logger.warning(
+                    f"{path} only answers this computer, set TSH_COMMAND_TOKEN to allow others")
+
+    def PushChanges(self, changes):
+        """Called by StateManager with the state lock held, so sequence
+        numbers follow the order the changes were saved in."""
+        start = Metrics.Start()
+        self.seq += 1
+        payload = orjson.dumps({
+            "type": "delta",
+            "seq": self.seq,
+            "changes": [
+                {k: c[k] for k in ("op", "path", "value") if k in c}
+                for c in changes
+            ]
+        }, default=plain, option=orjson.OPT_NON_STR_KEYS)
+        self.history.append((self.seq, payload))
+        self.Broadcast(payload, self.seq)
+        Metrics.Stop("tsh_web_emit_seconds", start)
+
+    def emit(self, event, data):
+        self.Broadcast(orjson.dumps(
+            {"type": event, "data": data}, default=plain, option=orjson.OPT_NON_STR_KEYS))
+
+    def Broadcast(self, payload, seq=None):
+        if self.loop is None:
+            return
+
+        def send():
+            for client in list(self.clients):
+                if seq is None:
+                    client.Send(payload)
+                else:
+                    client.SendDelta(seq, payload)
+            Metrics.Count("tsh_web_messages_total", len(self.clients))
+
+        self.loop.call_soon_threadsafe(send)
+
+    def Snapshot(self):
+        return self.Missing()[1][0]
+
+    def Missing(self, since=None):
+        """(seq, payloads) taking a client from `since` to seq: the deltas
+        in between, or a snapshot if they are no longer in the history or
+        `since` is None. Waits for the state lock, so the server loop
+        runs it in an executor, see CatchUp."""
+        StateManager.EnsureLoaded()
+        with StateManager.lock:
+            seq = self.seq
+            if since is not None and (since >= seq or (
+                    len(self.history) > 0 and self.history[0][0] <= since + 1)):
+                return seq, [payload for s, payload in self.history if s > since]
+            # The saved state matches the deltas pushed so far exactly,
+            # writes not saved yet follow as the next delta
+            state = StateManager.lastSavedState
+        return seq, [orjson.dumps({
+            "type": "snapshot",
+            "seq": seq,
+            "state": state
+        }, default=plain, option=orjson.OPT_NON_STR_KEYS)]
+
+    async def CatchUp(self, client, since=None):
+        client.seq = None
+        seq, missing = await self.loop.run_in_executor(None, self.Missing, since)
+        held = client.held
+        client.held = []
+        for payload in missing:
+            client.Send(payload)
+        client.seq = seq
+        for seq, payload in held:
+            client.SendDelta(seq, payload)
+
+    def ProgramStateRoute(self, method, body):
+        return 200, "application/json", self.Snapshot()
+
+    async def HandleConnection(self, reader, writer):
+        try:
+            head = await reader.readuntil(b"\r\n\r\n")
+            lines = head.decode("latin-1").split("\r\n")
+            method, target, _ = lines[0].split(" ", 2)
+            headers = {}
+            for line in lines[1:]:
+                if ":" in line:
+                    name, value = line.split(":", 1)
+                    headers[name.strip().lower()] = value.strip()
+
+            path = unquote(urlsplit(target).path)
+
+            if headers.get("upgrade", "").lower() == "websocket":
+                await self.HandleWebSocket(reader, writer, headers)
+                return
+
+            length = headers.get("content-length", "0")
+            if not length.isdecimal():
+                status, contentType, data = 400, "text/plain", b"Bad Content-Length"
+            elif int(length) > WebServer.maxBodySize:
+                status, contentType, data = 413, "text/plain", b"Request body too large"
+            elif path in self.privateRoutes and not self.Allowed(writer, headers):
+                status, contentType, data = 403, "text/plain", b"Forbidden"
+            elif path in self.routes:
+                body = await reader.readexactly(int(length))
+                # Routes may wait for the state lock, not on this loop
+                status, contentType, data = await self.loop.run_in_executor(
+                    None, self.routes[path], method, body)
+            else:
+                status, contentType, data = self.StaticFile(path)
+
+            cors = "" if path in self.privateRoutes else "Access-Control-Allow-Origin: *\r\n"
+            writer.write(
+                (f"HTTP/1.1 {status} {'OK' if status == 200 else 'Error'}\r\n" +
+                 f"Content-Type: {contentType}\r\n" +
+                 f"Content-Length: {len(data)}\r\n" +
+                 cors +
+                 "Cache-Control: no-cache\r\n" +
+                 "Connection: close\r\n\r\n").encode("latin-1") + data)
+            await writer.drain()
+        except (asyncio.IncompleteReadError, ConnectionError):
+            pass
+        except Exception as e:
+            logger.error(traceback.format_exc())
+        finally:
+            writer.close()
+
+    def Allowed(self, writer, headers):
+        peer = writer.get_extra_info("peername")
+        if peer is not None and WebServer.Loopback(peer[0]) and "origin" not in headers:
+            return True
+        return self.token is not None and hmac.compare_digest(
+            headers.get("authorization", "").encode(), f"Bearer {self.token}".encode())
+
+    def Loopback(host):
+        try:
+            address = ipaddress.ip_address(host)
+        except ValueError:
+            return host == "localhost"
+        if getattr(address, "ipv4_mapped", None) is not None:
+            address = address.ipv4_mapped
+        return address.is_loopback
+
+    def StaticFile(self, path):
+        root = os.path.abspath(self.root)
+        filePath = os.path.abspath(os.path.join(root, path.lstrip("/")))
+
+        if os.path.isdir(filePath):
+            filePath = os.path.join(filePath, "index.html")
+
+        if os.path.commonpath([root, filePath]) != root or not os.path.isfile(filePath):
+            return 404, "text/plain", b"Not found"
+
+        with open(filePath, 'rb') as file:
+            data = file.read()
+        contentType = mimetypes.guess_type(
+            filePath)[0] or "application/octet-stream"
+        return 200, contentType, data
+
+    async def HandleWebSocket(self, reader, writer, headers):
+        accept = base64.b64encode(hashlib.sha1(
+            (headers["sec-websocket-key"] + WEBSOCKET_GUID).encode()).digest()).decode()
+        writer.write(
+            ("HTTP/1.1 101 Switching Protocols\r\n" +
+             "Upgrade: websocket\r\n" +
+             "Connection: Upgrade\r\n" +
+             f"Sec-WebSocket-Accept: {accept}\r\n\r\n").encode("latin-1"))
+
+        client = WebSocketClient(reader, writer)
+        sender = asyncio.ensure_future(client.SendLoop())
+
+        try:
+            self.clients.add(client)
+            await self.CatchUp(client)
+
+            while True:
+                message = await client.Receive()
+                if message is None:
+                    break
+                try:
+                    message = orjson.loads(message)
+                except orjson.JSONDecodeError:
+                    continue
+                if message.get("type") == "resync":
+                    since = message.get("since")
+                    await self.CatchUp(client, since if isinstance(since, int) else None)
+        except (asyncio.IncompleteReadError, ConnectionError):
+            pass
+        finally:
+            self.clients.discard(client)
+            client.Close()
+            await sender
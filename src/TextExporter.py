@@ -0,0 +1,181 @@
+import os
+import threading
+import traceback
+from loguru import logger
+from .ImageDownloader import ImageDownloader
+from .AssetStore import AssetStore
+from .Metrics import Metrics
+from .Helpers.TSHDictHelper import mapping_types
+
+
+class TextExporter:
+    """Mirrors the state into ./out as one file per leaf for OBS sources.
+
+    Dicts become folders, "./" paths are linked from the AssetStore, http
+    png/jpg links are downloaded and everything else is written to a .txt
+    file. Export()
+    takes the change list StateManager produces and only touches the files
+    under the changed paths. Files whose content did not change are not
+    rewritten, and folders already known to exist are not checked again.
+    """
+
+    def __init__(self, root="./out", downloader=None):
+        self.root = root
+        self.knownDirs = set()
+        # file path -> text last written there
+        self.written = {}
+
+        if downloader is None:
+            downloader = ImageDownloader(cacheDir=f"{root}/.cache/images")
+        self.downloader = downloader
+        # output file -> url it should end up holding
+        self.pendingImages = {}
+        self.imageLock = threading.Lock()
+        self.assets = AssetStore(f"{root}/.assets")
+
+    def Export(self, changes):
+        for change in changes:
+            path = TextExporter.FilePath(change["path"])
+            try:
+                if change["op"] == "remove":
+                    self.RemoveFiles(path, change["old"])
+                elif change["op"] == "add":
+                    self.CreateFiles(path, change["value"])
+                else:
+                    self.ReplaceFiles(path, change["old"], change["value"])
+            except Exception as e:
+                logger.error(traceback.format_exc())
+
+    def FilePath(key):
+        if key == "":
+            return ""
+        return "/".join(k.replace("/", "_") for k in key.split("."))
+
+    def Join(path, key):
+        key = str(key).replace("/", "_")
+        return f"{path}/{key}" if path != "" else key
+
+    def OutputFile(self, path, value):
+        """The file a leaf value ends up in."""
+        if type(value) == str and value.startswith("./"):
+            return f"{self.root}/{path}." + value.rsplit(".", 1)[-1]
+        if TextExporter.IsImageUrl(value):
+            # jpgs are converted to png after downloading
+            if self.downloader.convert:
+                return f"{self.root}/{path}.png"
+            return f"{self.root}/{path}." + value.rsplit(".", 1)[-1]
+        return f"{self.root}/{path}.txt"
+
+    def IsImageUrl(value):
+        return type(value) == str and value.startswith("http") and (value.endswith(".png") or value.endswith(".jpg"))
+
+    def EnsureDir(self, directory):
+        if directory not in self.knownDirs:
+            os.makedirs(directory, exist_ok=True)
+            self.knownDirs.add(directory)
+
+    def ReplaceFiles(self, path, old, new):
+        if old is new:
+            return
+
+        if isinstance(old, mapping_types) and isinstance(new, mapping_types):
+            for k, i in old.items():
+                if k not in new:
+                    self.RemoveFiles(TextExporter.Join(path, k), i)
+            for k, i in new.items():
+                if k in old:
+                    self.ReplaceFiles(TextExporter.Join(path, k), old[k], i)
+                else:
+                    self.CreateFiles(TextExporter.Join(path, k), i)
+            return
+
+        if isinstance(old, mapping_types) or isinstance(new, mapping_types) or self.OutputFile(path, old) != self.OutputFile(path, new):
+            self.RemoveFiles(path, old)
+        self.CreateFiles(path, new)
+
+    def CreateFiles(self, path, di):
+        if isinstance(di, mapping_types):
+            self.EnsureDir(f"{self.root}/{path}")
+            for k, i in di.items():
+                self.CreateFiles(TextExporter.Join(path, k), i)
+            return
+
+        self.EnsureDir(os.path.dirname(f"{self.root}/{path}"))
+        outputFile = self.OutputFile(path, di)
+
+        if type(di) == str and di.startswith("./"):
+            self.LinkFile(di, outputFile)
+        elif TextExporter.IsImageUrl(di):
+            self.DownloadImage(di, outputFile)
+        else:
+            content = str(di)
+            if self.written.get(outputFile) == content:
+                Metrics.Count("tsh_export_files_total", result="unchanged")
+                return
+            start = Metrics.Start()
+            with open(outputFile, 'w', encoding='utf-8') as file:
+                file.write(content)
+            self.written[outputFile] = content
+            Metrics.Stop("tsh_export_write_seconds", start)
+            Metrics.Count("tsh_export_files_total", result="written")
+
+    def RemoveFiles(self, path, di):
+        if isinstance(di, mapping_types):
+            for k, i in di.items():
+                self.RemoveFiles(TextExporter.Join(path, k), i)
+
+            directory = f"{self.root}/{path}"
+            self.knownDirs = {
+                d for d in self.knownDirs
+                if d != directory and not d.startswith(directory + "/")
+            }
+            try:
+                # Only drop the folder once nothing else lives in it
+                os.rmdir(directory)
+            except OSError:
+                pass
+            return
+
+        outputFile = self.OutputFile(path, di)
+        self.written.pop(outputFile, None)
+
+        if type(di) == str and di.startswith("./"):
+            try:
+                self.assets.Unlink(outputFile)
+            except Exception as e:
+                logger.error(traceback.format_exc())
+            return
+
+        with self.imageLock:
+            self.pendingImages.pop(outputFile, None)
+            try:
+                if os.path.exists(outputFile):
+                    os.remove(outputFile)
+            except Exception as e:
+                logger.error(traceback.format_exc())
+
+    def LinkFile(self, source, outputFile):
+        if os.path.exists(source):
+            try:
+                self.assets.Link(source, outputFile)
+            except Exception as e:
+                logger.error(traceback.format_exc())
+
+    def DownloadImage(self, url, outputFile):
+        with self.imageLock:
+            self.pendingImages[outputFile] = url
+        self.downloader.Fetch(url).add_done_callback(
+            lambda future: self.PlaceImage(future, url, outputFile))
+
+    def PlaceImage(self, future, url, outputFile):
+        # Runs on a download worker, the value may have changed meanwhile
+        try:
+            cachedFile = future.result()
+            with self.imageLock:
+                if self.pendingImages.get(outputFile) != url:
+                    return
+                del self.pendingImages[outputFile]
+                if cachedFile is not None:
+                    ImageDownloader.Place(cachedFile, outputFile)
+        except Exception as e:
+            logger.error(traceback.format_exc())
@@ -1 +1,40 @@
-from .RecipeTracker import *
+import importlib
+
+# Submodules are only imported when one of their names is first used, so
+# importing src (or src.StateManager for headless tools) does not pull in
+# Qt. Nothing here touches the disk, entry points call bootstrap() or
+# create_app() themselves. The state is imported from its own module,
+# `from src.StateManager import StateManager`, as everywhere else.
+lazy = {
+    "App": ".RecipeTracker",
+    "Window": ".RecipeTracker",
+    "WindowSignals": ".RecipeTracker",
+    "create_app": ".RecipeTracker",
+    "bootstrap": ".Bootstrap",
+    "WebServer": ".TSHWebServer",
+    "RecipeEngine": ".RecipeEngine",
+    "RecipeIndex": ".RecipeIndex",
+    "RecipeImporter": ".RecipeImporter",
+    "Metrics": ".Metrics",
+    "RecipeChecklistWidget": ".CheckboxWidget",
+    "RecipeEditorWidget": ".DataAddWidget",
+    "RecipePicker": ".RecipePicker",
+    "LayoutMigrator": ".LayoutMigrator",
+    "TSHAssetDownloader": ".TSHAssetDownloader",
+}
+
+__all__ = list(lazy)
+
+
+def __getattr__(name):
+    if name not in lazy:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    value = getattr(importlib.import_module(lazy[name], __name__), name)
+    # App only exists once create_app() ran, so it is looked up every time
+    if name != "App":
+        globals()[name] = value
+    return value
+
+
+def __dir__():
+    return sorted(list(globals()) + __all__)